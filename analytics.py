@@ -0,0 +1,353 @@
+"""
+Columnar analytics snapshot for Training Center CRM
+
+Funnel conversion, time-to-convert and cohort retention are answered from an
+in-memory snapshot instead of ORM loops: every lead and every student is one
+position in a set of parallel NumPy arrays (dates as day or second numbers,
+lead source, course and consultant dictionary-encoded as small integer
+codes).  The per-lead status history and per-student attendance are reduced
+to a few numbers in SQL while the snapshot is built, so a query is a handful
+of vectorized mask, bincount and sort operations; at a million leads that is
+well under 100 ms, whatever the filters.
+
+Each worker builds its snapshot on first use and rebuilds it in the background
+once it is SNAPSHOT_REFRESH_SECONDS old, serving the previous one meanwhile
+(see report_cache.py); a snapshot costs roughly 40 bytes per lead and 20 per
+student.
+"""
+from array import array
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import and_, case, func, type_coerce
+
+from app import db
+from models import AttendanceRecord, Course, Lead, LeadStatusChange, Student, User
+from report_cache import ReportCache
+
+FUNNEL_STAGES = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted']
+RETENTION_MONTHS = 12  # Months after enrollment reported per cohort
+GROUP_BY_FIELDS = ('lead_source', 'course', 'consultant')
+
+SNAPSHOT_REFRESH_SECONDS = 300
+SNAPSHOT_STALE_SECONDS = 3600
+SNAPSHOT_BATCH_SIZE = 50000  # Rows streamed per fetch while building
+
+EPOCH = datetime(1970, 1, 1)
+NONE_LABEL = '(none)'
+
+
+class AnalyticsError(Exception):
+    """Analytics request that cannot be answered; the message is safe to show"""
+
+
+class _Encoder:
+    """Dense integer codes for the values of one dimension; code 0 is "not set\""""
+
+    def __init__(self):
+        self.codes = {None: 0}
+        self.keys = [None]
+
+    def code(self, key):
+        if key in (None, '', 0):
+            return 0
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.keys)
+            self.keys.append(key)
+        return code
+
+
+def _seconds(value):
+    return int((value - EPOCH).total_seconds())
+
+
+def _day(value):
+    return (value - EPOCH.date()).days
+
+
+def _month(value):
+    return value.year * 12 + value.month - 1
+
+
+class AnalyticsSnapshot:
+    """Leads and students as parallel NumPy arrays, with the labels of their encoded dimensions"""
+
+    def __init__(self, leads, students, encoders, labels):
+        self.leads = leads
+        self.students = students
+        self.encoders = encoders
+        self.labels = labels
+        self.built_at = datetime.utcnow()
+
+    @classmethod
+    def build(cls):
+        encoders = {field: _Encoder() for field in GROUP_BY_FIELDS}
+        leads = cls._read_leads(encoders)
+        students = cls._read_students(encoders)
+        labels = {
+            'lead_source': {key: key for key in encoders['lead_source'].keys if key},
+            'course': dict(db.session.query(Course.id, Course.name)),
+            'consultant': dict(db.session.query(User.id, User.username)),
+        }
+        return cls(leads, students, encoders, labels)
+
+    @staticmethod
+    def _stream(query):
+        return query.execution_options(yield_per=SNAPSHOT_BATCH_SIZE)
+
+    @classmethod
+    def _read_leads(cls, encoders):
+        stage = case(*[(LeadStatusChange.to_status == status, index) for index, status in enumerate(FUNNEL_STAGES)],
+                     else_=-1)
+        # A real move to Converted; history backfilled at migration time has no from_status
+        converted = case((and_(LeadStatusChange.to_status == 'Converted', LeadStatusChange.from_status.isnot(None)),
+                          LeadStatusChange.changed_at))
+        history = db.session.query(
+            LeadStatusChange.lead_id.label('lead_id'),
+            func.max(stage).label('max_stage'),
+            type_coerce(func.min(converted), db.DateTime).label('converted_at')
+        ).group_by(LeadStatusChange.lead_id).subquery()
+        enrolled = db.session.query(
+            Student.lead_id.label('lead_id'),
+            type_coerce(func.min(Student.enrollment_date), db.Date).label('enrolled_on')
+        ).filter(Student.lead_id.isnot(None)).group_by(Student.lead_id).subquery()
+
+        query = db.session.query(
+            Lead.created_at, Lead.lead_source, Lead.course_interest_id, Lead.added_by, Lead.status,
+            history.c.max_stage, history.c.converted_at, enrolled.c.enrolled_on
+        ).outerjoin(history, history.c.lead_id == Lead.id).outerjoin(enrolled, enrolled.c.lead_id == Lead.id) \
+            .filter(Lead.created_at.isnot(None))
+
+        columns = {name: array('q') for name in ('created_at', 'converted_at')}
+        columns.update({name: array('l') for name in ('created_day', 'lead_source', 'course', 'consultant')})
+        columns.update({name: array('b') for name in ('stage', 'lost')})
+        stages = {status: index for index, status in enumerate(FUNNEL_STAGES)}
+        for created_at, lead_source, course_id, added_by, status, max_stage, converted_at, enrolled_on \
+                in cls._stream(query):
+            created = _seconds(created_at)
+            if converted_at is None and enrolled_on is not None:
+                converted_at = datetime.combine(enrolled_on, datetime.min.time())
+            columns['created_at'].append(created)
+            columns['created_day'].append(created // 86400)
+            columns['converted_at'].append(_seconds(converted_at) if converted_at is not None else -1)
+            columns['lead_source'].append(encoders['lead_source'].code(lead_source))
+            columns['course'].append(encoders['course'].code(course_id))
+            columns['consultant'].append(encoders['consultant'].code(added_by))
+            columns['stage'].append(max(stages.get(status, -1), -1 if max_stage is None else int(max_stage)))
+            columns['lost'].append(status == 'Lost')
+
+        leads = {
+            'created_at': np.frombuffer(columns['created_at'], dtype=np.int64).copy(),
+            'converted_at': np.frombuffer(columns['converted_at'], dtype=np.int64).copy(),
+            'created_day': np.asarray(columns['created_day'], dtype=np.int32),
+            'lead_source': np.asarray(columns['lead_source'], dtype=np.int32),
+            'course': np.asarray(columns['course'], dtype=np.int32),
+            'consultant': np.asarray(columns['consultant'], dtype=np.int32),
+            'stage': np.asarray(columns['stage'], dtype=np.int8),
+            'lost': np.asarray(columns['lost'], dtype=np.bool_),
+        }
+        return leads
+
+    @classmethod
+    def _read_students(cls, encoders):
+        attendance = db.session.query(
+            AttendanceRecord.student_id.label('student_id'),
+            type_coerce(func.max(AttendanceRecord.attendance_date), db.Date).label('last_attended')
+        ).filter(AttendanceRecord.status.in_(('Present', 'Late'))).group_by(AttendanceRecord.student_id).subquery()
+
+        query = db.session.query(
+            Student.enrollment_date, Student.course_id, Lead.lead_source, Lead.added_by, attendance.c.last_attended
+        ).outerjoin(Lead, Student.lead_id == Lead.id).outerjoin(attendance, attendance.c.student_id == Student.id) \
+            .filter(Student.enrollment_date.isnot(None))
+
+        columns = {name: array('l') for name in ('enrolled_day', 'cohort', 'last_active', 'lead_source', 'course',
+                                                 'consultant')}
+        for enrollment_date, course_id, lead_source, added_by, last_attended in cls._stream(query):
+            cohort = _month(enrollment_date)
+            columns['enrolled_day'].append(_day(enrollment_date))
+            columns['cohort'].append(cohort)
+            # Months after the enrollment month in which the student last attended; -1 if never
+            columns['last_active'].append(_month(last_attended) - cohort if last_attended else -1)
+            columns['lead_source'].append(encoders['lead_source'].code(lead_source))
+            columns['course'].append(encoders['course'].code(course_id))
+            columns['consultant'].append(encoders['consultant'].code(added_by))
+
+        return {name: np.asarray(values, dtype=np.int32) for name, values in columns.items()}
+
+    # Queries
+
+    def _mask(self, rows, day_column, filters):
+        mask = np.ones(len(rows[day_column]), dtype=np.bool_)
+        if filters.get('date_from'):
+            mask &= rows[day_column] >= _day(filters['date_from'])
+        if filters.get('date_to'):
+            mask &= rows[day_column] <= _day(filters['date_to'])
+        for field, key in (('lead_source', filters.get('lead_source')), ('course', filters.get('course_id')),
+                           ('consultant', filters.get('consultant_id'))):
+            if key is not None:
+                code = self.encoders[field].codes.get(key)
+                if code is None:
+                    mask[:] = False
+                else:
+                    mask &= rows[field] == code
+        return mask
+
+    def _groups(self, rows, group_by, mask):
+        """(group code per selected row, number of groups)"""
+        if group_by is None:
+            return np.zeros(int(mask.sum()), dtype=np.int64), 1
+        return rows[group_by][mask].astype(np.int64), len(self.encoders[group_by].keys)
+
+    def _label(self, group_by, code):
+        if group_by is None:
+            return None, 'All'
+        key = self.encoders[group_by].keys[code]
+        if key is None:
+            return None, NONE_LABEL
+        return key, self.labels[group_by].get(key, str(key))
+
+    def funnel(self, group_by=None, **filters):
+        """Leads that reached each funnel stage (at any time), and leads now lost, per group"""
+        mask = self._mask(self.leads, 'created_day', filters)
+        groups, group_count = self._groups(self.leads, group_by, mask)
+        stage = self.leads['stage'][mask].astype(np.int64)
+        stage_count = len(FUNNEL_STAGES)
+
+        totals = np.bincount(groups, minlength=group_count)
+        staged = stage >= 0
+        at_stage = np.bincount(groups[staged] * stage_count + stage[staged],
+                               minlength=group_count * stage_count).reshape(group_count, stage_count)
+        # A lead at stage k also passed every earlier stage
+        reached = at_stage[:, ::-1].cumsum(axis=1)[:, ::-1]
+        lost = np.bincount(groups[self.leads['lost'][mask]], minlength=group_count)
+
+        results = []
+        for code in np.flatnonzero(totals):
+            key, label = self._label(group_by, code)
+            results.append({
+                'key': key, 'label': label, 'leads': int(totals[code]), 'lost': int(lost[code]),
+                'stages': {status: int(reached[code, index]) for index, status in enumerate(FUNNEL_STAGES)},
+                'conversion_rate': round(float(reached[code, -1]) / float(totals[code]) * 100, 1),
+            })
+        return sorted(results, key=lambda group: -group['leads'])
+
+    def time_to_convert(self, group_by=None, **filters):
+        """Days from lead creation to conversion (count, mean, median, 90th percentile) per group"""
+        mask = self._mask(self.leads, 'created_day', filters)
+        groups, group_count = self._groups(self.leads, group_by, mask)
+        converted_at = self.leads['converted_at'][mask]
+        done = converted_at >= 0
+        days = np.maximum(converted_at[done] - self.leads['created_at'][mask][done], 0) / 86400.0
+        groups = groups[done]
+
+        order = np.lexsort((days, groups))
+        days, groups = days[order], groups[order]
+        bounds = np.searchsorted(groups, np.arange(group_count + 1))
+
+        results = []
+        for code in range(group_count):
+            values = days[bounds[code]:bounds[code + 1]]
+            if not len(values):
+                continue
+            key, label = self._label(group_by, code)
+            median, p90 = np.percentile(values, [50, 90])
+            results.append({
+                'key': key, 'label': label, 'converted': int(len(values)),
+                'mean_days': round(float(values.mean()), 1), 'median_days': round(float(median), 1),
+                'p90_days': round(float(p90), 1),
+            })
+        return sorted(results, key=lambda group: -group['converted'])
+
+    def cohorts(self, group_by=None, **filters):
+        """
+        Monthly enrollment cohorts per group: for each month after enrollment, the
+        share of the cohort that attended in that month or later (None until the
+        month has started)
+        """
+        mask = self._mask(self.students, 'enrolled_day', filters)
+        groups, group_count = self._groups(self.students, group_by, mask)
+        cohort = self.students['cohort'][mask]
+        last_active = self.students['last_active'][mask]
+
+        months = np.unique(cohort)
+        cohort_codes = np.searchsorted(months, cohort)
+        cells = groups * len(months) + cohort_codes
+        cell_count = group_count * len(months)
+        sizes = np.bincount(cells, minlength=cell_count)
+        retained = np.stack([np.bincount(cells[last_active >= offset], minlength=cell_count)
+                             for offset in range(RETENTION_MONTHS + 1)], axis=1) if cell_count else None
+
+        this_month = _month(date.today())
+        results = {}
+        for cell in np.flatnonzero(sizes):
+            code, month_code = divmod(int(cell), len(months))
+            month = int(months[month_code])
+            group = results.get(code)
+            if group is None:
+                key, label = self._label(group_by, code)
+                group = results[code] = {'key': key, 'label': label, 'students': 0, 'cohorts': []}
+            group['students'] += int(sizes[cell])
+            group['cohorts'].append({
+                'month': f"{month // 12:04d}-{month % 12 + 1:02d}",
+                'students': int(sizes[cell]),
+                'retention': [round(float(retained[cell, offset]) / float(sizes[cell]) * 100, 1)
+                              if month + offset <= this_month else None
+                              for offset in range(RETENTION_MONTHS + 1)],
+            })
+        return sorted(results.values(), key=lambda group: -group['students'])
+
+    def summary(self):
+        return {'built_at': self.built_at.isoformat(), 'leads': int(len(self.leads['created_at'])),
+                'students': int(len(self.students['cohort']))}
+
+
+ANALYTICS_REPORTS = {
+    'funnel': AnalyticsSnapshot.funnel,
+    'time-to-convert': AnalyticsSnapshot.time_to_convert,
+    'cohorts': AnalyticsSnapshot.cohorts,
+}
+
+snapshot_cache = ReportCache(fresh_for=SNAPSHOT_REFRESH_SECONDS, stale_for=SNAPSHOT_STALE_SECONDS, max_entries=1)
+
+
+def current_snapshot():
+    """This worker's snapshot, built on first use and refreshed in the background when old"""
+    return snapshot_cache.get(('analytics_snapshot', None, None, None), AnalyticsSnapshot.build)
+
+
+def parse_filters(args):
+    """
+    Report filters from query string arguments
+
+    Args:
+        args: request.args with optional group_by, date_from, date_to (YYYY-MM-DD),
+            lead_source, course_id and consultant_id
+
+    Returns:
+        tuple: (group_by or None, filters dict)
+    """
+    group_by = args.get('group_by') or None
+    if group_by is not None and group_by not in GROUP_BY_FIELDS:
+        raise AnalyticsError(f"group_by must be one of {', '.join(GROUP_BY_FIELDS)}")
+    filters = {}
+    try:
+        for name in ('date_from', 'date_to'):
+            if args.get(name):
+                filters[name] = date.fromisoformat(args[name])
+        for name in ('course_id', 'consultant_id'):
+            if args.get(name):
+                filters[name] = int(args[name])
+    except ValueError:
+        raise AnalyticsError('Dates must be YYYY-MM-DD and ids must be numbers.')
+    if args.get('lead_source'):
+        filters['lead_source'] = args['lead_source']
+    return group_by, filters
+
+
+def run_report(report, group_by=None, **filters):
+    """Run one of ANALYTICS_REPORTS; returns (groups, snapshot summary)"""
+    if report not in ANALYTICS_REPORTS:
+        raise AnalyticsError(f'Unknown analytics report: {report}')
+    snapshot = current_snapshot()
+    return ANALYTICS_REPORTS[report](snapshot, group_by, **filters), snapshot.summary()
@@ -25,20 +25,33 @@ def create_app():
     app.secret_key = os.environ.get("SESSION_SECRET", "training-center-crm-secret-key-2024-secure-deployment")
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
     
-    # MySQL database configuration
-    app.config["SQLALCHEMY_DATABASE_URI"] = "mysql+pymysql://root@localhost:3306/leads"
+    # MySQL database configuration (DATABASE_URL overrides it, e.g. for check_query_budgets.py)
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "mysql+pymysql://root@localhost:3306/leads")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
         "pool_recycle": 300,
         "pool_pre_ping": True,
     }
     
-    # Mail configuration
-    app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-    app.config['MAIL_PORT'] = 587
-    app.config['MAIL_USE_TLS'] = True
+    # Mail configuration; MAIL_SERVER, MAIL_PORT and MAIL_USE_TLS can point at smtp_sink.py
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
     app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', '')
     app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', '')
+    app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER') or app.config['MAIL_USERNAME'] or None
+    
+    # Payment provider credentials; the *_URL settings can point at payment_provider_stub.py
+    # SMS and WhatsApp gateways used by bulk messaging (see message_channels.py)
+    for setting in ('VAULT_API_KEY', 'TABBY_API_KEY', 'TAMARA_API_TOKEN',
+                    'VAULT_WEBHOOK_SECRET', 'TABBY_WEBHOOK_SECRET', 'TAMARA_WEBHOOK_SECRET',
+                    'VAULT_API_URL', 'TABBY_API_URL', 'TAMARA_API_URL', 'TAMARA_ORDERS_URL',
+                    'SMS_API_URL', 'SMS_API_TOKEN', 'WHATSAPP_API_URL', 'WHATSAPP_API_TOKEN'):
+        if os.environ.get(setting):
+            app.config[setting] = os.environ[setting]
+    
+    # Live pipeline streams per worker process; keep it well below the worker's threads (see events.py)
+    app.config['EVENT_MAX_STREAMS'] = int(os.environ.get('EVENT_MAX_STREAMS', 8))
     
     # Initialize extensions
     db.init_app(app)
@@ -59,6 +72,10 @@ def create_app():
         # Import models and routes
         import models
         import routes
+        import query_stats
+        
+        # Count SQL statements per request
+        query_stats.init_app(app)
         
         # Register blueprints
         app.register_blueprint(routes.main)
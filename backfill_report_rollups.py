@@ -0,0 +1,32 @@
+"""
+Rebuild the daily report rollups from the lead and student tables
+
+The rollups are maintained by Lead and Student events and by the bulk
+import/bulk action code; anything that changes leads or students behind
+their back (manual SQL, restores) makes them drift.  Rebuild everything, or
+only a range of days:
+
+    python backfill_report_rollups.py
+    python backfill_report_rollups.py --from 2026-01-01 --to 2026-03-31
+"""
+import argparse
+from datetime import date
+
+from app import app
+from report_rollups import rebuild_report_rollups
+
+
+def backfill_report_rollups(day_from=None, day_to=None):
+    with app.app_context():
+        lead_rows, enrollment_rows = rebuild_report_rollups(day_from, day_to)
+        print(f"✓ Lead rollup rebuilt ({lead_rows} rows)")
+        print(f"✓ Enrollment rollup rebuilt ({enrollment_rows} rows)")
+        return lead_rows, enrollment_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--from', dest='day_from', type=date.fromisoformat, help='First day (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='day_to', type=date.fromisoformat, help='Last day (YYYY-MM-DD)')
+    args = parser.parse_args()
+    backfill_report_rollups(args.day_from, args.day_to)
@@ -0,0 +1,50 @@
+"""
+Background jobs for Training Center CRM
+
+Slow work runs on a small thread pool inside an application context, so
+the request that starts it can return immediately.  Jobs record their own
+progress in the database, which lets any worker process answer a progress
+poll.  Jobs that can run for many minutes (lead imports, bulk message
+sends) go to a pool of their own with submit_long(), so they never hold up
+the short jobs: webhook application, link creation, email sending and
+report refreshes.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app import db
+
+MAX_WORKERS = 4
+LONG_JOB_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='crm-background')
+_long_executor = ThreadPoolExecutor(max_workers=LONG_JOB_WORKERS, thread_name_prefix='crm-long-jobs')
+
+
+def submit(func, *args, **kwargs):
+    """Run func(*args, **kwargs) in the background with an application context; returns a Future"""
+    return _submit(_executor, func, args, kwargs)
+
+
+def submit_long(func, *args, **kwargs):
+    """Like submit(), on the separate pool for jobs that run for minutes"""
+    return _submit(_long_executor, func, args, kwargs)
+
+
+def _submit(executor, func, args, kwargs):
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                logging.exception(f"Background job {func.__name__} failed")
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    return executor.submit(run)
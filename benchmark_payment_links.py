@@ -0,0 +1,195 @@
+"""
+Payment link creation benchmark
+
+Serves the CRM over HTTP against a throwaway SQLite database and an
+in-process payment_provider_stub.py, has --concurrency logged-in clients
+post --links payment link forms to /payments/create_link between them, and
+reports:
+
+- request throughput and p50/p95/p99/max latency of /payments/create_link
+- how long the background jobs took to move every link out of "creating"
+- with --settle-after, how long the stub's webhooks took to settle every link
+
+It exits non-zero when a link was not created, or when p99 exceeds
+--max-p99-ms.  The stub's latency, error and webhook options are all
+available, e.g.:
+
+    python benchmark_payment_links.py
+    python benchmark_payment_links.py --links 2000 --concurrency 32 --latency 0.3 --failure-rate 0.05
+    python benchmark_payment_links.py --webhook-secret s3cret --settle-after 1 --webhook-copies 2
+
+Set BENCHMARK_DATABASE_URL to run against an empty scratch MySQL database instead.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DATABASE_PATH = os.path.join(tempfile.gettempdir(), 'crm_payment_benchmark.db')
+os.environ['DATABASE_URL'] = os.environ.get('BENCHMARK_DATABASE_URL') or f'sqlite:///{DATABASE_PATH}'
+
+from sqlalchemy import func  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+from werkzeug.serving import make_server as make_app_server  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import PaymentEvent, PaymentLink, PaymentProvider, User  # noqa: E402
+from payment_provider_stub import add_simulation_arguments, simulation_settings, start_stub, stub_config  # noqa: E402
+from utils import requests  # noqa: E402
+
+PASSWORD = 'benchmark'
+SETTLE_TIMEOUT = 120  # Seconds to wait for the background jobs and webhooks before giving up
+
+
+def setup_database():
+    """Tables, a user to log in as and the three providers; returns the provider ids"""
+    if os.path.exists(DATABASE_PATH):
+        os.remove(DATABASE_PATH)
+    db.create_all()
+    db.session.add(User(username='benchmark', email='benchmark@example.com', role='admin', active=True,
+                        password_hash=generate_password_hash(PASSWORD), can_view_all_leads=True))
+    providers = [PaymentProvider(name=name, is_active=True) for name in ('Vault', 'Tabby', 'Tamara')]
+    db.session.add_all(providers)
+    db.session.commit()
+    return [provider.id for provider in providers]
+
+
+def start_app_server():
+    """Serve the CRM on a free local port in a daemon thread; returns (server, base URL)"""
+    server = make_app_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def percentile(sorted_values, share):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(share * len(sorted_values))) - 1))]
+
+
+def post_links(base_url, provider_ids, links, concurrency):
+    """
+    Post `links` payment link forms from `concurrency` clients
+
+    Returns:
+        tuple: (seconds taken, request latencies in seconds, requests that did not redirect back)
+    """
+    latencies = []
+    errors = []
+    remaining = iter(range(links))
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        session.post(f"{base_url}/login", data={'username': 'benchmark', 'password': PASSWORD})
+        while True:
+            with lock:
+                number = next(remaining, None)
+            if number is None:
+                return
+            started = time.perf_counter()
+            response = session.post(f"{base_url}/payments/create_link", allow_redirects=False, data={
+                'lead_id': 0, 'student_id': 0, 'provider_id': provider_ids[number % len(provider_ids)],
+                'amount': 100, 'currency': 'AED', 'description': f'Benchmark {number}', 'expires_in_days': 7,
+            })
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 302 or '/payments' not in response.headers.get('Location', ''):
+                    errors.append(response.status_code)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(client) for _ in range(concurrency)]:
+            future.result()
+    return time.perf_counter() - started, sorted(latencies), errors
+
+
+def link_statuses():
+    counts = dict(db.session.query(PaymentLink.status, func.count(PaymentLink.id)).group_by(PaymentLink.status).all())
+    db.session.commit()
+    return counts
+
+
+def wait_for(statuses_done, since):
+    """Seconds from `since` until no link is in one of the other statuses, or None on timeout"""
+    while time.perf_counter() - since < SETTLE_TIMEOUT:
+        if set(link_statuses()) <= set(statuses_done):
+            return time.perf_counter() - since
+        time.sleep(0.1)
+    return None
+
+
+def benchmark_payment_links(args):
+    stub, stub_url = start_stub(**simulation_settings(args))
+    app.config.update(WTF_CSRF_ENABLED=False, **stub_config(stub_url, args.webhook_secret))
+    ok = True
+
+    with app.app_context():
+        provider_ids = setup_database()
+        server, base_url = start_app_server()
+        print(f"Posting {args.links} payment links from {args.concurrency} clients "
+              f"(provider latency {args.latency * 1000:.0f}ms, failure rate {args.failure_rate:.0%})")
+
+        started = time.perf_counter()
+        elapsed, latencies, errors = post_links(base_url, provider_ids, args.links, args.concurrency)
+        p99 = percentile(latencies, 0.99) * 1000
+        print(f"✓ /payments/create_link: {len(latencies) / elapsed:.1f} requests/s over {elapsed:.1f}s")
+        print(f"  latency p50 {percentile(latencies, 0.50) * 1000:.1f}ms, p95 {percentile(latencies, 0.95) * 1000:.1f}ms, "
+              f"p99 {p99:.1f}ms, max {latencies[-1] * 1000 if latencies else 0:.1f}ms")
+        if errors:
+            ok = False
+            print(f"✗ {len(errors)} requests did not redirect back to the payments page")
+        if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+            ok = False
+            print(f"✗ p99 {p99:.1f}ms exceeds --max-p99-ms {args.max_p99_ms:.1f}ms")
+
+        created = wait_for({'pending', 'failed', 'paid', 'expired', 'cancelled'}, started)
+        statuses = link_statuses()
+        if sum(statuses.values()) != args.links:
+            ok = False
+            print(f"✗ {sum(statuses.values())} of {args.links} links were saved")
+        if created is None:
+            ok = False
+            print(f"✗ Links still being created after {SETTLE_TIMEOUT}s: {statuses}")
+        else:
+            print(f"✓ All links left \"creating\" {created:.1f}s after the first request "
+                  f"({args.links / created:.1f} links/s end to end): {statuses}")
+
+        if args.webhook_secret and args.settle_after is not None:
+            settled = wait_for({'paid', 'failed', 'expired', 'cancelled'}, started)
+            statuses = link_statuses()
+            events = PaymentEvent.query.count()
+            db.session.commit()
+            if settled is None:
+                ok = False
+                print(f"✗ Links still unsettled after {SETTLE_TIMEOUT}s: {statuses}")
+            else:
+                print(f"✓ Webhooks settled every link {settled:.1f}s after the first request: {statuses}")
+            print(f"  {stub.state.stats['webhooks_delivered']} webhooks delivered "
+                  f"({stub.state.stats['webhooks_failed']} failed), {events} events stored")
+
+        print(f"  stub: {stub.state.requests} provider calls, {dict(stub.state.stats)}")
+        server.shutdown()
+        db.session.remove()
+    stub.shutdown()
+    if os.path.exists(DATABASE_PATH):
+        os.remove(DATABASE_PATH)
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--links', type=int, default=500, help='Payment links to create')
+    parser.add_argument('--concurrency', type=int, default=16, help='Clients posting at the same time')
+    parser.add_argument('--max-p99-ms', type=float, help='Fail when the p99 request latency exceeds this')
+    add_simulation_arguments(parser)
+    args = parser.parse_args()
+    if requests is None:
+        print("✗ The requests library is required (pip install requests)")
+        sys.exit(1)
+    sys.exit(0 if benchmark_payment_links(args) else 1)
@@ -0,0 +1,181 @@
+"""
+Set-based bulk lead operations for Training Center CRM
+
+Every action is applied BULK_CHUNK_SIZE leads at a time with a fixed number
+of statements per chunk, however many leads are selected:
+
+    1. SELECT the ids the user may change (role scoping applied in SQL)
+    2. UPDATE lead ... WHERE id IN (...)  /  DELETE ... WHERE id IN (...)
+    3. INSERT the LeadInteraction audit rows with one executemany
+
+The whole request runs in one transaction.  These statements bypass the ORM
+events, so status changes and deletes adjust the pipeline counters and the
+daily report rollup, status changes are added to the lead status history,
+deletes clean up the lead's phone_key rows and status history, and the
+leads change version is bumped and a pipeline_changed event recorded per
+chunk, explicitly.
+"""
+from datetime import datetime
+
+from app import db
+from models import (ChangeVersion, Lead, LeadDailyRollup, LeadEvent, LeadInteraction, LeadQuote, LeadStatusChange,
+                    LEADS_VERSION, Meeting, PaymentLink, PhoneKey, PIPELINE_STATUSES, PipelineCounter, Setting,
+                    Student, User)
+
+BULK_CHUNK_SIZE = 1000
+MAX_BULK_LEADS = 50000
+
+FOLLOWUP_TYPES = ['Call', 'Email', 'WhatsApp', 'Meeting', 'SMS']
+FOLLOWUP_PRIORITIES = ['Low', 'Medium', 'High', 'Urgent']
+
+# Actions only admins may run; the others are open to anyone for the leads they can see
+ADMIN_ACTIONS = ('assign', 'delete')
+
+
+class BulkActionError(ValueError):
+    """The bulk action request is invalid"""
+
+
+def parse_lead_ids(raw):
+    """Parse a list (or comma separated string) of lead ids into sorted unique ints"""
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    try:
+        lead_ids = sorted({int(str(lead_id).strip()) for lead_id in raw or [] if str(lead_id).strip()})
+    except (TypeError, ValueError):
+        raise BulkActionError('Lead ids must be numbers.')
+    if not lead_ids:
+        raise BulkActionError('No leads selected.')
+    if len(lead_ids) > MAX_BULK_LEADS:
+        raise BulkActionError(f'At most {MAX_BULK_LEADS:,} leads can be changed at once.')
+    return lead_ids
+
+
+def _assign_changes(values):
+    consultant = User.query.filter_by(id=values.get('assigned_to'), active=True).first() \
+        if str(values.get('assigned_to', '')).isdigit() else None
+    if consultant is None:
+        raise BulkActionError('Please choose an active user to assign the leads to.')
+    return {'assigned_to': consultant.id}, 'Assignment', f'Assigned to {consultant.username} (bulk update)'
+
+
+def _status_changes(values):
+    statuses = [value for value, _ in Setting.get_choices('lead_status')] or PIPELINE_STATUSES
+    status = values.get('status')
+    if status not in statuses:
+        raise BulkActionError('Invalid status.')
+    return {'status': status}, 'Status Change', f'Status changed to {status} (bulk update)'
+
+
+def _followup_changes(values):
+    try:
+        followup_date = datetime.strptime(values.get('followup_date') or '', '%Y-%m-%d').date()
+        followup_time = datetime.strptime(values['followup_time'], '%H:%M').time() \
+            if values.get('followup_time') else None
+    except ValueError:
+        raise BulkActionError('Follow-up date must be YYYY-MM-DD and time HH:MM.')
+    followup_type = values.get('followup_type') or None
+    priority = values.get('priority') or None
+    if followup_type and followup_type not in FOLLOWUP_TYPES:
+        raise BulkActionError('Invalid follow-up type.')
+    if priority and priority not in FOLLOWUP_PRIORITIES:
+        raise BulkActionError('Invalid follow-up priority.')
+
+    changes = {'next_followup_date': followup_date, 'followup_time': followup_time}
+    description = [f"Date {followup_date}"]
+    if followup_time:
+        description.append(f"Time {followup_time.strftime('%H:%M')}")
+    if followup_type:
+        changes['followup_type'] = followup_type
+        description.append(f"Type {followup_type}")
+    if priority:
+        changes['followup_priority'] = priority
+        description.append(f"Priority {priority}")
+    return changes, 'Follow-up Update', f"Follow-up updated (bulk update): {'; '.join(description)}"
+
+
+UPDATE_ACTIONS = {
+    'assign': _assign_changes,
+    'status': _status_changes,
+    'followup': _followup_changes,
+}
+BULK_ACTIONS = tuple(UPDATE_ACTIONS) + ('delete',)
+
+
+def _delete_leads(ids):
+    """Delete leads and everything that cannot outlive them; keep history that can"""
+    for model in (Meeting, Student, PaymentLink):
+        table = model.__table__
+        db.session.execute(table.update().where(table.c.lead_id.in_(ids)).values(lead_id=None))
+    for model in (LeadInteraction, LeadQuote, LeadStatusChange):
+        table = model.__table__
+        db.session.execute(table.delete().where(table.c.lead_id.in_(ids)))
+    phone_keys = PhoneKey.__table__
+    db.session.execute(phone_keys.delete().where(phone_keys.c.entity_type == 'lead',
+                                                 phone_keys.c.entity_id.in_(ids)))
+    lead = Lead.__table__
+    db.session.execute(lead.delete().where(lead.c.id.in_(ids)))
+
+
+def apply_bulk_action(scoped_query, action, lead_ids, values, user_id):
+    """
+    Apply a bulk action to the selected leads the user is allowed to change
+
+    Args:
+        scoped_query: Lead query restricted to the leads the user can see
+        action (str): assign, status, followup or delete
+        lead_ids (list): Lead ids from parse_lead_ids()
+        values (dict): Action parameters (assigned_to, status, followup_date, ...)
+        user_id (int): User recorded on the audit rows
+
+    Returns:
+        int: Number of leads changed; ids outside the user's scope are skipped
+    """
+    if action not in BULK_ACTIONS:
+        raise BulkActionError(f'Unknown bulk action: {action}')
+    changes = interaction_type = note = None
+    if action in UPDATE_ACTIONS:
+        changes, interaction_type, note = UPDATE_ACTIONS[action](values or {})
+
+    lead = Lead.__table__
+    now = datetime.now()
+    changed = 0
+    try:
+        for start in range(0, len(lead_ids), BULK_CHUNK_SIZE):
+            chunk = lead_ids[start:start + BULK_CHUNK_SIZE]
+            ids = [row.id for row in scoped_query.with_entities(Lead.id).filter(Lead.id.in_(chunk))]
+            if not ids:
+                continue
+
+            if action in ('status', 'delete'):
+                connection = db.session.connection()
+                new_status = changes['status'] if action == 'status' else None
+                PipelineCounter.apply(connection, PipelineCounter.deltas_for_leads(connection, ids, new_status))
+                LeadDailyRollup.apply(connection, LeadDailyRollup.deltas_for_leads(connection, ids, new_status))
+                if new_status:
+                    LeadStatusChange.record(connection, LeadStatusChange.rows_for_leads(
+                        connection, ids, new_status, datetime.utcnow()))
+
+            if action == 'delete':
+                _delete_leads(ids)
+            else:
+                db.session.execute(lead.update().where(lead.c.id.in_(ids)).values(**changes))
+                db.session.execute(LeadInteraction.__table__.insert(), [{
+                    'lead_id': lead_id,
+                    'interaction_type': interaction_type,
+                    'content': note,
+                    'interaction_date': now,
+                    'created_by_id': user_id,
+                    'is_important': False
+                } for lead_id in ids])
+            LeadEvent.record(db.session.connection(), 'pipeline_changed', {
+                'action': action, 'lead_ids': ids, 'status': changes.get('status') if changes else None
+            })
+            changed += len(ids)
+        if changed:
+            ChangeVersion.bump(db.session.connection(), LEADS_VERSION)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return changed
@@ -0,0 +1,276 @@
+"""
+Bulk messaging for Training Center CRM
+
+/messages/send used to count the send on the template and deliver nothing.
+start_campaign() now stores a MessageCampaign, with the selected leads the
+sender may message as MessageRecipient rows (one INSERT ... SELECT per
+RECIPIENT_INSERT_CHUNK leads), and returns at once.  A job on background's
+pool for long jobs then:
+
+1. adds every lead in the chosen pipeline status instead, when no leads
+   were selected, with a single INSERT ... SELECT
+2. compiles the template's subject and content once into literal text and
+   placeholders
+3. reads the queued recipients CAMPAIGN_CHUNK_SIZE at a time in lead id
+   order, with the lead and course fields the placeholders use in the same
+   query, and renders each message
+4. hands each chunk to the template's channel (message_channels.py), which
+   sends it with bounded concurrency
+5. records every recipient's status and address with one executemany, and
+   the campaign's counts, in one transaction per chunk, so the messages page
+   can poll the progress from any worker
+
+The job holds a lease on its send (claimed_until), renewed with every
+chunk.  resume_campaigns(), which send_emails.py runs, restarts the sends
+whose lease ran out, for example because a worker restarted.  Only queued
+recipients are read, so a resumed send continues where it stopped; the
+gateway idempotency keys keep a chunk that was sent but not recorded from
+reaching anyone twice.
+"""
+import logging
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, literal, or_, select
+
+import background
+from app import db
+from bulk_actions import BULK_CHUNK_SIZE
+from message_channels import ChannelUnavailable, channel_for
+from models import Course, Lead, MessageCampaign, MessageRecipient, PIPELINE_STATUSES, Setting
+
+CAMPAIGN_CHUNK_SIZE = 500
+CAMPAIGN_CLAIM_SECONDS = 600  # A send whose job has not recorded a chunk within this is resumed
+RECIPIENT_INSERT_CHUNK = BULK_CHUNK_SIZE
+PLACEHOLDERS = ('name', 'phone', 'email', 'course_name', 'company_name')
+PLACEHOLDER_PATTERN = re.compile(r'\{(' + '|'.join(PLACEHOLDERS) + r')\}')
+
+
+class MessagingError(Exception):
+    """The send cannot be started; the message is shown to the user"""
+
+
+class CompiledTemplate:
+    """Template text split once into literal text and placeholders, so rendering a message is a join"""
+
+    def __init__(self, text):
+        # Splitting on a pattern with a group alternates literal text (even indexes) and placeholder names
+        self.parts = PLACEHOLDER_PATTERN.split(text or '')
+
+    def render(self, values):
+        parts = list(self.parts)
+        for index in range(1, len(parts), 2):
+            parts[index] = values.get(parts[index]) or ''
+        return ''.join(parts)
+
+
+def audience_select(campaign_id, assigned_to=None, lead_ids=None, status=None):
+    """SELECT of the (campaign_id, lead_id, status) recipient rows for the leads a send goes to"""
+    query = select(literal(campaign_id), Lead.id, literal('queued'))
+    if assigned_to:
+        query = query.where(Lead.assigned_to == assigned_to)
+    if lead_ids is not None:
+        query = query.where(Lead.id.in_(lead_ids))
+    if status:
+        query = query.where(Lead.status == status)
+    return query
+
+
+def add_recipients(campaign_id, assigned_to=None, lead_ids=None, status=None):
+    """Add the send's recipients, set-based; returns how many there are"""
+    insert = MessageRecipient.__table__.insert()
+    columns = ['campaign_id', 'lead_id', 'status']
+    if lead_ids is None:
+        return db.session.execute(insert.from_select(columns, audience_select(
+            campaign_id, assigned_to, status=status))).rowcount
+    total = 0
+    for start in range(0, len(lead_ids), RECIPIENT_INSERT_CHUNK):
+        total += db.session.execute(insert.from_select(columns, audience_select(
+            campaign_id, assigned_to, lead_ids[start:start + RECIPIENT_INSERT_CHUNK], status))).rowcount
+    return total
+
+
+def recipients_query(campaign_id, after_lead_id=0, limit=CAMPAIGN_CHUNK_SIZE):
+    """The next queued recipients of a send, with the lead and course fields the messages use"""
+    return db.session.query(MessageRecipient.id, MessageRecipient.lead_id, Lead.name, Lead.phone, Lead.whatsapp,
+                            Lead.email, Course.name.label('course_name')) \
+        .select_from(MessageRecipient) \
+        .outerjoin(Lead, Lead.id == MessageRecipient.lead_id) \
+        .outerjoin(Course, Course.id == Lead.course_interest_id) \
+        .filter(MessageRecipient.campaign_id == campaign_id, MessageRecipient.status == 'queued',
+                MessageRecipient.lead_id > after_lead_id) \
+        .order_by(MessageRecipient.lead_id).limit(limit)
+
+
+class CampaignSender:
+    """Sends one running MessageCampaign, CAMPAIGN_CHUNK_SIZE recipients at a time"""
+
+    def __init__(self, campaign, template, channel):
+        self.campaign = campaign
+        self.channel = channel
+        self.subject = CompiledTemplate(template.subject)
+        self.content = CompiledTemplate(template.content)
+        course = db.session.get(Course, campaign.course_id) if campaign.course_id else None
+        self.course_name = course.name if course else None
+        self.company_name = Setting.get_single_value('company_name', '')
+
+    def run(self):
+        after_lead_id = 0
+        while True:
+            rows = recipients_query(self.campaign.id, after_lead_id).all()
+            if not rows:
+                return
+            after_lead_id = rows[-1].lead_id
+            self._send_chunk(rows)
+
+    def _send_chunk(self, rows):
+        messages, outcomes = [], []
+        for row in rows:
+            if row.name is None:
+                outcomes.append({'b_id': row.id, 'b_status': 'skipped', 'b_address': None,
+                                 'b_error': 'Lead was deleted', 'b_sent_at': None})
+                continue
+            address = self.channel.address(row._mapping)
+            if not address:
+                outcomes.append({'b_id': row.id, 'b_status': 'skipped', 'b_address': None,
+                                 'b_error': self.channel.missing_address, 'b_sent_at': None})
+                continue
+            values = {'name': row.name, 'phone': row.phone, 'email': row.email,
+                      'course_name': self.course_name or row.course_name, 'company_name': self.company_name}
+            messages.append({'id': row.id, 'address': address, 'subject': self.subject.render(values),
+                             'body': self.content.render(values)})
+
+        results = self.channel.send(messages) if messages else {}
+        now = datetime.utcnow()
+        for message in messages:
+            error = results.get(message['id'])
+            outcomes.append({'b_id': message['id'], 'b_status': 'failed' if error else 'sent',
+                             'b_address': message['address'][:254], 'b_error': error[:300] if error else None,
+                             'b_sent_at': None if error else now})
+
+        table = MessageRecipient.__table__
+        db.session.execute(table.update().where(table.c.id == bindparam('b_id')).values(
+            status=bindparam('b_status'), address=bindparam('b_address'), error=bindparam('b_error'),
+            sent_at=bindparam('b_sent_at')), outcomes)
+        for status, counter in (('sent', 'sent_count'), ('failed', 'failed_count'), ('skipped', 'skipped_count')):
+            count = sum(1 for outcome in outcomes if outcome['b_status'] == status)
+            setattr(self.campaign, counter, (getattr(self.campaign, counter) or 0) + count)
+        self.campaign.claimed_until = now + timedelta(seconds=CAMPAIGN_CLAIM_SECONDS)
+        db.session.commit()
+        self.channel.committed()
+
+
+def claim_campaign(campaign_id, now=None):
+    """Take the lease on an unfinished send, unless a live job holds it; returns whether it was taken"""
+    now = now or datetime.utcnow()
+    table = MessageCampaign.__table__
+    claimed = db.session.execute(table.update().where(
+        table.c.id == campaign_id, table.c.status.in_(('pending', 'running')),
+        or_(table.c.claimed_until.is_(None), table.c.claimed_until < now)
+    ).values(claimed_until=now + timedelta(seconds=CAMPAIGN_CLAIM_SECONDS))).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+def run_campaign(campaign_id):
+    """
+    Background entry point: add a pending send's recipients and send it, or resume a running one
+
+    Returns:
+        bool: False if the send is finished or another live job is sending it
+    """
+    if not claim_campaign(campaign_id):
+        return False
+    campaign = db.session.get(MessageCampaign, campaign_id)
+    channel = None
+    try:
+        template = campaign.template
+        if template is None:
+            raise MessagingError('The template was deleted before the messages were sent.')
+        channel = channel_for(campaign.message_type)
+        if campaign.status == 'pending':
+            if campaign.lead_status:
+                campaign.total_count = add_recipients(campaign.id, campaign.assigned_to, status=campaign.lead_status)
+            campaign.status = 'running'
+            campaign.started_at = datetime.utcnow()
+            db.session.commit()
+        CampaignSender(campaign, template, channel).run()
+        campaign.status = 'completed'
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error sending message campaign {campaign_id}: {str(e)}")
+        campaign = db.session.get(MessageCampaign, campaign_id)
+        campaign.status = 'failed'
+        campaign.message = str(e) if isinstance(e, (MessagingError, ChannelUnavailable)) else \
+            'Sending stopped because of an unexpected error. Messages sent before it are recorded.'
+    finally:
+        if channel is not None:
+            channel.close()
+    campaign.finished_at = datetime.utcnow()
+    campaign.claimed_until = None
+    db.session.commit()
+    return True
+
+
+def resume_campaigns():
+    """
+    Finish the sends whose job stopped, for example with a worker restart
+
+    Returns:
+        int: Sends resumed
+    """
+    campaign_ids = [campaign_id for campaign_id, in db.session.query(MessageCampaign.id).filter(
+        MessageCampaign.status.in_(('pending', 'running')),
+        or_(MessageCampaign.claimed_until.is_(None), MessageCampaign.claimed_until < datetime.utcnow())
+    ).order_by(MessageCampaign.id)]
+    db.session.commit()
+    return sum(1 for campaign_id in campaign_ids if run_campaign(campaign_id))
+
+
+def start_campaign(template, user, lead_ids=None, lead_status=None, course_id=None):
+    """
+    Create a MessageCampaign and start sending it in the background
+
+    Args:
+        template (MessageTemplate): What to send
+        user (User): Sender; users who cannot see every lead only reach the leads assigned to them
+        lead_ids (list): Selected leads, or None to send to every lead in lead_status
+        lead_status (str): Pipeline status whose leads get the message when none are selected
+        course_id (int): Course named by {course_name} for everyone, instead of each lead's course
+
+    Returns:
+        MessageCampaign
+
+    Raises:
+        MessagingError: Inactive template, no recipients, or the channel is not configured
+    """
+    if not template.is_active:
+        raise MessagingError('This template is inactive.')
+    statuses = [value for value, _ in Setting.get_choices('lead_status')] or PIPELINE_STATUSES
+    if not lead_ids and lead_status not in statuses:
+        raise MessagingError('Please select the leads to send to, or a lead status.')
+    try:
+        channel_for(template.message_type).close()
+    except ChannelUnavailable as e:
+        raise MessagingError(str(e))
+
+    campaign = MessageCampaign(
+        template_id=template.id,
+        template_name=template.name,
+        message_type=template.message_type,
+        course_id=course_id or None,
+        audience=f'{len(lead_ids):,} selected leads' if lead_ids else f'All {lead_status} leads',
+        assigned_to=None if user.is_admin() or user.can_view_all_leads else user.id,
+        lead_status=None if lead_ids else lead_status,
+        created_by_id=user.id
+    )
+    template.usage_count = (template.usage_count or 0) + 1
+    db.session.add(campaign)
+    if lead_ids:
+        # Stored with the send, so a resumed job knows who was selected
+        db.session.flush()
+        campaign.total_count = add_recipients(campaign.id, campaign.assigned_to, lead_ids=lead_ids)
+    db.session.commit()
+
+    background.submit_long(run_campaign, campaign.id)
+    return campaign
@@ -0,0 +1,148 @@
+"""
+SQL statement budget check for the main pages
+
+Renders every page below against a throwaway SQLite database, first with a
+few rows per table and again after many more rows were added, and exits
+non-zero when a page issues more statements than its budget or when its
+statement count grows with the number of rows (an N+1 lazy load).  Counts
+come from the X-SQL-Queries header added by query_stats.py.
+
+    python check_query_budgets.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+DATABASE_PATH = os.path.join(tempfile.gettempdir(), 'crm_query_budgets.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE_PATH}'
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app, db  # noqa: E402
+from models import (Course, Lead, LeadInteraction, LeadQuote, Meeting, PaymentLink,  # noqa: E402
+                    PaymentProvider, Student, User, reference_cache)
+from query_stats import QUERY_COUNT_HEADER  # noqa: E402
+
+PASSWORD = 'budget-check'
+SMALL_SCALE = 3
+LARGE_SCALE = 40
+
+# (user, url, statement budget); DETAIL_LEAD_ID is the lead that gets the interactions, meetings and quotes
+DETAIL_LEAD_ID = 1
+PAGES = [
+    ('admin', '/', 14),
+    ('consultant', '/', 14),
+    ('admin', '/leads', 8),
+    ('consultant', '/leads', 8),
+    ('admin', '/pipeline', 14),
+    ('consultant', '/pipeline', 14),
+    ('admin', '/students', 3),
+    ('admin', '/meetings', 2),
+    ('admin', '/payments', 5),
+    ('admin', f'/leads/{DETAIL_LEAD_ID}', 4),
+    ('admin', f'/leads/{DETAIL_LEAD_ID}/detail', 4),
+]
+
+
+def create_users():
+    admin = User(username='budget_admin', email='budget_admin@example.com', role='admin', active=True,
+                 password_hash=generate_password_hash(PASSWORD), can_view_all_leads=True)
+    consultant = User(username='budget_consultant', email='budget_consultant@example.com', role='consultant',
+                      active=True, password_hash=generate_password_hash(PASSWORD))
+    db.session.add_all([admin, consultant])
+    db.session.add_all([PaymentProvider(name=name, is_active=True) for name in ('Vault', 'Tabby', 'Tamara')])
+    db.session.commit()
+    return {'admin': admin.id, 'consultant': consultant.id}
+
+
+def seed(scale, users):
+    """Add `scale` rows of everything the pages list, each row with its own related rows"""
+    offset = Lead.query.count()
+    today = datetime.combine(date.today(), datetime.min.time())
+    statuses = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted', 'Lost']
+    providers = PaymentProvider.query.all()
+    for i in range(offset, offset + scale):
+        course = Course(name=f'Course {i}', price=1000, duration=10, is_active=True)
+        owner = users['consultant'] if i % 2 else users['admin']
+        lead = Lead(name=f'Lead {i}', phone=f'050{i:07d}', status=statuses[i % len(statuses)],
+                    quoted_amount=100.0, course_interest=course, added_by=owner, assigned_to=owner,
+                    next_followup_date=date.today(), created_at=today + timedelta(minutes=i))
+        student = Student(first_name='Student', last_name=str(i), phone=f'055{i:07d}', course=course,
+                          total_fee=1000, enrollment_date=date.today())
+        db.session.add_all([course, lead, student])
+        db.session.flush()
+        detail_lead_id = DETAIL_LEAD_ID if i else lead.id
+        db.session.add_all([
+            LeadInteraction(lead_id=detail_lead_id, interaction_type='Call', content='Called',
+                            created_by_id=owner),
+            LeadQuote(lead_id=detail_lead_id, course_id=course.id, quoted_amount=100.0,
+                      valid_until=date.today(), created_by_id=owner),
+            Meeting(lead_id=detail_lead_id, title=f'Meeting {i}', meeting_type='Online',
+                    meeting_date=today + timedelta(hours=i % 8), created_by_id=owner),
+            Meeting(student_id=student.id, title=f'Class {i}', meeting_type='Offline',
+                    meeting_date=today + timedelta(hours=i % 8), created_by_id=owner),
+            PaymentLink(lead_id=lead.id, provider_id=providers[i % len(providers)].id, amount=100.0,
+                        payment_reference=f'BUDGET-{i}-L', created_by_id=owner),
+            PaymentLink(student_id=student.id, provider_id=providers[i % len(providers)].id, amount=100.0,
+                        payment_reference=f'BUDGET-{i}-S', created_by_id=owner),
+        ])
+    db.session.commit()
+
+
+def measure(clients):
+    """Statement count per page; each page is requested twice so only the warm count is compared"""
+    counts = {}
+    for user, url, budget in PAGES:
+        clients[user].get(url)
+        response = clients[user].get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} as {user} returned {response.status_code}")
+        counts[(user, url)] = int(response.headers[QUERY_COUNT_HEADER])
+    return counts
+
+
+def check_query_budgets():
+    if os.path.exists(DATABASE_PATH):
+        os.remove(DATABASE_PATH)
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, SQL_QUERY_STATS=True)
+    # Re-check the reference data version on every request so counts do not depend on timing
+    reference_cache.check_interval = 0
+
+    with app.app_context():
+        db.create_all()
+        users = create_users()
+        clients = {}
+        for user in users:
+            clients[user] = app.test_client()
+            clients[user].post('/login', data={'username': f'budget_{user}', 'password': PASSWORD})
+
+        seed(SMALL_SCALE, users)
+        small = measure(clients)
+        seed(LARGE_SCALE, users)
+        large = measure(clients)
+
+    failures = 0
+    for user, url, budget in PAGES:
+        key = (user, url)
+        problems = []
+        if large[key] > small[key]:
+            problems.append(f"grows with rows ({small[key]} -> {large[key]})")
+        if large[key] > budget:
+            problems.append(f"over budget ({large[key]} > {budget})")
+        if problems:
+            failures += 1
+            print(f"✗ {url} as {user}: {', '.join(problems)}")
+        else:
+            print(f"✓ {url} as {user}: {large[key]} statements (budget {budget})")
+
+    os.remove(DATABASE_PATH)
+    if failures:
+        print(f"\n{failures} page(s) exceed their SQL statement budget")
+        return False
+    print("\nAll pages are within their SQL statement budgets")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_query_budgets() else 1)
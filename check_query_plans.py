@@ -0,0 +1,258 @@
+"""
+Query plan regression check for the hot lead queries in routes.py
+
+Runs EXPLAIN for every query below and exits non-zero when one of them
+falls back to a full table scan.  By default the schema is built from the
+models in a throwaway SQLite database so the check is deterministic; pass
+--live to explain against the configured application database instead.
+
+    python check_query_plans.py
+    python check_query_plans.py --live
+"""
+import re
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import create_engine, desc, func, text
+
+from app import app, db
+from models import (EnrollmentDailyRollup, Lead, LeadDailyRollup, OutboxEmail, PaymentLink, PhoneKey,
+                    PipelineCounter, Student)
+from search import lead_search_filter, ranked_lead_search
+from lead_activity import activity_feed_query
+from pagination import encode_cursor, keyset_conditions
+from payment_reconciliation import pending_links_query
+from payment_webhooks import unprocessed_events_query
+from email_outbox import due_emails_query
+from bulk_messaging import recipients_query
+from payment_ledger import ledger_links_query, ledger_summary_query
+from lookup import LOOKUP_INDEXES
+
+# Stand-in ids/values; the planner only cares about the shape of the query
+USER_ID = 1
+PHONE = '+971501234567'
+WHATSAPP = '+971507654321'
+SEARCH_TERM = 'mohammed'
+CURSOR_TIME = datetime(2024, 1, 1, 12, 0)
+CURSOR_ID = 1000
+STATUSES = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted', 'Lost']
+
+
+def keyset_page(query, sort_column, id_column, sort_value):
+    """The query keyset_paginate() issues first for the page after (sort_value, CURSOR_ID)"""
+    return query.filter(keyset_conditions(sort_column, id_column, sort_value, CURSOR_ID)[0]) \
+        .order_by(desc(sort_column), desc(id_column)).limit(21)
+
+
+def hot_queries(dialect_name):
+    """Return (name, statement) pairs mirroring the queries issued by routes.py"""
+    today = date.today()
+    queries = [
+        # dashboard()
+        ('dashboard: recent leads (all)',
+         Lead.query.order_by(desc(Lead.created_at)).limit(5)),
+        ('dashboard: recent leads (consultant)',
+         Lead.query.filter_by(added_by=USER_ID).order_by(desc(Lead.created_at)).limit(5)),
+        ('dashboard: today follow-ups (all)',
+         Lead.query.filter(Lead.next_followup_date == today).order_by(Lead.followup_time)),
+        ('dashboard: today follow-ups (consultant)',
+         Lead.query.filter_by(added_by=USER_ID).filter(Lead.next_followup_date == today).order_by(Lead.followup_time)),
+        # PipelineCounter.totals / lead_total (dashboard, pipeline, get_user_pipeline_data)
+        ('pipeline counters: totals (consultant)',
+         db.session.query(PipelineCounter.status, func.sum(PipelineCounter.lead_count),
+                          func.sum(PipelineCounter.quoted_total))
+         .filter(PipelineCounter.consultant_id == USER_ID).group_by(PipelineCounter.status), True),
+        ('pipeline counters: lead total (consultant)',
+         db.session.query(func.sum(PipelineCounter.lead_count))
+         .filter(PipelineCounter.consultant_id == USER_ID), True),
+        # leads()
+        ('leads: list (all)',
+         Lead.query.order_by(desc(Lead.created_at)).limit(20)),
+        ('leads: list by status (all)',
+         Lead.query.filter_by(status='New').order_by(desc(Lead.created_at)).limit(20)),
+        ('leads: list (consultant)',
+         Lead.query.filter_by(assigned_to=USER_ID).order_by(desc(Lead.created_at)).limit(20)),
+        ('leads: search (all)',
+         Lead.query.filter(lead_search_filter(SEARCH_TERM, dialect_name)).order_by(desc(Lead.created_at)).limit(20)),
+        ('leads: phone search (consultant)',
+         Lead.query.filter_by(assigned_to=USER_ID).filter(lead_search_filter(PHONE[-7:], dialect_name))
+         .order_by(desc(Lead.created_at)).limit(20)),
+        # keyset_paginate() pages must seek, not walk the index from the top
+        ('leads: next page (all)',
+         keyset_page(Lead.query, Lead.created_at, Lead.id, CURSOR_TIME), True),
+        ('leads: next page (consultant)',
+         keyset_page(Lead.query.filter_by(assigned_to=USER_ID), Lead.created_at, Lead.id, CURSOR_TIME), True),
+        ('leads: next page into undated leads',
+         Lead.query.filter(keyset_conditions(Lead.created_at, Lead.id, CURSOR_TIME, CURSOR_ID)[1])
+         .order_by(desc(Lead.created_at), desc(Lead.id)).limit(21), True),
+        ('leads: next page among undated leads',
+         keyset_page(Lead.query, Lead.created_at, Lead.id, None), True),
+        # students()
+        ('students: next page',
+         keyset_page(Student.query, Student.enrollment_date, Student.id, CURSOR_TIME.date()), True),
+        ('students: next page by course',
+         keyset_page(Student.query.filter(Student.course_id == 1), Student.enrollment_date, Student.id,
+                     CURSOR_TIME.date()), True),
+        # search_leads_api()
+        ('api/leads/search: ranked (all)',
+         ranked_lead_search(Lead.query, SEARCH_TERM, dialect_name).limit(20)),
+        # pipeline()
+        ('pipeline: meeting lead choices (consultant)',
+         Lead.query.filter(Lead.status != 'Converted', Lead.added_by == USER_ID)),
+        # Lead.check_duplicate
+        ('check_duplicate: phone or whatsapp',
+         db.session.query(PhoneKey.entity_id).filter(PhoneKey.phone_key.in_([PHONE, WHATSAPP]),
+                                                     PhoneKey.entity_type == 'lead',
+                                                     PhoneKey.entity_id != CURSOR_ID).limit(1), True),
+        # lookup() typeaheads
+        ('api/lookup/leads: name prefix (all)',
+         Lead.query.filter(Lead.name.like(f'{SEARCH_TERM}%', escape='\\')).order_by(Lead.name, Lead.id).limit(20), True),
+        ('api/lookup/leads: name prefix (consultant)',
+         Lead.query.filter(db.or_(Lead.assigned_to == USER_ID, Lead.added_by == USER_ID),
+                           Lead.status != 'Converted', Lead.name.like(f'{SEARCH_TERM}%', escape='\\'))
+         .order_by(Lead.name, Lead.id).limit(20)),
+        ('api/lookup/leads: phone prefix',
+         Lead.query.filter(Lead.id.in_(
+             db.session.query(PhoneKey.entity_id).filter(PhoneKey.phone_key >= '+97150', PhoneKey.phone_key < '+97150:',
+                                                         PhoneKey.entity_type == 'lead')
+         )).order_by(Lead.name, Lead.id).limit(20), True),
+        ('api/lookup/students: name prefix',
+         Student.query.filter(db.or_(Student.first_name.like(f'{SEARCH_TERM}%', escape='\\'),
+                                     Student.last_name.like(f'{SEARCH_TERM}%', escape='\\')))
+         .order_by(Student.first_name, Student.id).limit(20)),
+        # lead_detail() / lead_activity_api() activity feed: every UNION ALL branch must seek its lead
+        ('lead activity: first page',
+         activity_feed_query(CURSOR_ID), True),
+        ('lead activity: next page',
+         activity_feed_query(CURSOR_ID, encode_cursor(CURSOR_TIME, CURSOR_ID * 3 + 1)), True),
+        # reports() daily rollups: every date range is a range read on the leading day column
+        ('reports: lead total',
+         db.session.query(func.sum(LeadDailyRollup.lead_count))
+         .filter(LeadDailyRollup.day.between(CURSOR_TIME.date(), today))),
+        ('reports: conversion by source',
+         db.session.query(LeadDailyRollup.lead_source, func.sum(LeadDailyRollup.lead_count))
+         .filter(LeadDailyRollup.day.between(CURSOR_TIME.date(), today)).group_by(LeadDailyRollup.lead_source)),
+        ('reports: course popularity',
+         db.session.query(EnrollmentDailyRollup.course_id, func.sum(EnrollmentDailyRollup.enrollment_count))
+         .filter(EnrollmentDailyRollup.day.between(CURSOR_TIME.date(), today))
+         .group_by(EnrollmentDailyRollup.course_id)),
+        # payments() ledger: date-range summary and each provider tab's newest links
+        ('payments: ledger summary',
+         ledger_summary_query([1, 2, 3], CURSOR_TIME.date(), today), True),
+        ('payments: provider links',
+         ledger_links_query(USER_ID, CURSOR_TIME.date(), today).order_by(desc(PaymentLink.created_at),
+                                                                         desc(PaymentLink.id)).limit(21), True),
+        ('payments: provider links by status',
+         ledger_links_query(USER_ID, CURSOR_TIME.date(), today, 'paid').order_by(desc(PaymentLink.created_at),
+                                                                                 desc(PaymentLink.id)).limit(21), True),
+        # reconcile_payments.py: pending link batches and expiry
+        ('payment reconciliation: pending batch',
+         pending_links_query(CURSOR_ID), True),
+        ('payment reconciliation: expired links',
+         db.session.query(PaymentLink.id).filter(PaymentLink.status == 'pending', PaymentLink.expires_at < CURSOR_TIME),
+         True),
+        # payment_webhooks.apply_payment_events(): the unprocessed event queue
+        ('payment webhooks: unprocessed events',
+         unprocessed_events_query(CURSOR_ID), True),
+        # email_outbox.send_outbox_emails(): due messages and expired claims
+        ('email outbox: due batch', due_emails_query(CURSOR_TIME), True),
+        ('email outbox: expired claims',
+         db.session.query(OutboxEmail.id).filter(OutboxEmail.status == 'sending',
+                                                 OutboxEmail.next_attempt_at <= CURSOR_TIME), True),
+        # bulk_messaging.CampaignSender: the next chunk of queued recipients
+        ('bulk messaging: recipient chunk', recipients_query(CURSOR_ID, CURSOR_ID), True),
+        # check_phones_api()
+        ('api/phones/check: batch lookup',
+         db.session.query(PhoneKey.phone_key, PhoneKey.entity_type, PhoneKey.entity_id)
+         .filter(PhoneKey.phone_key.in_([PHONE, WHATSAPP] * 50)), True),
+    ]
+
+    for status in STATUSES:
+        # pipeline() / pipeline_column_api() kanban column pages
+        queries.append((f'pipeline: {status} column (all)',
+                        Lead.query.filter_by(status=status).order_by(desc(Lead.created_at), desc(Lead.id)).limit(26)))
+        queries.append((f'pipeline: {status} column (consultant)',
+                        Lead.query.filter_by(status=status, added_by=USER_ID)
+                        .order_by(desc(Lead.created_at), desc(Lead.id)).limit(26)))
+        queries.append((f'pipeline: {status} column next page (all)',
+                        keyset_page(Lead.query.filter_by(status=status), Lead.created_at, Lead.id, CURSOR_TIME), True))
+        queries.append((f'pipeline: {status} column next page (consultant)',
+                        keyset_page(Lead.query.filter_by(status=status, added_by=USER_ID),
+                                    Lead.created_at, Lead.id, CURSOR_TIME), True))
+
+    # Entries are (name, query or select) or (name, query or select, require_seek)
+    return [(entry[0], getattr(entry[1], 'statement', entry[1]), entry[2] if len(entry) > 2 else False)
+            for entry in queries]
+
+
+def explain(connection, statement):
+    """Return the raw EXPLAIN rows for a statement on the given connection"""
+    # Render IN (...) lists inline as individual parameters
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    prefix = 'EXPLAIN QUERY PLAN' if connection.dialect.name == 'sqlite' else 'EXPLAIN'
+    result = connection.exec_driver_sql(f"{prefix} {compiled.string}", params)
+    return [dict(row._mapping) for row in result]
+
+
+def full_scans(dialect_name, plan, require_seek=False):
+    """Return the tables a plan reads with a full table (or, with require_seek, full index) scan"""
+    tables = []
+    # Reading back a subquery's own rows (UNION ALL branches, derived tables) is not a table scan
+    subqueries = {match.group(1) for row in plan
+                  for match in [re.match(r'(?:CO-ROUTINE|MATERIALIZE) (\w+)$', str(row.get('detail', '')).strip())]
+                  if match}
+    for row in plan:
+        if dialect_name == 'sqlite':
+            # "SCAN lead" is a full scan; "SCAN lead USING INDEX ..." walks an index
+            pattern = r'SCAN (?:TABLE )?(\w+)(?: USING (?:COVERING )?INDEX \w+)?$' if require_seek \
+                else r'SCAN (?:TABLE )?(\w+)$'
+            match = re.match(pattern, row.get('detail', '').strip())
+            if match and match.group(1) not in subqueries:
+                tables.append(match.group(1))
+        elif str(row.get('table') or '').startswith('<'):
+            continue
+        elif str(row.get('type', '')).upper() in (('ALL', 'INDEX') if require_seek else ('ALL',)):
+            tables.append(row.get('table'))
+    return tables
+
+
+def create_lookup_indexes(engine):
+    """Add the prefix search indexes migration f1a8c4d09e37 creates, which create_all() does not"""
+    with engine.begin() as connection:
+        for name, table_name, column_name in LOOKUP_INDEXES:
+            connection.execute(text(f"CREATE INDEX {name} ON {table_name} ({column_name} COLLATE NOCASE)"))
+
+
+def check_query_plans(live=False):
+    """Explain every hot query and return a list of (name, tables) regressions"""
+    with app.app_context():
+        if live:
+            engine = db.engine
+        else:
+            engine = create_engine('sqlite://')
+            db.metadata.create_all(engine)
+            create_lookup_indexes(engine)
+
+        regressions = []
+        with engine.connect() as connection:
+            for name, statement, require_seek in hot_queries(connection.dialect.name):
+                plan = explain(connection, statement)
+                scanned = full_scans(connection.dialect.name, plan, require_seek)
+                if scanned:
+                    regressions.append((name, scanned))
+                    print(f"✗ {name}: full scan of {', '.join(scanned)}")
+                else:
+                    print(f"✓ {name}")
+        return regressions
+
+
+if __name__ == "__main__":
+    regressions = check_query_plans(live='--live' in sys.argv)
+    if regressions:
+        print(f"\n{len(regressions)} queries fall back to a full table scan")
+        sys.exit(1)
+    print("\nAll hot queries are index-backed")
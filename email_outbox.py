@@ -0,0 +1,221 @@
+"""
+Email outbox for Training Center CRM
+
+Sending used to open an SMTP session to the mail server inside the request,
+once per message, so a slow server held the worker and a failure was only
+logged.  Now queue_email() (and utils.send_email, which calls it) costs the
+request one INSERT: the message is stored as an OutboxEmail and a
+background job is woken to send it.  The sender:
+
+- claims up to EMAIL_BATCH_SIZE due messages at a time, marking them
+  "sending" until EMAIL_CLAIM_SECONDS from now, so two senders never take
+  the same message and a sender that dies mid-batch only delays it
+- sends each batch over one authenticated SMTP connection (mail.connect())
+- records each message as sent, or schedules another attempt with
+  exponential backoff; a permanent refusal (a 5xx reply) or the last
+  attempt marks it failed, with the SMTP error kept in last_error
+
+Delivery is at least once: a sender killed between sending a batch and
+recording it sends those messages again when their claim runs out.
+send_emails.py runs the retries that fall due, and anything a worker
+restart left behind.
+"""
+import logging
+import smtplib
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+
+import background
+from app import db, mail
+from models import OutboxEmail
+
+EMAIL_BATCH_SIZE = 100
+EMAIL_MAX_ATTEMPTS = 6
+EMAIL_BACKOFF_SECONDS = 60  # Doubled for each further attempt
+EMAIL_CLAIM_SECONDS = 600  # A batch not recorded within this is sent again
+EMAIL_BATCH_DELAY = 0.2  # Seconds a woken job waits so messages queued together share a connection
+EMAIL_SEND_INTERVAL_SECONDS = 30
+
+
+def queue_emails(messages, commit=True):
+    """
+    Store emails for the background sender with one INSERT
+
+    Args:
+        messages (list): dicts with to_email, subject, body and optionally html_body
+        commit (bool): False to leave committing, then calling schedule_send(), to the caller
+
+    Returns:
+        int: Emails queued
+    """
+    if not messages:
+        return 0
+    now = datetime.utcnow()
+    db.session.execute(OutboxEmail.__table__.insert(), [{
+        'to_email': message['to_email'], 'subject': message['subject'], 'body': message['body'],
+        'html_body': message.get('html_body'), 'status': 'queued', 'attempts': 0,
+        'next_attempt_at': now, 'created_at': now,
+    } for message in messages])
+    if commit:
+        db.session.commit()
+        schedule_send()
+    return len(messages)
+
+
+def queue_email(to_email, subject, body, html_body=None):
+    """Store one email for the background sender; see queue_emails"""
+    return queue_emails([{'to_email': to_email, 'subject': subject, 'body': body, 'html_body': html_body}])
+
+
+_send_lock = threading.Lock()
+_send_scheduled = False
+
+
+def schedule_send():
+    """Start a background job sending queued emails, unless one is already waiting to start"""
+    global _send_scheduled
+    with _send_lock:
+        if _send_scheduled:
+            return
+        _send_scheduled = True
+    background.submit(_send_soon)
+
+
+def _send_soon():
+    global _send_scheduled
+    time.sleep(EMAIL_BATCH_DELAY)
+    # Clear the flag before claiming, so an email queued from now on schedules another job
+    with _send_lock:
+        _send_scheduled = False
+    return send_outbox_emails()
+
+
+def release_expired_claims(now=None):
+    """Put messages whose sender died mid-batch back in the queue; returns how many were"""
+    table = OutboxEmail.__table__
+    result = db.session.execute(table.update().where(
+        table.c.status == 'sending', table.c.next_attempt_at <= (now or datetime.utcnow())
+    ).values(status='queued'))
+    db.session.commit()
+    return result.rowcount
+
+
+def due_emails_query(now, limit=EMAIL_BATCH_SIZE):
+    """The next queued messages whose attempt is due, oldest due first"""
+    return OutboxEmail.query.filter(OutboxEmail.status == 'queued', OutboxEmail.next_attempt_at <= now) \
+        .order_by(OutboxEmail.next_attempt_at, OutboxEmail.id).limit(limit)
+
+
+def claim_batch(batch_size=EMAIL_BATCH_SIZE, now=None):
+    """
+    Claim the next due messages for this sender
+
+    Returns:
+        list: dicts with id, to_email, subject, body, html_body and attempts
+    """
+    now = now or datetime.utcnow()
+    # Skip rows another sender is claiming right now (MySQL; SQLite serializes writers anyway)
+    messages = due_emails_query(now, batch_size).with_for_update(skip_locked=True).all()
+    claimed = []
+    for message in messages:
+        message.status = 'sending'
+        message.next_attempt_at = now + timedelta(seconds=EMAIL_CLAIM_SECONDS)
+        claimed.append({'id': message.id, 'to_email': message.to_email, 'subject': message.subject,
+                        'body': message.body, 'html_body': message.html_body, 'attempts': message.attempts})
+    db.session.commit()
+    return claimed
+
+
+def send_batch(messages):
+    """
+    Send claimed messages over one SMTP connection
+
+    Returns:
+        dict: Message id: None if sent, else the exception that stopped it
+    """
+    results = {}
+    try:
+        with mail.connect() as connection:
+            for message in messages:
+                try:
+                    connection.send(Message(subject=message['subject'], recipients=[message['to_email']],
+                                            body=message['body'], html=message['html_body']))
+                    results[message['id']] = None
+                except smtplib.SMTPServerDisconnected as e:
+                    results[message['id']] = e
+                    break
+                except Exception as e:
+                    results[message['id']] = e
+    except (smtplib.SMTPException, OSError) as e:
+        # Connecting failed, or the connection dropped: every message not yet sent waits for another one
+        logging.warning(f"SMTP connection failed: {e}")
+        for message in messages:
+            results.setdefault(message['id'], e)
+    return results
+
+
+def is_permanent_failure(error):
+    """Whether the mail server refused a message for good (a 5xx reply), so another attempt cannot help"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return error.smtp_code >= 500
+    return False
+
+
+def record_results(messages, results, now=None):
+    """
+    Store the outcome of a sent batch: sent, queued for another attempt, or failed
+
+    Returns:
+        Counter: sent, retried and failed
+    """
+    now = now or datetime.utcnow()
+    table = OutboxEmail.__table__
+    stats = Counter()
+    sent_ids = [message['id'] for message in messages if results.get(message['id'], False) is None]
+    if sent_ids:
+        db.session.execute(table.update().where(table.c.id.in_(sent_ids), table.c.status == 'sending').values(
+            status='sent', sent_at=now, attempts=table.c.attempts + 1, last_error=None))
+        stats['sent'] = len(sent_ids)
+
+    for message in messages:
+        error = results.get(message['id'], False)
+        if error is None:
+            continue
+        attempts = message['attempts'] + 1
+        values = {'attempts': attempts, 'last_error': str(error or 'Not sent')[:500]}
+        if is_permanent_failure(error) or attempts >= EMAIL_MAX_ATTEMPTS:
+            values['status'] = 'failed'
+            stats['failed'] += 1
+        else:
+            values['status'] = 'queued'
+            values['next_attempt_at'] = now + timedelta(seconds=EMAIL_BACKOFF_SECONDS * 2 ** (attempts - 1))
+            stats['retried'] += 1
+        db.session.execute(table.update().where(table.c.id == message['id'], table.c.status == 'sending')
+                           .values(**values))
+    db.session.commit()
+    return stats
+
+
+def send_outbox_emails(batch_size=EMAIL_BATCH_SIZE):
+    """
+    Send every due email, one batch and one SMTP connection at a time
+
+    Returns:
+        Counter: released (expired claims), sent, retried and failed
+    """
+    stats = Counter()
+    stats['released'] = release_expired_claims()
+    while True:
+        messages = claim_batch(batch_size)
+        if not messages:
+            break
+        stats.update(record_results(messages, send_batch(messages)))
+    if stats['failed']:
+        logging.warning(f"{stats['failed']} emails could not be delivered; see outbox_email.last_error")
+    return stats
@@ -0,0 +1,289 @@
+"""
+Server-Sent Events push channel for Training Center CRM
+
+Lead changes are written to the lead_event table in the same transaction as
+the change itself (see the Lead listeners in models.py; bulk imports and bulk
+actions record one pipeline_changed event per chunk).  Each worker process
+runs one broadcaster thread that polls that table about once a second while
+it has subscribers and hands every new event to the open ``/api/events``
+streams, so changes made in any gunicorn or mod_wsgi process reach every
+browser without an external broker.
+
+An open stream occupies a thread of the worker serving it, and holds no
+database connection while it waits.  Run threaded workers (gunicorn
+``--worker-class gthread --threads N``, as .replit does, or mod_wsgi
+``threads=N``): on a sync worker one open tab holds the whole worker.  A
+worker serves at most EVENT_MAX_STREAMS streams, well below its thread
+count, so pages, webhooks and API calls always find a free thread; past
+that, /api/events answers 503 and the board polls /api/pipeline/data
+instead until it tries again.  Streams end after STREAM_DURATION, so the
+threads they hold turn over and a freed slot goes to whichever tab asks
+next.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import Response, current_app
+from sqlalchemy import func, select
+
+from app import db
+from models import Course, LeadEvent
+
+EVENT_POLL_INTERVAL = 1.0  # Seconds between polls of lead_event while anyone is subscribed
+EVENT_BATCH_SIZE = 500  # Most events read per poll (and replayed on reconnect)
+SUBSCRIBER_QUEUE_SIZE = 200  # Events a slow stream may fall behind before it is told to resync
+GAP_TIMEOUT = 10  # Seconds to wait for an event id skipped by a transaction that had not committed yet
+MAX_GAPS = 1000
+EVENT_RETENTION = timedelta(days=1)
+PRUNE_INTERVAL = 3600
+
+KEEPALIVE_INTERVAL = 15  # Seconds between comment lines, which also detect closed connections
+STREAM_DURATION = 120  # Streams end after this long; EventSource reconnects with Last-Event-ID
+RETRY_MS = 3000
+MAX_STREAMS = 8  # Default EVENT_MAX_STREAMS: open streams per worker process
+BUSY_RETRY_SECONDS = 60  # Retry-After when a worker has no stream left to give
+
+
+class TooManyStreams(Exception):
+    """The worker already serves as many streams as it may"""
+
+
+class Subscription:
+    """One open event stream: the subscriber's role scope and its queue of pending events"""
+
+    def __init__(self, user_id, view_all):
+        self.user_id = user_id
+        self.view_all = view_all
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def _sees(self, scope):
+        # Same scope as the pipeline board: everyone's leads, or the ones the user added
+        return scope is not None and (self.view_all or scope.get('added_by') == self.user_id)
+
+    def message(self, event):
+        """The event as this subscriber may see it, or None when it is out of their scope"""
+        if event['event_type'] == 'pipeline_changed':
+            if self.view_all:
+                return event
+            # The leads of a bulk change may be outside this user's scope: only say the totals changed
+            return dict(event, payload={'action': event['payload'].get('action')})
+        payload = event['payload']
+        before = payload['before'] if self._sees(payload['before']) else None
+        after = payload['after'] if self._sees(payload['after']) else None
+        if before is None and after is None:
+            return None
+        data = dict(payload, before=before, after=after)
+        if after is None:
+            # The lead left this user's board; only its id is needed to remove the card
+            data['lead'] = {'id': payload['lead']['id']}
+        return dict(event, payload=data)
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+
+def _event_message(row, course_names):
+    payload = json.loads(row.payload)
+    lead = payload.get('lead')
+    if lead and lead.get('course_interest_id'):
+        lead['course_name'] = course_names.get(lead['course_interest_id'])
+    return {'id': row.id, 'event_type': row.event_type, 'payload': payload}
+
+
+def load_events(after_id, up_to_id=None, limit=EVENT_BATCH_SIZE):
+    """Events with after_id < id <= up_to_id as messages, oldest first"""
+    table = LeadEvent.__table__
+    query = select(table.c.id, table.c.event_type, table.c.payload).where(table.c.id > after_id)
+    if up_to_id is not None:
+        query = query.where(table.c.id <= up_to_id)
+    rows = db.session.execute(query.order_by(table.c.id).limit(limit)).all()
+    course_names = dict(Course.active_choices()) if rows else {}
+    return [_event_message(row, course_names) for row in rows]
+
+
+class EventBroadcaster:
+    """
+    Per-process fan-out of lead_event rows to the open streams
+
+    The thread reads ``id > cursor`` in id order.  Ids are assigned at insert
+    but rows become visible at commit, so an id skipped over may still turn
+    up; such gaps are re-checked for GAP_TIMEOUT seconds.  The thread sleeps
+    without touching the database while nobody is subscribed.
+    """
+
+    def __init__(self, poll_interval=EVENT_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._subscriptions = set()
+        self._cursor = 0
+        self._gaps = {}  # skipped event id: monotonic time it was first missed
+        self._pruned_at = 0.0
+        self._thread = None
+        self._app = None
+
+    def subscribe(self, user_id, view_all, max_streams=MAX_STREAMS):
+        """
+        Register a stream; returns (subscription, id of the last event it will not be sent)
+
+        Raises:
+            TooManyStreams: max_streams streams are already open in this process
+        """
+        subscription = Subscription(user_id, view_all)
+        with self._lock:
+            if len(self._subscriptions) >= max_streams:
+                raise TooManyStreams()
+            if not self._subscriptions:
+                # Nobody was listening: start from the newest event instead of replaying the backlog
+                self._cursor = db.session.query(func.max(LeadEvent.id)).scalar() or 0
+                self._gaps.clear()
+            self._subscriptions.add(subscription)
+            cursor = self._cursor
+            if self._thread is None or not self._thread.is_alive():
+                self._app = current_app._get_current_object()
+                self._thread = threading.Thread(target=self._run, name='crm-events', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return subscription, cursor
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = not self._subscriptions
+            if idle:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            try:
+                with self._app.app_context():
+                    try:
+                        self.poll()
+                        self._prune()
+                    finally:
+                        db.session.remove()
+            except Exception:
+                logging.exception("Event broadcaster poll failed")
+            time.sleep(self.poll_interval)
+
+    def poll(self):
+        """Read new events and queue them for every subscriber in scope"""
+        table = LeadEvent.__table__
+        with self._lock:
+            cursor, gaps = self._cursor, list(self._gaps)
+        condition = table.c.id > cursor
+        if gaps:
+            condition = condition | table.c.id.in_(gaps)
+        rows = db.session.execute(
+            select(table.c.id, table.c.event_type, table.c.payload)
+            .where(condition).order_by(table.c.id).limit(EVENT_BATCH_SIZE)
+        ).all()
+        course_names = dict(Course.active_choices()) if rows else {}
+
+        now = time.monotonic()
+        with self._lock:
+            for row in rows:
+                if self._gaps.pop(row.id, None) is None and row.id > self._cursor:
+                    for missing in range(max(self._cursor + 1, row.id - MAX_GAPS), row.id):
+                        self._gaps[missing] = now
+                    self._cursor = row.id
+            for missing, first_missed in list(self._gaps.items()):
+                if now - first_missed > GAP_TIMEOUT:
+                    del self._gaps[missing]
+            subscriptions = list(self._subscriptions)
+
+        for row in rows:
+            event = _event_message(row, course_names)
+            for subscription in subscriptions:
+                message = subscription.message(event)
+                if message is not None:
+                    subscription.put(message)
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        LeadEvent.query.filter(LeadEvent.created_at < datetime.utcnow() - EVENT_RETENTION) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+
+broadcaster = EventBroadcaster()
+
+
+def _frame(message):
+    return f"id: {message['id']}\nevent: {message['event_type']}\ndata: {json.dumps(message['payload'])}\n\n"
+
+
+def event_stream_response(user_id, view_all, last_event_id=None):
+    """
+    Stream lead events in the user's role scope as text/event-stream
+
+    Args:
+        user_id (int): Subscriber, for scope filtering
+        view_all (bool): True for admins and users who may view all leads
+        last_event_id (int): Last-Event-ID sent by a reconnecting EventSource; missed events are replayed
+
+    Returns:
+        Response: Streaming response, with the database session released before streaming starts, or
+        503 with Retry-After when the worker already serves EVENT_MAX_STREAMS streams
+    """
+    try:
+        subscription, cursor = broadcaster.subscribe(
+            user_id, view_all, current_app.config.get('EVENT_MAX_STREAMS', MAX_STREAMS))
+    except TooManyStreams:
+        db.session.remove()
+        return Response(f"retry: {BUSY_RETRY_SECONDS * 1000}\n\n", status=503, mimetype='text/event-stream',
+                        headers={'Retry-After': str(BUSY_RETRY_SECONDS), 'Cache-Control': 'no-cache'})
+    backlog, resync = [], False
+    if last_event_id is not None and last_event_id < cursor:
+        missed = load_events(last_event_id, cursor, limit=EVENT_BATCH_SIZE + 1)
+        resync = len(missed) > EVENT_BATCH_SIZE
+        if not resync:
+            backlog = [message for message in map(subscription.message, missed) if message is not None]
+    # The stream may stay open for minutes; do not hold a pooled connection for it
+    db.session.remove()
+
+    def generate():
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            if resync:
+                yield "event: resync\ndata: {}\n\n"
+            for message in backlog:
+                yield _frame(message)
+            deadline = time.monotonic() + STREAM_DURATION
+            while time.monotonic() < deadline:
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    yield "event: resync\ndata: {}\n\n"
+                try:
+                    message = subscription.queue.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _frame(message)
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Let nginx pass events through as they are sent
+        }
+    )
@@ -0,0 +1,268 @@
+"""
+Streaming data export for Training Center CRM
+
+Exports are generated while they download: rows are read from the database
+with ``yield_per`` (a server-side cursor on MySQL) and written to the
+response ``EXPORT_BATCH_SIZE`` rows at a time, so memory use stays flat no
+matter how many rows are exported.  XLSX files are written as a streamed zip
+with a minimal worksheet, since a workbook library needs the whole file on
+disk before the first byte can be sent.
+"""
+import csv
+import io
+import json
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from flask import Response, stream_with_context
+from sqlalchemy.orm import aliased
+
+from models import Course, CorporateTraining, Lead, Meeting, PaymentLink, PaymentProvider, Student, User
+
+EXPORT_BATCH_SIZE = 1000
+
+# format: (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+FORMAT_ALIASES = {'excel': 'xlsx', 'json': 'jsonl'}
+
+
+def _lead_columns(query):
+    consultant = aliased(User)
+    return query.outerjoin(Course, Lead.course_interest_id == Course.id) \
+        .outerjoin(consultant, Lead.assigned_to == consultant.id) \
+        .with_entities(
+            Lead.id.label('id'), Lead.name.label('name'), Lead.phone.label('phone'),
+            Lead.whatsapp.label('whatsapp'), Lead.email.label('email'),
+            Course.name.label('course'), Lead.lead_source.label('lead_source'),
+            Lead.status.label('status'), Lead.quoted_amount.label('quoted_amount'),
+            consultant.username.label('assigned_to'), Lead.last_contact_date.label('last_contact_date'),
+            Lead.next_followup_date.label('next_followup_date'), Lead.followup_type.label('followup_type'),
+            Lead.comments.label('comments'), Lead.created_at.label('created_at')
+        )
+
+
+def _student_columns(query):
+    return query.outerjoin(Course, Student.course_id == Course.id).with_entities(
+        Student.id.label('id'), Student.first_name.label('first_name'), Student.last_name.label('last_name'),
+        Student.country_code.label('country_code'), Student.phone.label('phone'), Student.email.label('email'),
+        Course.name.label('course'), Student.enrollment_date.label('enrollment_date'),
+        Student.status.label('status'), Student.total_fee.label('total_fee'), Student.fee_paid.label('fee_paid'),
+        Student.payment_plan.label('payment_plan'), Student.batch_name.label('batch_name'),
+        Student.start_date.label('start_date'), Student.end_date.label('end_date')
+    )
+
+
+def _meeting_columns(query):
+    return query.outerjoin(Lead, Meeting.lead_id == Lead.id) \
+        .outerjoin(Student, Meeting.student_id == Student.id) \
+        .with_entities(
+            Meeting.id.label('id'), Meeting.title.label('title'), Meeting.meeting_type.label('meeting_type'),
+            Meeting.meeting_date.label('meeting_date'), Meeting.duration.label('duration'),
+            Meeting.status.label('status'), Lead.name.label('lead'),
+            (Student.first_name + ' ' + Student.last_name).label('student'),
+            Meeting.location.label('location'), Meeting.meeting_link.label('meeting_link'),
+            Meeting.agenda.label('agenda'), Meeting.notes.label('notes'), Meeting.created_at.label('created_at')
+        )
+
+
+def _payment_columns(query):
+    return query.outerjoin(PaymentProvider, PaymentLink.provider_id == PaymentProvider.id) \
+        .outerjoin(Lead, PaymentLink.lead_id == Lead.id) \
+        .outerjoin(Student, PaymentLink.student_id == Student.id) \
+        .with_entities(
+            PaymentLink.id.label('id'), PaymentLink.payment_reference.label('payment_reference'),
+            PaymentProvider.name.label('provider'), PaymentLink.amount.label('amount'),
+            PaymentLink.currency.label('currency'), PaymentLink.status.label('status'),
+            Lead.name.label('lead'), (Student.first_name + ' ' + Student.last_name).label('student'),
+            PaymentLink.description.label('description'), PaymentLink.payment_url.label('payment_url'),
+            PaymentLink.created_at.label('created_at'), PaymentLink.paid_at.label('paid_at'),
+            PaymentLink.expires_at.label('expires_at')
+        )
+
+
+def _corporate_columns(query):
+    return query.with_entities(
+        CorporateTraining.id.label('id'), CorporateTraining.company_name.label('company_name'),
+        CorporateTraining.location.label('location'), CorporateTraining.industry.label('industry'),
+        CorporateTraining.contact_person_name.label('contact_person_name'),
+        CorporateTraining.contact_person_email.label('contact_person_email'),
+        CorporateTraining.contact_person_country_code.label('contact_person_country_code'),
+        CorporateTraining.contact_person_phone.label('contact_person_phone'),
+        CorporateTraining.trainee_count.label('trainee_count'), CorporateTraining.training_mode.label('training_mode'),
+        CorporateTraining.status.label('status'), CorporateTraining.quotation_amount.label('quotation_amount'),
+        CorporateTraining.deal_value.label('deal_value'), CorporateTraining.start_date.label('start_date'),
+        CorporateTraining.end_date.label('end_date'), CorporateTraining.created_at.label('created_at')
+    )
+
+
+# export type: (model, function selecting the exported columns from a scoped query)
+EXPORT_TYPES = {
+    'leads': (Lead, _lead_columns),
+    'students': (Student, _student_columns),
+    'meetings': (Meeting, _meeting_columns),
+    'payments': (PaymentLink, _payment_columns),
+    'corporate': (CorporateTraining, _corporate_columns),
+}
+
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _batches(query):
+    """Yield lists of up to EXPORT_BATCH_SIZE rows, reading them with a server-side cursor"""
+    batch = []
+    for row in query.yield_per(EXPORT_BATCH_SIZE):
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv_stream(columns, query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in _batches(query):
+        writer.writerows([_value(v) for v in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _jsonl_stream(columns, query):
+    for batch in _batches(query):
+        yield ''.join(json.dumps(dict(zip(columns, row)), default=_value) + '\n' for row in batch)
+
+
+# Characters that are not allowed in XML 1.0 documents
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XLSX_PARTS = [
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+     'Target="xl/workbook.xml"/></Relationships>'),
+    ('xl/workbook.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+     'Target="worksheets/sheet1.xml"/></Relationships>'),
+]
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(_value(value))))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(v) for v in values) + '</row>'
+
+
+class _ChunkWriter:
+    """Write-only, unseekable file object whose contents are drained after each batch"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _xlsx_stream(columns, query):
+    output = _ChunkWriter()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS:
+            workbook.writestr(name, content)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            sheet.write(_xlsx_row(columns).encode())
+            yield output.drain()
+            for batch in _batches(query):
+                sheet.write(''.join(_xlsx_row(row) for row in batch).encode())
+                yield output.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield output.drain()
+
+
+STREAMS = {'csv': _csv_stream, 'jsonl': _jsonl_stream, 'xlsx': _xlsx_stream}
+
+
+def export_response(export_type, export_format, query):
+    """
+    Stream a scoped query as a file download
+
+    Args:
+        export_type (str): One of EXPORT_TYPES
+        export_format (str): csv, jsonl or xlsx ("excel" and "json" are accepted as aliases)
+        query: ORM query of the export type's model with role scoping and filters applied
+
+    Returns:
+        Response: Streaming download; raises ValueError for an unknown type or format
+    """
+    if export_type not in EXPORT_TYPES:
+        raise ValueError(f"Unknown export type: {export_type}")
+    export_format = FORMAT_ALIASES.get(export_format, export_format)
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    model, select_columns = EXPORT_TYPES[export_type]
+    rows = select_columns(query).order_by(model.id)
+    columns = [column['name'] for column in rows.column_descriptions]
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"{export_type}_export_{date.today().isoformat()}.{extension}"
+
+    return Response(
+        stream_with_context(STREAMS[export_format](columns, rows)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'  # Let nginx pass chunks through as they are generated
+        }
+    )
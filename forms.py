@@ -1,11 +1,47 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, TextAreaField, SelectField, FloatField, DateField, IntegerField, BooleanField, PasswordField, HiddenField, TimeField, SelectMultipleField
 from wtforms.validators import DataRequired, Email, Length, Optional, NumberRange, ValidationError
 from wtforms.widgets import TextArea
+from flask import url_for
 from models import Course, User, Setting
+from lookup import resolve_lookup
 import json
 from datetime import date
 
+class LookupField(SelectField):
+    """
+    Select filled from /api/lookup/<lookup_type> as the user types
+
+    Only the placeholder and the current value are rendered as options, and a
+    submitted id is checked with one scoped query instead of a full choices list.
+    """
+    
+    def __init__(self, label=None, validators=None, lookup_type=None, placeholder='', lookup_filters=None, **kwargs):
+        kwargs.setdefault('coerce', int)
+        kwargs.setdefault('default', 0)
+        super(LookupField, self).__init__(label, validators, choices=[(0, placeholder)], **kwargs)
+        self.lookup_type = lookup_type
+        self.placeholder = placeholder
+        self.lookup_filters = lookup_filters or {}
+    
+    def iter_choices(self):
+        self.choices = [(0, self.placeholder)]
+        if self.data:
+            item = resolve_lookup(self.lookup_type, self.data, **self.lookup_filters)
+            if item:
+                self.choices.append((item['id'], item['text']))
+        return super(LookupField, self).iter_choices()
+    
+    def __call__(self, **kwargs):
+        kwargs.setdefault('data-lookup-url', url_for('main.lookup', lookup_type=self.lookup_type,
+                                                     **{name: 1 for name, on in self.lookup_filters.items() if on}))
+        return super(LookupField, self).__call__(**kwargs)
+    
+    def pre_validate(self, form):
+        if self.data and resolve_lookup(self.lookup_type, self.data, **self.lookup_filters) is None:
+            raise ValidationError(self.gettext('Not a valid choice.'))
+
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=4, max=25)])
     password = PasswordField('Password', validators=[DataRequired()])
@@ -46,10 +82,9 @@ class LeadForm(FlaskForm):
             ('WhatsApp', 'WhatsApp')
         ]
         # Load course choices
-        self.course_interest_id.choices = [(0, 'Select Course')] + [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+        self.course_interest_id.choices = [(0, 'Select Course')] + Course.active_choices()
         # Load consultant users for assignment
-        consultants = User.query.filter_by(role='consultant', active=True).all()
-        self.assigned_to.choices = [(0, 'Select Consultant')] + [(u.id, u.username) for u in consultants]
+        self.assigned_to.choices = [(0, 'Select Consultant')] + User.consultant_choices()
 
 class ActivityForm(FlaskForm):
     comment = TextAreaField('Add Activity Comment', validators=[DataRequired()], render_kw={"placeholder": "What happened with this lead?", "rows": "3"})
@@ -77,8 +112,9 @@ class CourseForm(FlaskForm):
                 raise ValidationError('Key Points must be a valid JSON array (e.g., ["point1", "point2"]).')
 
 class MeetingForm(FlaskForm):
-    lead_id = SelectField('Lead', coerce=int, validators=[Optional()])
-    student_id = SelectField('Student', coerce=int, validators=[Optional()])
+    lead_id = LookupField('Lead', validators=[Optional()], lookup_type='leads', placeholder='Select Lead',
+                          lookup_filters={'open_only': True})
+    student_id = LookupField('Student', validators=[Optional()], lookup_type='students', placeholder='Select Student')
     title = StringField('Meeting Title', validators=[DataRequired(), Length(max=200)])
     meeting_type = SelectField('Meeting Type', validators=[DataRequired()])
     meeting_date = DateField('Meeting Date', validators=[DataRequired()])
@@ -267,9 +303,18 @@ class BulkAssignForm(FlaskForm):
     
     def __init__(self, *args, **kwargs):
         super(BulkAssignForm, self).__init__(*args, **kwargs)
-        from models import User
-        consultants = User.query.filter_by(role='consultant', active=True).all()
-        self.assigned_to.choices = [(u.id, u.username) for u in consultants]
+        self.assigned_to.choices = User.consultant_choices()
+
+class LeadImportForm(FlaskForm):
+    file = FileField('Lead File (CSV or Excel)', validators=[
+        FileRequired(),
+        FileAllowed(['csv', 'xlsx'], 'Only CSV and Excel (.xlsx) files can be imported.')
+    ])
+    assigned_to = SelectField('Assign Leads To', coerce=int, validators=[Optional()])
+    
+    def __init__(self, *args, **kwargs):
+        super(LeadImportForm, self).__init__(*args, **kwargs)
+        self.assigned_to.choices = [(0, 'Myself')] + User.consultant_choices()
 
 
 # Payment Forms
@@ -289,8 +334,8 @@ class PaymentProviderForm(FlaskForm):
     is_active = BooleanField("Active", default=True)
 
 class PaymentLinkForm(FlaskForm):
-    lead_id = SelectField("Lead", coerce=int, validators=[Optional()])
-    student_id = SelectField("Student", coerce=int, validators=[Optional()])
+    lead_id = LookupField("Lead", validators=[Optional()], lookup_type='leads', placeholder="Select Lead")
+    student_id = LookupField("Student", validators=[Optional()], lookup_type='students', placeholder="Select Student")
     provider_id = SelectField("Payment Provider", coerce=int, validators=[DataRequired()])
     amount = FloatField("Amount", validators=[DataRequired(), NumberRange(min=0.01)])
     currency = SelectField("Currency", choices=[
@@ -352,9 +397,7 @@ class LegacyStudentForm(FlaskForm):
     
     def __init__(self, *args, **kwargs):
         super(StudentForm, self).__init__(*args, **kwargs)
-        from models import Course
-        courses = Course.query.filter_by(is_active=True).all()
-        self.course_id.choices = [(0, 'Select Course')] + [(c.id, c.name) for c in courses]
+        self.course_id.choices = [(0, 'Select Course')] + Course.active_choices()
 
 class TrainerForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired(), Length(max=100)])
@@ -397,8 +440,7 @@ class ScheduleForm(FlaskForm):
         trainers = Trainer.query.filter_by(is_active=True).all()
         self.trainer_id.choices = [(t.id, t.name) for t in trainers]
         
-        courses = Course.query.filter_by(is_active=True).all()
-        self.course_id.choices = [(c.id, c.name) for c in courses]
+        self.course_id.choices = Course.active_choices()
         
         students = Student.query.filter_by(is_active=True).all()
         self.student_ids.choices = [(s.id, s.name) for s in students]
@@ -486,8 +528,7 @@ class TrainerForm(FlaskForm):
     
     def __init__(self, *args, **kwargs):
         super(TrainerForm, self).__init__(*args, **kwargs)
-        from models import Course
-        self.course_ids.choices = [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+        self.course_ids.choices = Course.active_choices()
 
 class ClassScheduleForm(FlaskForm):
     trainer_id = SelectField('Trainer', coerce=int, validators=[DataRequired()])
@@ -0,0 +1,150 @@
+"""
+Activity timeline for the Training Center CRM lead detail page
+
+A lead's interactions, meetings and quotes are read as one newest-first feed
+with a single UNION ALL query.  Each branch seeks its own (lead_id, date)
+index and is limited to one page before the branches are merged, so a page
+costs three short index range reads however much history the lead has.
+Authors and quoted course names are joined in, so rows never lazy-load.
+
+The feed is keyset-paginated on (date, activity key), where the activity
+key is ``id * len(ACTIVITY_KINDS) + kind``: unique across the three tables
+and, for a fixed kind, ordered like the row id.
+"""
+from datetime import datetime
+
+from sqlalchemy import false, null, select, true, type_coerce, union_all
+
+from app import db
+from models import Course, LeadInteraction, LeadQuote, Meeting, User
+from pagination import KeysetPagination, decode_cursor, encode_cursor
+
+ACTIVITY_PAGE_SIZE = 25
+MAX_ACTIVITY_PAGE_SIZE = 100
+
+ACTIVITY_KINDS = ('interaction', 'meeting', 'quote')
+
+# Interaction types shown with their own icon instead of the generic interaction one
+INTERACTION_ACTIVITY_TYPES = {
+    'Quote Update': 'quote-update',
+    'Follow-up Update': 'follow-up-update',
+}
+
+
+def _branches():
+    """(kind, model, date column, select) for every activity source, columns in union order"""
+    interaction = select(
+        LeadInteraction.id.label('id'),
+        LeadInteraction.interaction_date.label('occurred_at'),
+        LeadInteraction.interaction_type.label('subtype'),
+        LeadInteraction.content.label('content'),
+        type_coerce(null(), db.String).label('detail'),
+        type_coerce(null(), db.Float).label('amount'),
+        LeadInteraction.is_important.label('is_important'),
+        User.username.label('created_by'),
+    ).outerjoin(User, LeadInteraction.created_by_id == User.id)
+
+    meeting = select(
+        Meeting.id, Meeting.meeting_date, Meeting.status, Meeting.title, Meeting.meeting_type,
+        null(), false(), User.username,
+    ).outerjoin(User, Meeting.created_by_id == User.id)
+
+    quote = select(
+        LeadQuote.id, LeadQuote.created_at, LeadQuote.status, Course.name, LeadQuote.currency,
+        LeadQuote.quoted_amount, true(), User.username,
+    ).outerjoin(Course, LeadQuote.course_id == Course.id).outerjoin(User, LeadQuote.created_by_id == User.id)
+
+    return [
+        ('interaction', LeadInteraction, LeadInteraction.interaction_date, interaction),
+        ('meeting', Meeting, Meeting.meeting_date, meeting),
+        ('quote', LeadQuote, LeadQuote.created_at, quote),
+    ]
+
+
+def _parse_cursor(cursor):
+    """Decode a next_cursor into (date, id, kind index), or None to start from the newest activity"""
+    if not cursor:
+        return None
+    try:
+        (occurred_at, activity_key), _ = decode_cursor(cursor)
+        occurred_at = datetime.fromisoformat(occurred_at)
+    except (TypeError, ValueError):
+        return None
+    activity_id, kind_index = divmod(activity_key, len(ACTIVITY_KINDS))
+    return occurred_at, activity_id, kind_index
+
+
+def activity_feed_query(lead_id, cursor=None, limit=ACTIVITY_PAGE_SIZE):
+    """UNION ALL select of at most `limit` activities of a lead older than the cursor, newest first"""
+    position = _parse_cursor(cursor)
+    branches = []
+    for kind_index, (kind, model, date_column, branch) in enumerate(_branches()):
+        branch = branch.add_columns(
+            type_coerce(kind, db.String).label('kind'),
+            (model.id * len(ACTIVITY_KINDS) + kind_index).label('activity_key'),
+        ).where(model.lead_id == lead_id)
+        if position:
+            occurred_at, activity_id, cursor_kind = position
+            # (id, kind) < (cursor id, cursor kind) reduces to an id bound for a fixed kind
+            id_bound = activity_id + 1 if kind_index < cursor_kind else activity_id
+            branch = branch.where(date_column <= occurred_at,
+                                  (date_column < occurred_at) | (model.id < id_bound))
+        branches.append(select(
+            branch.order_by(date_column.desc(), model.id.desc()).limit(limit).subquery()
+        ))
+    feed = union_all(*branches).subquery()
+    return select(feed).order_by(feed.c.occurred_at.desc(), feed.c.activity_key.desc()).limit(limit)
+
+
+def _activity_type(row):
+    if row.kind == 'interaction':
+        return INTERACTION_ACTIVITY_TYPES.get(row.subtype, 'interaction')
+    return row.kind
+
+
+def _activity_content(row):
+    if row.kind == 'meeting':
+        return f"{row.content} - {row.detail}"
+    if row.kind == 'quote':
+        return f"Quote for {row.content} - {row.detail} {row.amount}"
+    return row.content
+
+
+def activity_item(row):
+    """Template fields of one feed row; `date` is a datetime"""
+    return {
+        'id': row.id,
+        'type': _activity_type(row),
+        'subtype': row.subtype or '',
+        'date': row.occurred_at,
+        'content': _activity_content(row),
+        'created_by': row.created_by or 'System',
+        'is_important': bool(row.is_important),
+    }
+
+
+def activity_payload(item):
+    """JSON form of activity_item() for /api/leads/<id>/activity"""
+    return dict(item,
+                date=item['date'].isoformat() if item['date'] else None,
+                date_display=item['date'].strftime('%H:%M - %b %d, %Y') if item['date'] else '')
+
+
+def lead_activity(lead_id, cursor=None, per_page=ACTIVITY_PAGE_SIZE):
+    """
+    One page of a lead's activity feed, newest first
+
+    Args:
+        lead_id (int): Lead whose interactions, meetings and quotes are listed
+        cursor (str): next_cursor of the previous page
+        per_page (int): Page size, capped at MAX_ACTIVITY_PAGE_SIZE
+
+    Returns:
+        KeysetPagination: items are activity_item() dicts
+    """
+    per_page = max(1, min(per_page or ACTIVITY_PAGE_SIZE, MAX_ACTIVITY_PAGE_SIZE))
+    rows = db.session.execute(activity_feed_query(lead_id, cursor, per_page + 1)).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(rows[-1].occurred_at, rows[-1].activity_key) if rows and has_next else None
+    return KeysetPagination([activity_item(row) for row in rows], per_page, next_cursor)
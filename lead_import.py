@@ -0,0 +1,385 @@
+"""
+Bulk lead import for Training Center CRM
+
+Uploaded CSV and Excel (.xlsx) files are streamed from disk row by row and
+validated with the same rules as LeadForm.  Rows are written in chunks: each
+chunk resolves its duplicates with one lookup against the phone_key index,
+inserts the new leads with a single executemany and records their phone keys
+the same way.  Bulk inserts bypass the ORM events, so search_phone, the
+phone_key rows, the pipeline counters, the daily report rollup, the lead
+status history, the leads change version and the pipeline_changed event are
+maintained here explicitly.
+
+Progress and per-row errors are stored on the LeadImport row as the import
+runs, so the browser can poll them from any worker.
+"""
+import csv
+import json
+import logging
+import os
+import uuid
+from datetime import date, datetime
+
+from email_validator import EmailNotValidError, validate_email
+from flask import current_app
+from sqlalchemy import select
+from werkzeug.utils import secure_filename
+
+import background
+from app import db
+from models import (ChangeVersion, Lead, LeadDailyRollup, LeadEvent, LeadImport, LeadStatusChange, LEADS_VERSION,
+                    PhoneKey, PipelineCounter)
+from utils import normalize_phone
+
+try:
+    from openpyxl import load_workbook
+except ImportError:  # Excel support is optional; CSV always works
+    load_workbook = None
+
+CHUNK_SIZE = 1000
+MAX_STORED_ERRORS = 1000
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y')
+
+# Accepted header spellings, compared lower-cased with underscores as spaces
+HEADER_ALIASES = {
+    'name': ('name', 'full name', 'lead name', 'customer name'),
+    'phone': ('phone', 'phone number', 'mobile', 'mobile number', 'contact number'),
+    'whatsapp': ('whatsapp', 'whatsapp number'),
+    'email': ('email', 'email address', 'e-mail'),
+    'course': ('course', 'course interest', 'course interest id'),
+    'lead_source': ('lead source', 'source'),
+    'status': ('status',),
+    'quoted_amount': ('quoted amount', 'amount'),
+    'next_followup_date': ('next followup date', 'next follow-up date', 'followup date', 'follow-up date'),
+    'followup_type': ('followup type', 'follow-up type'),
+    'comments': ('comments', 'comment', 'notes'),
+}
+HEADER_LOOKUP = {alias: field for field, aliases in HEADER_ALIASES.items() for alias in aliases}
+
+
+class LeadImportError(Exception):
+    """The uploaded file cannot be imported at all"""
+
+
+def form_choices(form):
+    """Snapshot a LeadForm's choices so rows can be validated without building a form per row"""
+    return {
+        'lead_source': [value for value, _ in form.lead_source.choices],
+        'status': [value for value, _ in form.status.choices],
+        'followup_type': [value for value, _ in form.followup_type.choices],
+        'courses': [(course_id, name) for course_id, name in form.course_interest_id.choices if course_id],
+    }
+
+
+def _text(value):
+    """Cell value as a stripped string; Excel stores phone numbers as floats"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+class LeadRowValidator:
+    """Applies the LeadForm field rules to one import row at a time"""
+
+    def __init__(self, choices):
+        self.lead_sources = {value.lower(): value for value in choices['lead_source']}
+        self.statuses = {value.lower(): value for value in choices['status']}
+        self.followup_types = {value.lower(): value for value in choices['followup_type']}
+        self.courses = {}
+        for course_id, name in choices['courses']:
+            self.courses[str(course_id)] = course_id
+            self.courses[name.strip().lower()] = course_id
+
+    def _choice(self, values, field, choices, label, errors):
+        value = _text(values.get(field))
+        if not value:
+            return None
+        if value.lower() not in choices:
+            errors.append(f'{label} "{value}" is not a valid choice.')
+            return None
+        return choices[value.lower()]
+
+    def validate(self, values):
+        """Return (lead column values, normalized phone keys, error messages) for a row"""
+        errors = []
+
+        name = _text(values.get('name'))
+        if not name:
+            errors.append('Name is required.')
+        elif len(name) > 100:
+            errors.append('Name must be at most 100 characters.')
+
+        phone = _text(values.get('phone'))
+        whatsapp = _text(values.get('whatsapp'))
+        if not phone:
+            errors.append('Phone is required.')
+        elif len(phone) > 20:
+            errors.append('Phone must be at most 20 characters.')
+        if len(whatsapp) > 20:
+            errors.append('WhatsApp must be at most 20 characters.')
+        keys = {normalize_phone(number) for number in (phone, whatsapp) if number}
+        keys.discard(None)
+        if phone and not normalize_phone(phone):
+            errors.append('Phone must contain digits.')
+
+        email = _text(values.get('email'))
+        if email:
+            if len(email) > 120:
+                errors.append('Email must be at most 120 characters.')
+            else:
+                try:
+                    validate_email(email, check_deliverability=False)
+                except EmailNotValidError:
+                    errors.append(f'Email "{email}" is not a valid email address.')
+
+        course_interest_id = None
+        course = _text(values.get('course'))
+        if course:
+            course_interest_id = self.courses.get(course.lower())
+            if course_interest_id is None:
+                errors.append(f'Course "{course}" is not an active course.')
+
+        quoted_amount = 0.0
+        amount = _text(values.get('quoted_amount')).replace(',', '')
+        if amount:
+            try:
+                quoted_amount = float(amount)
+                if quoted_amount < 0:
+                    errors.append('Quoted Amount must be at least 0.')
+            except ValueError:
+                errors.append(f'Quoted Amount "{amount}" is not a number.')
+
+        next_followup_date = None
+        followup = values.get('next_followup_date')
+        if followup not in (None, ''):
+            next_followup_date = _parse_date(followup if isinstance(followup, date) else _text(followup))
+            if next_followup_date is None:
+                errors.append(f'Next Follow-up Date "{_text(followup)}" is not a valid date.')
+
+        lead = {
+            'name': name,
+            'phone': phone,
+            'whatsapp': whatsapp or None,
+            'email': email or None,
+            'course_interest_id': course_interest_id,
+            'lead_source': self._choice(values, 'lead_source', self.lead_sources, 'Lead Source', errors),
+            'status': self._choice(values, 'status', self.statuses, 'Status', errors) or 'New',
+            'quoted_amount': quoted_amount,
+            'next_followup_date': next_followup_date,
+            'followup_type': self._choice(values, 'followup_type', self.followup_types, 'Follow-up Type', errors),
+            'comments': _text(values.get('comments')) or None,
+        }
+        return lead, keys, errors
+
+
+def _column_map(header):
+    """Map each column position to a lead field (or None to ignore it)"""
+    columns = [HEADER_LOOKUP.get(_text(cell).lower().replace('_', ' ')) for cell in header]
+    if 'name' not in columns or 'phone' not in columns:
+        raise LeadImportError('The file must have a header row with at least Name and Phone columns.')
+    return columns
+
+
+def _csv_rows(path):
+    """Yield (row number, values, fraction of the file read) from a CSV file"""
+    size = os.path.getsize(path) or 1
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+        reader = csv.reader(f)
+        columns = _column_map(next(reader, []))
+        for cells in reader:
+            if not any(cell.strip() for cell in cells):
+                continue
+            values = {field: cell for field, cell in zip(columns, cells) if field}
+            yield reader.line_num, values, min(f.buffer.tell() / size, 1.0)
+
+
+def _xlsx_rows(path):
+    """Yield (row number, values, fraction of the sheet read) from the first sheet of a workbook"""
+    if load_workbook is None:
+        raise LeadImportError('Excel imports need the openpyxl package. Please upload a CSV file instead.')
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        total = sheet.max_row or 0
+        rows = sheet.iter_rows(values_only=True)
+        columns = _column_map(next(rows, ()))
+        for row_number, cells in enumerate(rows, start=2):
+            if all(cell in (None, '') for cell in cells):
+                continue
+            values = {field: cell for field, cell in zip(columns, cells) if field}
+            yield row_number, values, min(row_number / total, 1.0) if total else 0.0
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    """Stream the rows of an uploaded lead file"""
+    if path.lower().endswith('.xlsx'):
+        return _xlsx_rows(path)
+    return _csv_rows(path)
+
+
+class LeadImporter:
+    """Runs one LeadImport job, CHUNK_SIZE rows at a time"""
+
+    def __init__(self, job, choices):
+        self.job = job
+        self.validator = LeadRowValidator(choices)
+        self.seen_keys = set()  # Phone keys already imported from this file
+        self.errors = []
+        self.last_id = 0  # Highest lead id inserted so far by this import
+
+    def _row_error(self, row_number, messages):
+        self.job.error_count = (self.job.error_count or 0) + 1
+        if len(self.errors) < MAX_STORED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': messages})
+
+    def run(self):
+        chunk = []
+        for row_number, values, fraction in read_rows(self.job.file_path):
+            self.job.processed_rows = (self.job.processed_rows or 0) + 1
+            lead, keys, messages = self.validator.validate(values)
+            if messages:
+                self._row_error(row_number, messages)
+            else:
+                chunk.append((row_number, lead, keys))
+            if len(chunk) >= CHUNK_SIZE:
+                self._flush(chunk, fraction)
+                chunk = []
+        self._flush(chunk, 1.0)
+
+    def _flush(self, chunk, fraction):
+        """Dedupe and insert a chunk, then commit it together with the job's progress"""
+        existing = PhoneKey.lookup({key for _, _, keys in chunk for key in keys}, entity_type='lead')
+        new_leads = []
+        for row_number, lead, keys in chunk:
+            matches = [existing[key][0][1] for key in keys if existing.get(key)]
+            if matches:
+                self.job.duplicate_count = (self.job.duplicate_count or 0) + 1
+                self._row_error(row_number, [f'Duplicate of existing lead #{matches[0]} (same phone or WhatsApp).'])
+            elif keys & self.seen_keys:
+                self.job.duplicate_count = (self.job.duplicate_count or 0) + 1
+                self._row_error(row_number, ['Duplicate of an earlier row in this file (same phone or WhatsApp).'])
+            else:
+                self.seen_keys.update(keys)
+                new_leads.append(lead)
+
+        if new_leads:
+            self._insert(new_leads)
+
+        self.job.progress = int(fraction * 100)
+        self.job.errors = json.dumps(self.errors) if self.errors else None
+        db.session.commit()
+
+    def _insert(self, leads):
+        now = datetime.utcnow()
+        for lead in leads:
+            lead.update(
+                assigned_to=self.job.assigned_to,
+                added_by=self.job.created_by_id,
+                import_id=self.job.id,
+                search_phone=Lead.build_search_phone(lead['phone'], lead['whatsapp']),
+                created_at=now
+            )
+        table = Lead.__table__
+        db.session.execute(table.insert(), leads)
+
+        deltas, rollup_deltas = {}, {}
+        for lead in leads:
+            PipelineCounter.add_delta(deltas, PipelineCounter.key_for(lead['added_by'], lead['status']),
+                                      1, lead['quoted_amount'])
+            key = LeadDailyRollup.key_for(now, lead['lead_source'], lead['status'], lead['added_by'])
+            rollup_deltas[key] = rollup_deltas.get(key, 0) + 1
+        PipelineCounter.apply(db.session.connection(), deltas)
+        LeadDailyRollup.apply(db.session.connection(), rollup_deltas)
+        ChangeVersion.bump(db.session.connection(), LEADS_VERSION)
+
+        # Read back the new ids (RETURNING is not available for executemany on MySQL)
+        inserted = db.session.execute(
+            select(table.c.id, table.c.phone, table.c.whatsapp, table.c.status)
+            .where(table.c.import_id == self.job.id, table.c.id > self.last_id)
+            .order_by(table.c.id)
+        ).all()
+        phone_keys = []
+        for lead_id, phone, whatsapp, status in inserted:
+            for field, number in (('phone', phone), ('whatsapp', whatsapp)):
+                key = normalize_phone(number)
+                if key:
+                    phone_keys.append({'phone_key': key, 'entity_type': 'lead',
+                                       'entity_id': lead_id, 'field': field})
+        if phone_keys:
+            db.session.execute(PhoneKey.__table__.insert(), phone_keys)
+        LeadStatusChange.record(db.session.connection(), [
+            {'lead_id': row.id, 'from_status': None, 'to_status': row.status, 'changed_at': now} for row in inserted
+        ])
+
+        if inserted:
+            self.last_id = inserted[-1].id
+            LeadEvent.record(db.session.connection(), 'pipeline_changed', {
+                'action': 'import', 'import_id': self.job.id, 'count': len(inserted)
+            })
+        self.job.imported_count = (self.job.imported_count or 0) + len(inserted)
+
+
+def run_import(import_id, choices):
+    """Background entry point: import the file of a pending LeadImport"""
+    job = db.session.get(LeadImport, import_id)
+    if job is None or job.status != 'pending':
+        return
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    try:
+        LeadImporter(job, choices).run()
+        job.status = 'completed'
+        job.progress = 100
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error importing leads from {job.filename}: {str(e)}")
+        job = db.session.get(LeadImport, import_id)
+        job.status = 'failed'
+        job.message = str(e) if isinstance(e, LeadImportError) else \
+            'The import stopped because of an unexpected error. Rows imported before it are kept.'
+
+    if job.file_path and os.path.exists(job.file_path):
+        os.remove(job.file_path)
+    job.file_path = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def start_import(upload, user_id, assigned_to, choices):
+    """Save an uploaded file, create its LeadImport job and start it in the background"""
+    extension = upload.filename.rsplit('.', 1)[-1].lower()
+    folder = os.path.join(current_app.instance_path, 'imports')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{uuid.uuid4().hex}.{extension}")
+    upload.save(path)
+
+    job = LeadImport(
+        filename=secure_filename(upload.filename) or f"leads.{extension}",
+        file_path=path,
+        assigned_to=assigned_to,
+        created_by_id=user_id
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    background.submit_long(run_import, job.id, choices)
+    return job
@@ -0,0 +1,177 @@
+"""
+Typeahead lookups for Training Center CRM
+
+Forms no longer render every lead and student as an ``<option>``; their
+selects are filled from ``/api/lookup/<lookup_type>`` as the user types.
+Each lookup is a role-scoped, index-backed prefix search returning at most
+LOOKUP_LIMIT rows, and ``resolve_lookup`` checks a submitted id with a
+single scoped query instead of loading the whole choice list.
+
+Prefix searches use ``LIKE 'term%'``.  MySQL serves that from a plain index
+(its default collation is case-insensitive); SQLite only does so when the
+index uses the NOCASE collation, so the indexes are not declared on the
+models: migration f1a8c4d09e37 creates them per dialect, and
+migrations/env.py keeps autogenerate from dropping them.
+"""
+import re
+
+from flask_login import current_user
+
+from app import db
+from models import Course, Lead, PhoneKey, Student, User
+from utils import normalize_phone
+
+LOOKUP_LIMIT = 20
+MAX_LOOKUP_LIMIT = 50
+
+# (index name, table, column), created by migration f1a8c4d09e37
+LOOKUP_INDEXES = [
+    ('ix_lead_name', 'lead', 'name'),
+    ('ix_student_first_name', 'student', 'first_name'),
+    ('ix_student_last_name', 'student', 'last_name'),
+    ('ix_course_name', 'course', 'name'),
+]
+
+
+def _prefix(column, term):
+    """Case-insensitive, index-backed "starts with" filter"""
+    escaped = re.sub(r'([\\%_])', r'\\\1', term)
+    return column.like(f'{escaped}%', escape='\\')
+
+
+def _phone_prefixes(term):
+    """phone_key prefixes for phone-like input, or [] when the term is not a number"""
+    if not re.fullmatch(r'[\d\s+()\-]+', term):
+        return []
+    digits = re.sub(r'\D', '', term)
+    if len(digits) < 3:
+        return []
+    # Typed either in international form or as a national number
+    return sorted({f'+{digits.lstrip("0")}', normalize_phone(term)})
+
+
+def _phone_matches(entity_type, term):
+    prefixes = _phone_prefixes(term)
+    if not prefixes:
+        return None
+    # Keys are "+" and digits only, so a range on ix_phone_key_lookup covers the prefix
+    # (":" sorts right after "9") without depending on the column's collation
+    return db.session.query(PhoneKey.entity_id).filter(
+        db.or_(*[db.and_(PhoneKey.phone_key >= prefix, PhoneKey.phone_key < prefix + ':')
+                 for prefix in prefixes]),
+        PhoneKey.entity_type == entity_type
+    )
+
+
+def _lead_query(user, open_only=False):
+    query = Lead.query
+    if not (user.is_admin() or user.can_view_all_leads):
+        # Consultants may pick the leads assigned to them and the ones they added
+        query = query.filter(db.or_(Lead.assigned_to == user.id, Lead.added_by == user.id))
+    if open_only:
+        query = query.filter(Lead.status != 'Converted')
+    return query
+
+
+def _lead_search(query, term):
+    phone_matches = _phone_matches('lead', term)
+    if phone_matches is not None:
+        return query.filter(Lead.id.in_(phone_matches))
+    return query.filter(_prefix(Lead.name, term))
+
+
+def _lead_item(lead):
+    return {'id': lead.id, 'text': f"{lead.name} ({lead.phone})" if lead.phone else lead.name}
+
+
+def _student_query(user, active_only=False):
+    query = Student.query
+    if active_only:
+        query = query.filter(Student.status == 'Active')
+    return query
+
+
+def _student_search(query, term):
+    phone_matches = _phone_matches('student', term)
+    if phone_matches is not None:
+        return query.filter(Student.id.in_(phone_matches))
+    first, _, last = term.partition(' ')
+    if last.strip():
+        return query.filter(_prefix(Student.first_name, first), _prefix(Student.last_name, last.strip()))
+    return query.filter(db.or_(_prefix(Student.first_name, term), _prefix(Student.last_name, term)))
+
+
+def _student_item(student):
+    return {'id': student.id, 'text': student.name}
+
+
+def _course_query(user, **filters):
+    return Course.query.filter(Course.is_active == True)
+
+
+def _course_item(course):
+    return {'id': course.id, 'text': course.name}
+
+
+def _consultant_query(user, **filters):
+    return User.query.filter(User.role == 'consultant', User.active == True)
+
+
+def _consultant_item(consultant):
+    return {'id': consultant.id, 'text': consultant.username}
+
+
+# lookup type: (model, scoped query(user, **filters), search(query, term), order column, item(row))
+LOOKUP_TYPES = {
+    'leads': (Lead, _lead_query, _lead_search, Lead.name, _lead_item),
+    'students': (Student, _student_query, _student_search, Student.first_name, _student_item),
+    'courses': (Course, _course_query, lambda query, term: query.filter(_prefix(Course.name, term)),
+                Course.name, _course_item),
+    'consultants': (User, _consultant_query, lambda query, term: query.filter(_prefix(User.username, term)),
+                    User.username, _consultant_item),
+}
+
+# Query string flags accepted by /api/lookup/<lookup_type>, per lookup type
+LOOKUP_FILTERS = {
+    'leads': ('open_only',),
+    'students': ('active_only',),
+}
+
+
+def lookup_filters(lookup_type, args):
+    """Pick the lookup type's filter flags out of request args (e.g. ?open_only=1)"""
+    return {name: args.get(name) in ('1', 'true') for name in LOOKUP_FILTERS.get(lookup_type, ())}
+
+
+def search_lookup(lookup_type, term, user=None, limit=LOOKUP_LIMIT, **filters):
+    """
+    Prefix search for a typeahead
+
+    Args:
+        lookup_type (str): One of LOOKUP_TYPES
+        term (str): What the user typed; an empty term returns the first rows alphabetically
+        user: User whose role scoping applies (defaults to current_user)
+        limit (int): Maximum number of results, capped at MAX_LOOKUP_LIMIT
+
+    Returns:
+        list: [{'id', 'text'}] ordered by name; raises ValueError for an unknown type
+    """
+    if lookup_type not in LOOKUP_TYPES:
+        raise ValueError(f"Unknown lookup type: {lookup_type}")
+    model, scoped_query, search, order_column, item = LOOKUP_TYPES[lookup_type]
+    query = scoped_query(user or current_user, **filters)
+    term = (term or '').strip()
+    if term:
+        query = search(query, term)
+    limit = max(1, min(limit or LOOKUP_LIMIT, MAX_LOOKUP_LIMIT))
+    return [item(row) for row in query.order_by(order_column, model.id).limit(limit)]
+
+
+def resolve_lookup(lookup_type, item_id, user=None, **filters):
+    """Return the {'id', 'text'} item for an id the user may pick, or None"""
+    if lookup_type not in LOOKUP_TYPES:
+        raise ValueError(f"Unknown lookup type: {lookup_type}")
+    model, scoped_query, search, order_column, item = LOOKUP_TYPES[lookup_type]
+    row = scoped_query(user or current_user, **filters).filter(model.id == item_id).first()
+    return item(row) if row else None
+
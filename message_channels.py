@@ -0,0 +1,108 @@
+"""
+Delivery channels for bulk messages (see bulk_messaging.py)
+
+A channel takes a chunk of rendered messages and reports, per message,
+whether it was accepted:
+
+- EmailChannel queues the whole chunk in the email outbox with one INSERT,
+  committed with the chunk's recipient statuses; email_outbox.py sends it
+  over pooled SMTP connections and records the delivery of each email
+- HTTPGatewayChannel posts each message to an SMS or WhatsApp gateway
+  (SMS_API_URL / WHATSAPP_API_URL, with a bearer token), MESSAGE_WORKERS at
+  a time, through payment_gateway's pooled, rate-limited and retrying
+  client.  The recipient's id is sent as the Idempotency-Key, so a retried
+  call cannot deliver a message twice.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from email_outbox import queue_emails, schedule_send
+from payment_gateway import provider_request, requests
+
+MESSAGE_WORKERS = 16  # Gateway calls in flight per send
+
+
+class ChannelUnavailable(Exception):
+    """The channel is not configured, so nothing should be sent through it"""
+
+
+class EmailChannel:
+    name = 'Email'
+    missing_address = 'No email address'
+
+    def address(self, recipient):
+        return recipient['email']
+
+    def send(self, messages):
+        """Queue messages (dicts with id, address, subject, body); returns {id: None} as all are accepted"""
+        queue_emails([{'to_email': message['address'], 'subject': message['subject'] or '',
+                       'body': message['body']} for message in messages], commit=False)
+        return {message['id']: None for message in messages}
+
+    def committed(self):
+        """The chunk's transaction committed: wake the outbox sender"""
+        schedule_send()
+
+    def close(self):
+        pass
+
+
+class HTTPGatewayChannel:
+    """Text messages through a JSON gateway: POST {"to": ..., "body": ...} to <PREFIX>_API_URL"""
+
+    def __init__(self, name, setting_prefix):
+        self.name = name
+        self.missing_address = 'No WhatsApp or phone number' if name == 'WhatsApp' else 'No phone number'
+        self.client_name = setting_prefix.lower()
+        self.url = current_app.config.get(f'{setting_prefix}_API_URL')
+        self.token = current_app.config.get(f'{setting_prefix}_API_TOKEN')
+        if not requests:
+            raise ChannelUnavailable('Requests library not available')
+        if not (self.url and self.token):
+            raise ChannelUnavailable(f'{name} sending is not configured ({setting_prefix}_API_URL and '
+                                     f'{setting_prefix}_API_TOKEN).')
+        self.pool = ThreadPoolExecutor(max_workers=MESSAGE_WORKERS, thread_name_prefix='crm-messages')
+
+    def address(self, recipient):
+        if self.name == 'WhatsApp':
+            return recipient['whatsapp'] or recipient['phone']
+        return recipient['phone']
+
+    def _send_one(self, message):
+        try:
+            response = provider_request(self.client_name, 'POST', self.url,
+                                        idempotency_key=f"message-recipient-{message['id']}",
+                                        headers={'Authorization': f'Bearer {self.token}'},
+                                        json={'to': message['address'], 'body': message['body']})
+        except requests.exceptions.RequestException as e:
+            return str(e) or 'Gateway unreachable'
+        if response.status_code >= 300:
+            return f'Gateway error: HTTP {response.status_code}'
+        return None
+
+    def send(self, messages):
+        """Post messages concurrently; returns {id: None if accepted, else the error}"""
+        return {message['id']: error for message, error in zip(messages, self.pool.map(self._send_one, messages))}
+
+    def committed(self):
+        pass
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def channel_for(message_type):
+    """
+    The channel for a template's message type
+
+    Raises:
+        ChannelUnavailable: Unknown type, or the gateway is not configured
+    """
+    if message_type == 'Email':
+        return EmailChannel()
+    if message_type == 'SMS':
+        return HTTPGatewayChannel('SMS', 'SMS')
+    if message_type == 'WhatsApp':
+        return HTTPGatewayChannel('WhatsApp', 'WHATSAPP')
+    raise ChannelUnavailable(f'Unknown message type: {message_type}')
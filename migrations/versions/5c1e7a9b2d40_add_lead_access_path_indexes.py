@@ -0,0 +1,40 @@
+"""Add lead access path indexes
+
+Revision ID: 5c1e7a9b2d40
+Revises: 1a43664bd6f4
+Create Date: 2026-10-17 09:12:44.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e7a9b2d40'
+down_revision = '1a43664bd6f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('lead', schema=None) as batch_op:
+        batch_op.create_index('ix_lead_assigned_to_created_at', ['assigned_to', 'created_at'], unique=False)
+        batch_op.create_index('ix_lead_added_by_status', ['added_by', 'status'], unique=False)
+        batch_op.create_index('ix_lead_added_by_created_at', ['added_by', 'created_at'], unique=False)
+        batch_op.create_index('ix_lead_status_created_at', ['status', 'created_at'], unique=False)
+        batch_op.create_index('ix_lead_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_lead_next_followup', ['next_followup_date', 'followup_time'], unique=False)
+        batch_op.create_index('ix_lead_phone', ['phone'], unique=False)
+        batch_op.create_index('ix_lead_whatsapp', ['whatsapp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('lead', schema=None) as batch_op:
+        batch_op.drop_index('ix_lead_whatsapp')
+        batch_op.drop_index('ix_lead_phone')
+        batch_op.drop_index('ix_lead_next_followup')
+        batch_op.drop_index('ix_lead_created_at')
+        batch_op.drop_index('ix_lead_status_created_at')
+        batch_op.drop_index('ix_lead_added_by_created_at')
+        batch_op.drop_index('ix_lead_added_by_status')
+        batch_op.drop_index('ix_lead_assigned_to_created_at')
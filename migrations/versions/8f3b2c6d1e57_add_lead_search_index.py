@@ -0,0 +1,80 @@
+"""Add lead search index
+
+Revision ID: 8f3b2c6d1e57
+Revises: 5c1e7a9b2d40
+Create Date: 2026-10-17 10:41:09.552871
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3b2c6d1e57'
+down_revision = '5c1e7a9b2d40'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS lead_fts USING fts5("
+    "name, email, search_phone, content='lead', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS lead_fts_ai AFTER INSERT ON lead BEGIN "
+    "INSERT INTO lead_fts(rowid, name, email, search_phone) "
+    "VALUES (new.id, new.name, new.email, new.search_phone); END",
+    "CREATE TRIGGER IF NOT EXISTS lead_fts_ad AFTER DELETE ON lead BEGIN "
+    "INSERT INTO lead_fts(lead_fts, rowid, name, email, search_phone) "
+    "VALUES ('delete', old.id, old.name, old.email, old.search_phone); END",
+    "CREATE TRIGGER IF NOT EXISTS lead_fts_au AFTER UPDATE OF name, email, search_phone ON lead BEGIN "
+    "INSERT INTO lead_fts(lead_fts, rowid, name, email, search_phone) "
+    "VALUES ('delete', old.id, old.name, old.email, old.search_phone); "
+    "INSERT INTO lead_fts(rowid, name, email, search_phone) "
+    "VALUES (new.id, new.name, new.email, new.search_phone); END",
+]
+
+
+def upgrade():
+    with op.batch_alter_table('lead', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_phone', sa.String(length=50), nullable=True))
+
+    # Backfill the digits-only phone tokens in chunks
+    bind = op.get_bind()
+    lead = sa.table('lead', sa.column('id'), sa.column('phone'), sa.column('whatsapp'), sa.column('search_phone'))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(lead.c.id, lead.c.phone, lead.c.whatsapp)
+            .where(lead.c.id > last_id).order_by(lead.c.id).limit(1000)
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            digits = [re.sub(r'\D', '', n) for n in (row.phone, row.whatsapp) if n]
+            bind.execute(
+                lead.update().where(lead.c.id == row.id)
+                .values(search_phone=' '.join(d for d in digits if d) or None)
+            )
+        last_id = rows[-1].id
+
+    if bind.dialect.name == 'sqlite':
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO lead_fts(lead_fts) VALUES ('rebuild')")
+    elif bind.dialect.name == 'mysql':
+        op.execute("ALTER TABLE lead ADD FULLTEXT INDEX ft_lead_search (name, email, search_phone) WITH PARSER ngram")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS lead_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS lead_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS lead_fts_ai")
+        op.execute("DROP TABLE IF EXISTS lead_fts")
+    elif bind.dialect.name == 'mysql':
+        op.execute("ALTER TABLE lead DROP INDEX ft_lead_search")
+
+    with op.batch_alter_table('lead', schema=None) as batch_op:
+        batch_op.drop_column('search_phone')
@@ -0,0 +1,29 @@
+"""Add reference_version table
+
+Revision ID: a3f6b81c5d92
+Revises: f1a8c4d09e37
+Create Date: 2026-10-17 16:51:03.774120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f6b81c5d92'
+down_revision = 'f1a8c4d09e37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    reference_version = op.create_table('reference_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(reference_version, [{'id': 1, 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('reference_version')
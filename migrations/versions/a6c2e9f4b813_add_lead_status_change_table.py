@@ -0,0 +1,45 @@
+"""Add lead_status_change table for funnel and time-to-convert analytics
+
+Revision ID: a6c2e9f4b813
+Revises: f5b1d8e3a924
+Create Date: 2026-10-17 20:51:37.205846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c2e9f4b813'
+down_revision = 'f5b1d8e3a924'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    lead_status_change = op.create_table('lead_status_change',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('lead_id', sa.Integer(), nullable=False),
+        sa.Column('from_status', sa.String(length=20), nullable=True),
+        sa.Column('to_status', sa.String(length=20), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # Earlier history was never recorded: start every lead at its current status
+    lead = sa.table('lead', sa.column('id'), sa.column('status'), sa.column('created_at'))
+    op.execute(
+        lead_status_change.insert().from_select(
+            ['lead_id', 'from_status', 'to_status', 'changed_at'],
+            sa.select(lead.c.id, sa.null(), lead.c.status, sa.func.coalesce(lead.c.created_at, sa.func.now()))
+            .where(lead.c.status.isnot(None))
+        )
+    )
+
+    # Build the index after the backfill rather than maintaining it row by row
+    op.create_index('ix_lead_status_change_lead_id', 'lead_status_change', ['lead_id', 'changed_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_lead_status_change_lead_id', table_name='lead_status_change')
+    op.drop_table('lead_status_change')
@@ -0,0 +1,58 @@
+"""Add message_campaign and message_recipient tables for bulk messaging
+
+Revision ID: a7e2c4f9b351
+Revises: f3a8d5c1e276
+Create Date: 2026-10-18 01:36:27.580143
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e2c4f9b351'
+down_revision = 'f3a8d5c1e276'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('message_campaign',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('template_id', sa.Integer(), nullable=True),
+        sa.Column('template_name', sa.String(length=100), nullable=False),
+        sa.Column('message_type', sa.String(length=20), nullable=False),
+        sa.Column('course_id', sa.Integer(), nullable=True),
+        sa.Column('audience', sa.String(length=200), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('total_count', sa.Integer(), nullable=True),
+        sa.Column('sent_count', sa.Integer(), nullable=True),
+        sa.Column('failed_count', sa.Integer(), nullable=True),
+        sa.Column('skipped_count', sa.Integer(), nullable=True),
+        sa.Column('message', sa.Text(), nullable=True),
+        sa.Column('created_by_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['course_id'], ['course.id'], ),
+        sa.ForeignKeyConstraint(['created_by_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['template_id'], ['message_template.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('message_recipient',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('campaign_id', sa.Integer(), nullable=False),
+        sa.Column('lead_id', sa.Integer(), nullable=False),
+        sa.Column('address', sa.String(length=254), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('error', sa.String(length=300), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['campaign_id'], ['message_campaign.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('campaign_id', 'lead_id', name='uq_message_recipient_campaign_lead')
+    )
+
+
+def downgrade():
+    op.drop_table('message_recipient')
+    op.drop_table('message_campaign')
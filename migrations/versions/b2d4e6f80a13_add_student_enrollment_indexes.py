@@ -0,0 +1,30 @@
+"""Add student enrollment indexes
+
+Revision ID: b2d4e6f80a13
+Revises: 8f3b2c6d1e57
+Create Date: 2026-10-17 12:05:31.904116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d4e6f80a13'
+down_revision = '8f3b2c6d1e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.create_index('ix_student_enrollment_date', ['enrollment_date'], unique=False)
+        batch_op.create_index('ix_student_course_id_enrollment_date', ['course_id', 'enrollment_date'], unique=False)
+        batch_op.create_index('ix_student_status_enrollment_date', ['status', 'enrollment_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('student', schema=None) as batch_op:
+        batch_op.drop_index('ix_student_status_enrollment_date')
+        batch_op.drop_index('ix_student_course_id_enrollment_date')
+        batch_op.drop_index('ix_student_enrollment_date')
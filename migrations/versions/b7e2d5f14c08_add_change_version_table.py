@@ -0,0 +1,47 @@
+"""Replace reference_version with keyed change_version rows
+
+Revision ID: b7e2d5f14c08
+Revises: a3f6b81c5d92
+Create Date: 2026-10-17 17:24:46.215839
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d5f14c08'
+down_revision = 'a3f6b81c5d92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    change_version = op.create_table('change_version',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    reference_version = sa.table('reference_version', sa.column('id'), sa.column('version'))
+    current = op.get_bind().execute(
+        sa.select(reference_version.c.version).where(reference_version.c.id == 1)
+    ).scalar() or 0
+    op.bulk_insert(change_version, [
+        {'name': 'reference_data', 'version': current + 1},
+        {'name': 'leads', 'version': 1},
+    ])
+    op.drop_table('reference_version')
+
+
+def downgrade():
+    reference_version = op.create_table('reference_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    change_version = sa.table('change_version', sa.column('name'), sa.column('version'))
+    current = op.get_bind().execute(
+        sa.select(change_version.c.version).where(change_version.c.name == 'reference_data')
+    ).scalar() or 0
+    op.bulk_insert(reference_version, [{'id': 1, 'version': current + 1}])
+    op.drop_table('change_version')
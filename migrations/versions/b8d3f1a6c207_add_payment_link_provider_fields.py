@@ -0,0 +1,30 @@
+"""Add provider payment id and error to payment_link
+
+Revision ID: b8d3f1a6c207
+Revises: a6c2e9f4b813
+Create Date: 2026-10-17 22:14:09.318544
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d3f1a6c207'
+down_revision = 'a6c2e9f4b813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('payment_link', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('external_payment_id', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('provider_error', sa.String(length=500), nullable=True))
+        batch_op.create_index('ix_payment_link_external_payment_id', ['external_payment_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('payment_link', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_link_external_payment_id')
+        batch_op.drop_column('provider_error')
+        batch_op.drop_column('external_payment_id')
@@ -0,0 +1,32 @@
+"""Add audience and claim columns to message_campaign so interrupted sends can resume
+
+Revision ID: b8d3f1a6c720
+Revises: a7e2c4f9b351
+Create Date: 2026-10-17 04:30:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d3f1a6c720'
+down_revision = 'a7e2c4f9b351'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message_campaign', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('assigned_to', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('lead_status', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('claimed_until', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key('fk_message_campaign_assigned_to', 'user', ['assigned_to'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('message_campaign', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_message_campaign_assigned_to', type_='foreignkey')
+        batch_op.drop_column('claimed_until')
+        batch_op.drop_column('lead_status')
+        batch_op.drop_column('assigned_to')
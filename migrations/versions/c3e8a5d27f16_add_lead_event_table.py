@@ -0,0 +1,36 @@
+"""Add lead_event table for the /api/events push channel
+
+Revision ID: c3e8a5d27f16
+Revises: b7e2d5f14c08
+Create Date: 2026-10-17 18:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8a5d27f16'
+down_revision = 'b7e2d5f14c08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('lead_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event_type', sa.String(length=30), nullable=False),
+        sa.Column('lead_id', sa.Integer(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('lead_event', schema=None) as batch_op:
+        batch_op.create_index('ix_lead_event_created_at', ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('lead_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_lead_event_created_at')
+
+    op.drop_table('lead_event')
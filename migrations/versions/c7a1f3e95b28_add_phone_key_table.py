@@ -0,0 +1,95 @@
+"""Add phone_key table
+
+Revision ID: c7a1f3e95b28
+Revises: b2d4e6f80a13
+Create Date: 2026-10-17 13:27:50.118342
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a1f3e95b28'
+down_revision = 'b2d4e6f80a13'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def normalize_phone(phone, country_code='+971'):
+    # Frozen copy of utils.normalize_phone as of this revision
+    if not phone:
+        return None
+    raw = phone.strip()
+    digits = re.sub(r'\D', '', raw)
+    if not digits:
+        return None
+    country_digits = re.sub(r'\D', '', country_code or '') or '971'
+    if raw.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith('0'):
+        digits = country_digits + digits.lstrip('0')
+    elif not (digits.startswith(country_digits) and len(digits) > len(country_digits) + 7):
+        digits = country_digits + digits
+    return f"+{digits}"
+
+
+# (table, entity_type, [(field, country code column or None)])
+SOURCES = [
+    ('lead', 'lead', [('phone', None), ('whatsapp', None)]),
+    ('student', 'student', [('phone', 'country_code')]),
+    ('corporate_training', 'corporate_training', [('contact_person_phone', 'contact_person_country_code')]),
+]
+
+
+def upgrade():
+    phone_key = op.create_table('phone_key',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('phone_key', sa.String(length=32), nullable=False),
+        sa.Column('entity_type', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('field', sa.String(length=30), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('entity_type', 'entity_id', 'field', name='uq_phone_key_entity_field')
+    )
+
+    # Backfill in id-ordered chunks, one executemany per chunk
+    bind = op.get_bind()
+    for table_name, entity_type, fields in SOURCES:
+        columns = {'id'} | {f for f, _ in fields} | {c for _, c in fields if c}
+        source = sa.table(table_name, *[sa.column(c) for c in sorted(columns)])
+        last_id = 0
+        while True:
+            rows = bind.execute(
+                sa.select(source).where(source.c.id > last_id).order_by(source.c.id).limit(BATCH_SIZE)
+            ).fetchall()
+            if not rows:
+                break
+            keys = []
+            for row in rows:
+                for field, country_column in fields:
+                    country_code = getattr(row, country_column) if country_column else None
+                    key = normalize_phone(getattr(row, field), country_code or '+971')
+                    if key:
+                        keys.append({'phone_key': key, 'entity_type': entity_type,
+                                     'entity_id': row.id, 'field': field})
+            if keys:
+                op.bulk_insert(phone_key, keys)
+            last_id = rows[-1].id
+
+    # Build the lookup index after the backfill rather than maintaining it row by row
+    with op.batch_alter_table('phone_key', schema=None) as batch_op:
+        batch_op.create_index('ix_phone_key_lookup', ['phone_key', 'entity_type', 'entity_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('phone_key', schema=None) as batch_op:
+        batch_op.drop_index('ix_phone_key_lookup')
+
+    op.drop_table('phone_key')
@@ -0,0 +1,25 @@
+"""Add payment_link status index for reconciliation
+
+Revision ID: c9e4a2b7d318
+Revises: b8d3f1a6c207
+Create Date: 2026-10-17 23:02:41.586127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4a2b7d318'
+down_revision = 'b8d3f1a6c207'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Pending links in id order: the index carries the primary key after status
+    op.create_index('ix_payment_link_status', 'payment_link', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_payment_link_status', table_name='payment_link')
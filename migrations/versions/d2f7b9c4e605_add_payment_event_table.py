@@ -0,0 +1,36 @@
+"""Add payment_event table for provider webhooks
+
+Revision ID: d2f7b9c4e605
+Revises: c9e4a2b7d318
+Create Date: 2026-10-17 23:41:18.902734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f7b9c4e605'
+down_revision = 'c9e4a2b7d318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('payment_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('provider', sa.String(length=20), nullable=False),
+        sa.Column('event_key', sa.String(length=200), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('received_at', sa.DateTime(), nullable=False),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.Column('outcome', sa.String(length=100), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('provider', 'event_key', name='uq_payment_event_provider_key')
+    )
+    op.create_index('ix_payment_event_processed_at', 'payment_event', ['processed_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_payment_event_processed_at', table_name='payment_event')
+    op.drop_table('payment_event')
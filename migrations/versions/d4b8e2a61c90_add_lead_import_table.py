@@ -0,0 +1,77 @@
+"""Add lead_import table and lead.import_id
+
+Revision ID: d4b8e2a61c90
+Revises: c7a1f3e95b28
+Create Date: 2026-10-17 14:05:12.603911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b8e2a61c90'
+down_revision = 'c7a1f3e95b28'
+branch_labels = None
+depends_on = None
+
+# SQLite batch mode recreates the lead table, which drops the search index triggers
+SQLITE_FTS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS lead_fts_ai AFTER INSERT ON lead BEGIN "
+    "INSERT INTO lead_fts(rowid, name, email, search_phone) "
+    "VALUES (new.id, new.name, new.email, new.search_phone); END",
+    "CREATE TRIGGER IF NOT EXISTS lead_fts_ad AFTER DELETE ON lead BEGIN "
+    "INSERT INTO lead_fts(lead_fts, rowid, name, email, search_phone) "
+    "VALUES ('delete', old.id, old.name, old.email, old.search_phone); END",
+    "CREATE TRIGGER IF NOT EXISTS lead_fts_au AFTER UPDATE OF name, email, search_phone ON lead BEGIN "
+    "INSERT INTO lead_fts(lead_fts, rowid, name, email, search_phone) "
+    "VALUES ('delete', old.id, old.name, old.email, old.search_phone); "
+    "INSERT INTO lead_fts(rowid, name, email, search_phone) "
+    "VALUES (new.id, new.name, new.email, new.search_phone); END",
+]
+
+
+def restore_search_triggers():
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_TRIGGERS:
+            op.execute(statement)
+
+
+def upgrade():
+    op.create_table('lead_import',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('file_path', sa.String(length=500), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('progress', sa.Integer(), nullable=True),
+        sa.Column('processed_rows', sa.Integer(), nullable=True),
+        sa.Column('imported_count', sa.Integer(), nullable=True),
+        sa.Column('duplicate_count', sa.Integer(), nullable=True),
+        sa.Column('error_count', sa.Integer(), nullable=True),
+        sa.Column('errors', sa.Text(), nullable=True),
+        sa.Column('message', sa.Text(), nullable=True),
+        sa.Column('assigned_to', sa.Integer(), nullable=True),
+        sa.Column('created_by_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['assigned_to'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['created_by_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    with op.batch_alter_table('lead', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('import_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_lead_import_id', 'lead_import', ['import_id'], ['id'])
+        batch_op.create_index('ix_lead_import_id', ['import_id'], unique=False)
+    restore_search_triggers()
+
+
+def downgrade():
+    with op.batch_alter_table('lead', schema=None) as batch_op:
+        batch_op.drop_index('ix_lead_import_id')
+        batch_op.drop_constraint('fk_lead_import_id', type_='foreignkey')
+        batch_op.drop_column('import_id')
+    restore_search_triggers()
+
+    op.drop_table('lead_import')
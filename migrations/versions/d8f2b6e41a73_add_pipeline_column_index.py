@@ -0,0 +1,28 @@
+"""Index lead on (added_by, status, created_at) for paginated pipeline columns
+
+Revision ID: d8f2b6e41a73
+Revises: c3e8a5d27f16
+Create Date: 2026-10-17 18:41:09.337512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f2b6e41a73'
+down_revision = 'c3e8a5d27f16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Supersedes ix_lead_added_by_status, which is its prefix; create it first so
+    # the added_by foreign key always has an index on MySQL
+    op.create_index('ix_lead_added_by_status_created_at', 'lead', ['added_by', 'status', 'created_at'], unique=False)
+    op.drop_index('ix_lead_added_by_status', table_name='lead')
+
+
+def downgrade():
+    op.create_index('ix_lead_added_by_status', 'lead', ['added_by', 'status'], unique=False)
+    op.drop_index('ix_lead_added_by_status_created_at', table_name='lead')
@@ -0,0 +1,28 @@
+"""Index interactions, meetings and quotes on (lead_id, date) for the lead activity feed
+
+Revision ID: e4a9c1f7b352
+Revises: d8f2b6e41a73
+Create Date: 2026-10-17 19:24:51.604127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9c1f7b352'
+down_revision = 'd8f2b6e41a73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_lead_interaction_lead_id_date', 'lead_interaction', ['lead_id', 'interaction_date'], unique=False)
+    op.create_index('ix_meeting_lead_id_date', 'meeting', ['lead_id', 'meeting_date'], unique=False)
+    op.create_index('ix_lead_quote_lead_id_created_at', 'lead_quote', ['lead_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_lead_quote_lead_id_created_at', table_name='lead_quote')
+    op.drop_index('ix_meeting_lead_id_date', table_name='meeting')
+    op.drop_index('ix_lead_interaction_lead_id_date', table_name='lead_interaction')
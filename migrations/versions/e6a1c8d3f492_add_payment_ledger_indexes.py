@@ -0,0 +1,27 @@
+"""Add payment_link indexes for the payment ledger
+
+Revision ID: e6a1c8d3f492
+Revises: d2f7b9c4e605
+Create Date: 2026-10-18 00:27:55.104381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a1c8d3f492'
+down_revision = 'd2f7b9c4e605'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_payment_link_provider_status_created', 'payment_link',
+                    ['provider_id', 'status', 'created_at'], unique=False)
+    op.create_index('ix_payment_link_provider_created', 'payment_link', ['provider_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_payment_link_provider_created', table_name='payment_link')
+    op.drop_index('ix_payment_link_provider_status_created', table_name='payment_link')
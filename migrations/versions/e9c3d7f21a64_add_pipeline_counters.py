@@ -0,0 +1,45 @@
+"""Add pipeline_counters table
+
+Revision ID: e9c3d7f21a64
+Revises: d4b8e2a61c90
+Create Date: 2026-10-17 15:22:41.907316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9c3d7f21a64'
+down_revision = 'd4b8e2a61c90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pipeline_counters = op.create_table('pipeline_counters',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('consultant_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('lead_count', sa.Integer(), nullable=False),
+        sa.Column('quoted_total', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('consultant_id', 'status', name='uq_pipeline_counter_key')
+    )
+
+    # Backfill with one aggregate over the (added_by, status) index
+    lead = sa.table('lead', sa.column('id'), sa.column('added_by'), sa.column('status'), sa.column('quoted_amount'))
+    consultant_id = sa.func.coalesce(lead.c.added_by, 0)
+    status = sa.func.coalesce(lead.c.status, '')
+    op.execute(
+        pipeline_counters.insert().from_select(
+            ['consultant_id', 'status', 'lead_count', 'quoted_total'],
+            sa.select(consultant_id, status, sa.func.count(lead.c.id),
+                      sa.func.coalesce(sa.func.sum(lead.c.quoted_amount), 0.0))
+            .group_by(consultant_id, status)
+        )
+    )
+
+
+def downgrade():
+    op.drop_table('pipeline_counters')
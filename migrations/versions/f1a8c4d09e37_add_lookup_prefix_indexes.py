@@ -0,0 +1,35 @@
+"""Add prefix search indexes for typeahead lookups
+
+Revision ID: f1a8c4d09e37
+Revises: e9c3d7f21a64
+Create Date: 2026-10-17 16:08:27.340518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a8c4d09e37'
+down_revision = 'e9c3d7f21a64'
+branch_labels = None
+depends_on = None
+
+# (index name, table, column); SQLite only serves LIKE 'term%' from a NOCASE index
+LOOKUP_INDEXES = [
+    ('ix_lead_name', 'lead', 'name'),
+    ('ix_student_first_name', 'student', 'first_name'),
+    ('ix_student_last_name', 'student', 'last_name'),
+    ('ix_course_name', 'course', 'name'),
+]
+
+
+def upgrade():
+    collation = ' COLLATE NOCASE' if op.get_bind().dialect.name == 'sqlite' else ''
+    for name, table_name, column_name in LOOKUP_INDEXES:
+        op.execute(f"CREATE INDEX {name} ON {table_name} ({column_name}{collation})")
+
+
+def downgrade():
+    for name, table_name, column_name in LOOKUP_INDEXES:
+        op.drop_index(name, table_name=table_name)
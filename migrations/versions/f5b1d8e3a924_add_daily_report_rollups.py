@@ -0,0 +1,72 @@
+"""Add lead_daily_rollup and enrollment_daily_rollup tables for the reports page
+
+Revision ID: f5b1d8e3a924
+Revises: e4a9c1f7b352
+Create Date: 2026-10-17 20:06:13.482950
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5b1d8e3a924'
+down_revision = 'e4a9c1f7b352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    lead_daily_rollup = op.create_table('lead_daily_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('lead_source', sa.String(length=50), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('consultant_id', sa.Integer(), nullable=False),
+        sa.Column('lead_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'lead_source', 'status', 'consultant_id', name='uq_lead_daily_rollup_key')
+    )
+    enrollment_daily_rollup = op.create_table('enrollment_daily_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('course_id', sa.Integer(), nullable=False),
+        sa.Column('enrollment_count', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('day', 'course_id', name='uq_enrollment_daily_rollup_key')
+    )
+
+    # Backfill with one aggregate per table; backfill_report_rollups.py does the same for a range of days
+    lead = sa.table('lead', sa.column('id'), sa.column('created_at'), sa.column('lead_source'),
+                    sa.column('status'), sa.column('added_by'))
+    day = sa.func.date(lead.c.created_at)
+    lead_source = sa.func.coalesce(lead.c.lead_source, '')
+    status = sa.func.coalesce(lead.c.status, '')
+    consultant_id = sa.func.coalesce(lead.c.added_by, 0)
+    op.execute(
+        lead_daily_rollup.insert().from_select(
+            ['day', 'lead_source', 'status', 'consultant_id', 'lead_count'],
+            sa.select(day, lead_source, status, consultant_id, sa.func.count(lead.c.id))
+            .where(lead.c.created_at.isnot(None))
+            .group_by(day, lead_source, status, consultant_id)
+        )
+    )
+
+    student = sa.table('student', sa.column('id'), sa.column('enrollment_date'), sa.column('course_id'),
+                       sa.column('fee_paid'))
+    course_id = sa.func.coalesce(student.c.course_id, 0)
+    op.execute(
+        enrollment_daily_rollup.insert().from_select(
+            ['day', 'course_id', 'enrollment_count', 'revenue'],
+            sa.select(student.c.enrollment_date, course_id, sa.func.count(student.c.id),
+                      sa.func.coalesce(sa.func.sum(student.c.fee_paid), 0.0))
+            .where(student.c.enrollment_date.isnot(None))
+            .group_by(student.c.enrollment_date, course_id)
+        )
+    )
+
+
+def downgrade():
+    op.drop_table('enrollment_daily_rollup')
+    op.drop_table('lead_daily_rollup')
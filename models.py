@@ -1,7 +1,16 @@
 from app import db
 from flask_login import UserMixin
 from datetime import datetime, date
-from sqlalchemy import func
+from sqlalchemy import func, event, inspect
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session, column_property, object_session
+import json
+import re
+import threading
+import time
+from utils import normalize_phone
+
+PIPELINE_STATUSES = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted', 'Lost']
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,6 +35,11 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
     
+    @classmethod
+    def consultant_choices(cls):
+        """(id, username) of every active consultant, from the reference data cache"""
+        return list(reference_cache.get('consultants'))
+    
     def is_admin(self):
         return self.role in ['admin', 'super_admin']
     
@@ -47,20 +61,23 @@ class Lead(db.Model):
     phone = db.Column(db.String(20), nullable=False)
     whatsapp = db.Column(db.String(20))
     assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))
-    added_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    # active_history: pipeline counter and report rollup events need the old value even when it was not loaded
+    added_by = column_property(db.Column(db.Integer, db.ForeignKey('user.id')), active_history=True)
     email = db.Column(db.String(120))
     course_interest_id = db.Column(db.Integer, db.ForeignKey('course.id'))
-    lead_source = db.Column(db.String(50))
-    status = db.Column(db.String(20), default='New')  # New, Contacted, Interested, Quoted, Converted, Lost
-    quoted_amount = db.Column(db.Float, default=0.0)
+    lead_source = column_property(db.Column(db.String(50)), active_history=True)
+    status = column_property(db.Column(db.String(20), default='New'), active_history=True)  # New, Contacted, Interested, Quoted, Converted, Lost
+    quoted_amount = column_property(db.Column(db.Float, default=0.0), active_history=True)
     last_contact_date = db.Column(db.Date)
     next_followup_date = db.Column(db.Date)
     followup_time = db.Column(db.Time)  # New field for time
     followup_type = db.Column(db.String(20))  # Call, Email, WhatsApp, Meeting
     followup_priority = db.Column(db.String(20))  # Low, Medium, High, Urgent
     comments = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = column_property(db.Column(db.DateTime, default=datetime.utcnow), active_history=True)
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    search_phone = db.Column(db.String(50))  # Digits-only phone/WhatsApp tokens for the search index
+    import_id = db.Column(db.Integer, db.ForeignKey('lead_import.id'))  # Bulk import that created the lead
     
     # Relationships
     course_interest = db.relationship('Course', backref='interested_leads')
@@ -68,48 +85,46 @@ class Lead(db.Model):
     assigned_consultant = db.relationship('User', foreign_keys=[assigned_to], backref='assigned_leads')
     added_by_user = db.relationship('User', foreign_keys=[added_by], backref='added_leads')
     interactions = db.relationship('LeadInteraction', backref='lead', lazy='dynamic')
-    
+
+    # Indexes matching the dashboard, leads list, pipeline and duplicate-check access paths
+    __table_args__ = (
+        db.Index('ix_lead_assigned_to_created_at', 'assigned_to', 'created_at'),
+        db.Index('ix_lead_added_by_status_created_at', 'added_by', 'status', 'created_at'),
+        db.Index('ix_lead_added_by_created_at', 'added_by', 'created_at'),
+        db.Index('ix_lead_status_created_at', 'status', 'created_at'),
+        db.Index('ix_lead_created_at', 'created_at'),
+        db.Index('ix_lead_next_followup', 'next_followup_date', 'followup_time'),
+        db.Index('ix_lead_phone', 'phone'),
+        db.Index('ix_lead_whatsapp', 'whatsapp'),
+        db.Index('ix_lead_import_id', 'import_id'),
+    )
+
     @classmethod
     def check_duplicate(cls, phone, whatsapp=None, exclude_id=None):
         """Check if a lead with same phone or WhatsApp already exists"""
-        query = cls.query
-        if exclude_id:
-            query = query.filter(cls.id != exclude_id)
-        
-        # Check for phone or WhatsApp duplicates
-        conditions = [cls.phone == phone]
-        if whatsapp:
-            conditions.extend([cls.whatsapp == whatsapp, cls.phone == whatsapp, cls.whatsapp == phone])
+        # One indexed lookup on the normalized phone keys, so "+971 50..." matches "050..."
+        keys = {normalize_phone(number) for number in (phone, whatsapp) if number}
+        keys.discard(None)
+        if not keys:
+            return None
         
-        duplicate_lead = query.filter(db.or_(*conditions)).first()
-        if duplicate_lead:
-            return duplicate_lead
-        return None
-        phone_exists = query.filter(cls.phone == phone).first()
-        if phone_exists:
-            return phone_exists
-        
-        # Check for email duplicates if email provided
-        if email:
-            email_exists = query.filter(cls.email == email).first()
-            if email_exists:
-                return email_exists
+        query = db.session.query(PhoneKey.entity_id).filter(
+            PhoneKey.phone_key.in_(keys),
+            PhoneKey.entity_type == 'lead'
+        )
+        if exclude_id:
+            query = query.filter(PhoneKey.entity_id != exclude_id)
         
+        match = query.first()
+        if match:
+            return db.session.get(cls, match.entity_id)
         return None
     
     @classmethod
     def get_user_pipeline_data(cls, user_id):
         """Get pipeline statistics for a specific user"""
-        user_leads = cls.query.filter_by(added_by=user_id)
-        
-        pipeline_data = {}
-        statuses = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted', 'Lost']
-        
-        for status in statuses:
-            count = user_leads.filter_by(status=status).count()
-            pipeline_data[status] = count
-        
-        return pipeline_data
+        totals = PipelineCounter.totals(user_id)
+        return {status: totals[status]['count'] for status in PIPELINE_STATUSES}
     
     @classmethod
     def get_user_leads(cls, user_id, status=None, search=None, course_filter=None):
@@ -120,22 +135,36 @@ class Lead(db.Model):
             query = query.filter_by(status=status)
         
         if search:
-            query = query.filter(
-                db.or_(
-                    cls.name.ilike(f'%{search}%'),
-                    cls.phone.ilike(f'%{search}%'),
-                    cls.email.ilike(f'%{search}%')
-                )
-            )
+            from search import lead_search_filter
+            query = query.filter(lead_search_filter(search))
         
         if course_filter:
             query = query.filter_by(course_interest_id=course_filter)
         
         return query
     
+    def phone_numbers(self):
+        """(field, number, country code) for every phone-like field"""
+        return [('phone', self.phone, None), ('whatsapp', self.whatsapp, None)]
+    
+    @staticmethod
+    def build_search_phone(*numbers):
+        """Digits-only tokens for the given phone numbers, as stored in search_phone"""
+        digits = [re.sub(r'\D', '', number) for number in numbers if number]
+        return ' '.join(d for d in digits if d) or None
+    
+    def refresh_search_phone(self):
+        """Rebuild the digits-only phone tokens so partial phone numbers can be searched"""
+        self.search_phone = self.build_search_phone(self.phone, self.whatsapp)
+    
     def __repr__(self):
         return f'<Lead {self.name}>'
 
+@event.listens_for(Lead, 'before_insert')
+@event.listens_for(Lead, 'before_update')
+def _refresh_lead_search_phone(mapper, connection, target):
+    target.refresh_search_phone()
+
 class LeadInteraction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lead_id = db.Column(db.Integer, db.ForeignKey('lead.id'), nullable=False)
@@ -146,6 +175,11 @@ class LeadInteraction(db.Model):
     is_important = db.Column(db.Boolean, default=False)
     
     created_by = db.relationship('User', backref='interactions')
+    
+    # The lead activity feed seeks each lead's interactions newest first
+    __table_args__ = (
+        db.Index('ix_lead_interaction_lead_id_date', 'lead_id', 'interaction_date'),
+    )
 
 
 
@@ -167,6 +201,11 @@ class Course(db.Model):
     students = db.relationship('Student', backref='course')
     # Removed: corporate_trainings = db.relationship('CorporateTraining', backref='course')
     
+    @classmethod
+    def active_choices(cls):
+        """(id, name) of every active course, from the reference data cache"""
+        return list(reference_cache.get('courses'))
+    
     def __repr__(self):
         return f'<Course {self.name}>'
 
@@ -194,6 +233,11 @@ class Meeting(db.Model):
     lead = db.relationship('Lead', backref='meetings')
     student = db.relationship('Student', backref='meetings')
     created_by = db.relationship('User', backref='created_meetings')
+    
+    # The lead activity feed seeks each lead's meetings newest first
+    __table_args__ = (
+        db.Index('ix_meeting_lead_id_date', 'lead_id', 'meeting_date'),
+    )
 
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -203,12 +247,13 @@ class Student(db.Model):
     country_code = db.Column(db.String(5), default='+971')
     phone = db.Column(db.String(20), nullable=False)
     email = db.Column(db.String(120))
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    # active_history: report rollup events need the old value even when it was not loaded
+    course_id = column_property(db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False), active_history=True)
     schedule_days = db.Column(db.Text)  # JSON array of selected days
     schedule_time = db.Column(db.String(20))  # Time slot
-    enrollment_date = db.Column(db.Date, default=date.today)
+    enrollment_date = column_property(db.Column(db.Date, default=date.today), active_history=True)
     status = db.Column(db.String(20), default='Active')  # Active, Completed, Dropped, Suspended
-    fee_paid = db.Column(db.Float, default=0.0)
+    fee_paid = column_property(db.Column(db.Float, default=0.0), active_history=True)
     total_fee = db.Column(db.Float, nullable=False)
     payment_plan = db.Column(db.String(50))  # Full, Installments
     progress_percentage = db.Column(db.Float, default=0.0)
@@ -220,10 +265,21 @@ class Student(db.Model):
     def name(self):
         return f"{self.first_name} {self.last_name}"
     
+    def phone_numbers(self):
+        """(field, number, country code) for every phone-like field"""
+        return [('phone', self.phone, self.country_code)]
+    
     # Relationships
     original_lead = db.relationship('Lead', backref='converted_student')
     attendance_records = db.relationship('AttendanceRecord', backref='student')
     
+    # Keyset pagination seeks on (enrollment_date, id), optionally within a course or status
+    __table_args__ = (
+        db.Index('ix_student_enrollment_date', 'enrollment_date'),
+        db.Index('ix_student_course_id_enrollment_date', 'course_id', 'enrollment_date'),
+        db.Index('ix_student_status_enrollment_date', 'status', 'enrollment_date'),
+    )
+    
     def __repr__(self):
         return f'<Student {self.name}>'
 
@@ -260,6 +316,10 @@ class CorporateTraining(db.Model):
     
     # Relationships
     created_by = db.relationship('User', backref='corporate_leads')
+    
+    def phone_numbers(self):
+        """(field, number, country code) for every phone-like field"""
+        return [('contact_person_phone', self.contact_person_phone, self.contact_person_country_code)]
 
 class MessageTemplate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -272,6 +332,95 @@ class MessageTemplate(db.Model):
     usage_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class OutboxEmail(db.Model):
+    """An email waiting to be sent, or the record of its delivery (see email_outbox.py)"""
+    __tablename__ = 'outbox_email'
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(254), nullable=False)
+    subject = db.Column(db.String(300), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    html_body = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Also when a claim expires
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_outbox_email_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<OutboxEmail {self.id} {self.status}>'
+
+class MessageCampaign(db.Model):
+    """One bulk send of a message template; progress is stored here so any worker can report it"""
+    __tablename__ = 'message_campaign'
+    id = db.Column(db.Integer, primary_key=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('message_template.id', ondelete='SET NULL'))
+    template_name = db.Column(db.String(100), nullable=False)  # Kept if the template is deleted
+    message_type = db.Column(db.String(20), nullable=False)  # Email, SMS, WhatsApp
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'))  # {course_name} for every recipient, if set
+    audience = db.Column(db.String(200))  # Who was selected, e.g. "All Interested leads"
+    assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))  # Only these leads, if the sender cannot see all
+    lead_status = db.Column(db.String(20))  # Leads in this status get the message, if none were selected
+    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    claimed_until = db.Column(db.DateTime)  # Lease of the job sending it; once expired, another job may resume it
+    total_count = db.Column(db.Integer, default=0)
+    sent_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    skipped_count = db.Column(db.Integer, default=0)  # No address for the channel
+    message = db.Column(db.Text)  # Reason the send failed
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    template = db.relationship('MessageTemplate')
+    created_by = db.relationship('User', foreign_keys=[created_by_id])
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    @property
+    def processed_count(self):
+        return (self.sent_count or 0) + (self.failed_count or 0) + (self.skipped_count or 0)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'template_name': self.template_name,
+            'message_type': self.message_type,
+            'audience': self.audience,
+            'status': self.status,
+            'progress': int(self.processed_count * 100 / self.total_count) if self.total_count else
+                        (100 if self.is_finished else 0),
+            'total_count': self.total_count or 0,
+            'sent_count': self.sent_count or 0,
+            'failed_count': self.failed_count or 0,
+            'skipped_count': self.skipped_count or 0,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class MessageRecipient(db.Model):
+    """Delivery status of one lead in a MessageCampaign"""
+    __tablename__ = 'message_recipient'
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('message_campaign.id', ondelete='CASCADE'), nullable=False)
+    lead_id = db.Column(db.Integer, nullable=False)  # No foreign key: the record outlives a deleted lead
+    address = db.Column(db.String(254))  # Email address or phone number the message went to
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, sent, failed, skipped
+    error = db.Column(db.String(300))
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('campaign_id', 'lead_id', name='uq_message_recipient_campaign_lead'),
+    )
+
 class SystemSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     setting_key = db.Column(db.String(100), unique=True, nullable=False)
@@ -297,6 +446,11 @@ class LeadQuote(db.Model):
     lead = db.relationship('Lead', backref='quotes')
     course = db.relationship('Course', backref='quotes')
     created_by = db.relationship('User', backref='created_quotes')
+    
+    # The lead activity feed seeks each lead's quotes newest first
+    __table_args__ = (
+        db.Index('ix_lead_quote_lead_id_created_at', 'lead_id', 'created_at'),
+    )
 
 # Trainer Management Models  
 class Trainer(db.Model):
@@ -413,13 +567,21 @@ class PaymentLink(db.Model):
     description = db.Column(db.String(500))
     payment_url = db.Column(db.String(1000))
     payment_reference = db.Column(db.String(200), unique=True)
-    status = db.Column(db.String(20), default='pending')  # pending, paid, failed, expired, cancelled
+    status = db.Column(db.String(20), default='pending', index=True)  # creating, pending, paid, failed, expired, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     paid_at = db.Column(db.DateTime)
     expires_at = db.Column(db.DateTime)
     webhook_data = db.Column(db.Text)  # JSON data from payment provider
+    external_payment_id = db.Column(db.String(200), index=True)  # The provider's id for the link
+    provider_error = db.Column(db.String(500))  # Why the provider could not create the link
     created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     
+    __table_args__ = (
+        # Payments page: date-range summary per provider and status, and each provider's newest links
+        db.Index('ix_payment_link_provider_status_created', 'provider_id', 'status', 'created_at'),
+        db.Index('ix_payment_link_provider_created', 'provider_id', 'created_at'),
+    )
+    
     # Relationships
     lead = db.relationship('Lead', backref='payment_links')
     student = db.relationship('Student', backref='payment_links')
@@ -429,6 +591,25 @@ class PaymentLink(db.Model):
     def __repr__(self):
         return f'<PaymentLink {self.payment_reference}>'
 
+class PaymentEvent(db.Model):
+    """A provider webhook as received, applied to its PaymentLink later (see payment_webhooks.py)"""
+    __tablename__ = 'payment_event'
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(20), nullable=False)  # vault, tabby, tamara
+    event_key = db.Column(db.String(200), nullable=False)  # The provider's event id, or a hash of the body
+    payload = db.Column(db.Text, nullable=False)  # Raw request body
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)  # None until applied
+    outcome = db.Column(db.String(100))  # What applying it did, e.g. "paid" or "unknown payment"
+    
+    __table_args__ = (
+        db.UniqueConstraint('provider', 'event_key', name='uq_payment_event_provider_key'),
+        db.Index('ix_payment_event_processed_at', 'processed_at', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<PaymentEvent {self.provider} {self.event_key}>'
+
 class PaymentSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     company_name = db.Column(db.String(200), nullable=False)
@@ -464,13 +645,12 @@ class Setting(db.Model):
     
     @classmethod
     def get_single_value(cls, key, default=None):
-        setting = cls.query.filter_by(key=key, is_active=True).first()
-        return setting.value if setting else default
+        choices = reference_cache.get('settings').get(key)
+        return choices[0][0] if choices else default
     
     @classmethod
     def get_choices(cls, key):
-        settings = cls.get_by_key(key)
-        return [(s.value, s.display_name) for s in settings]
+        return list(reference_cache.get('settings').get(key, []))
     
     @classmethod
     def get_system_settings(cls):
@@ -481,4 +661,644 @@ class Setting(db.Model):
     def __repr__(self):
         return f'<Setting {self.key}: {self.value}>'
 
+class ChangeVersion(db.Model):
+    """Version number per data set, bumped in the same transaction as every change to it"""
+    __tablename__ = 'change_version'
+    name = db.Column(db.String(50), primary_key=True)  # REFERENCE_DATA_VERSION, LEADS_VERSION
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def bump(cls, connection, name):
+        table = cls.__table__
+        result = connection.execute(table.update().where(table.c.name == name).values(version=table.c.version + 1))
+        if not result.rowcount:
+            connection.execute(table.insert().values(name=name, version=1))
+    
+    @classmethod
+    def current(cls, name):
+        return db.session.query(cls.version).filter(cls.name == name).scalar() or 0
+
+REFERENCE_DATA_VERSION = 'reference_data'  # settings, active courses, active consultants
+LEADS_VERSION = 'leads'  # any lead insert, update or delete
+
+# Seconds a worker trusts its cached reference data before re-reading its change version
+REFERENCE_CHECK_INTERVAL = 5
+
+class ReferenceCache:
+    """
+    Per-process cache of settings, active courses and active consultants
+
+    Lookups are served from memory; at most once every check_interval seconds
+    the worker reads the change version (one primary key lookup) and reloads
+    everything when another worker has changed the data.  Changes made by this
+    worker are picked up on commit.
+    """
+    
+    def __init__(self, check_interval=REFERENCE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._checked_at = 0.0
+    
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+    
+    def get(self, name):
+        now = time.monotonic()
+        with self._lock:
+            if self._data is not None and now - self._checked_at < self.check_interval:
+                return self._data[name]
+        
+        # Read the version before the data so a concurrent change is never cached as current
+        version = ChangeVersion.current(REFERENCE_DATA_VERSION)
+        with self._lock:
+            if self._data is not None and version == self._version:
+                self._checked_at = now
+                return self._data[name]
+        
+        data = self._load()
+        with self._lock:
+            self._data, self._version, self._checked_at = data, version, now
+        return data[name]
+    
+    @staticmethod
+    def _load():
+        settings = {}
+        for key, value, display_name in db.session.query(Setting.key, Setting.value, Setting.display_name) \
+                .filter(Setting.is_active == True).order_by(Setting.sort_order, Setting.id):
+            settings.setdefault(key, []).append((value, display_name))
+        return {
+            'settings': settings,
+            'courses': [tuple(row) for row in db.session.query(Course.id, Course.name)
+                        .filter(Course.is_active == True).order_by(Course.id)],
+            'consultants': [tuple(row) for row in db.session.query(User.id, User.username)
+                            .filter(User.role == 'consultant', User.active == True).order_by(User.id)],
+        }
+
+reference_cache = ReferenceCache()
+
+# Columns whose changes invalidate the cache, per model (None: any change)
+REFERENCE_FIELDS = {
+    Setting: None,
+    Course: ('name', 'is_active'),
+    User: ('username', 'role', 'active'),
+}
+
+def _reference_data_changed(mapper, connection, target):
+    ChangeVersion.bump(connection, REFERENCE_DATA_VERSION)
+    session = object_session(target)
+    if session is not None:
+        session.info['reference_data_changed'] = True
+
+def _reference_data_updated(mapper, connection, target):
+    fields = REFERENCE_FIELDS[mapper.class_]
+    state = inspect(target)
+    if fields is None or any(state.attrs[field].history.has_changes() for field in fields):
+        _reference_data_changed(mapper, connection, target)
+
+def _invalidate_reference_cache(session):
+    if session.info.pop('reference_data_changed', False):
+        reference_cache.invalidate()
+
+def _forget_reference_change(session, previous_transaction):
+    session.info.pop('reference_data_changed', None)
+
+for _model in REFERENCE_FIELDS:
+    event.listen(_model, 'after_insert', _reference_data_changed)
+    event.listen(_model, 'after_update', _reference_data_updated)
+    event.listen(_model, 'after_delete', _reference_data_changed)
+event.listen(Session, 'after_commit', _invalidate_reference_cache)
+event.listen(Session, 'after_soft_rollback', _forget_reference_change)
+
+class PhoneKey(db.Model):
+    """Normalized E.164 phone number of a lead, student or corporate contact"""
+    id = db.Column(db.Integer, primary_key=True)
+    phone_key = db.Column(db.String(32), nullable=False)  # E.164, e.g. +971501234567
+    entity_type = db.Column(db.String(20), nullable=False)  # lead, student, corporate_training
+    entity_id = db.Column(db.Integer, nullable=False)
+    field = db.Column(db.String(30), nullable=False)  # phone, whatsapp, contact_person_phone
+    
+    __table_args__ = (
+        db.Index('ix_phone_key_lookup', 'phone_key', 'entity_type', 'entity_id'),
+        db.UniqueConstraint('entity_type', 'entity_id', 'field', name='uq_phone_key_entity_field'),
+    )
+    
+    @classmethod
+    def rows_for(cls, entity_type, target):
+        """Phone key rows for a model instance exposing phone_numbers()"""
+        rows = []
+        for field, number, country_code in target.phone_numbers():
+            key = normalize_phone(number, country_code or '+971')
+            if key:
+                rows.append({'phone_key': key, 'entity_type': entity_type,
+                             'entity_id': target.id, 'field': field})
+        return rows
+    
+    @classmethod
+    def lookup(cls, keys, entity_type=None, chunk_size=1000):
+        """Map each phone key to the (entity_type, entity_id) pairs that use it"""
+        keys = sorted({k for k in keys if k})
+        matches = {key: [] for key in keys}
+        for start in range(0, len(keys), chunk_size):
+            query = db.session.query(cls.phone_key, cls.entity_type, cls.entity_id).filter(
+                cls.phone_key.in_(keys[start:start + chunk_size])
+            )
+            if entity_type:
+                query = query.filter(cls.entity_type == entity_type)
+            for phone_key, match_type, entity_id in query:
+                if (match_type, entity_id) not in matches[phone_key]:
+                    matches[phone_key].append((match_type, entity_id))
+        return matches
+    
+    def __repr__(self):
+        return f'<PhoneKey {self.phone_key} {self.entity_type}:{self.entity_id}>'
+
+PHONE_FIELDS = {
+    Lead: ('lead', ('phone', 'whatsapp')),
+    Student: ('student', ('phone', 'country_code')),
+    CorporateTraining: ('corporate_training', ('contact_person_phone', 'contact_person_country_code')),
+}
+
+def _insert_phone_keys(mapper, connection, target):
+    entity_type, _ = PHONE_FIELDS[type(target)]
+    rows = PhoneKey.rows_for(entity_type, target)
+    if rows:
+        connection.execute(PhoneKey.__table__.insert(), rows)
+
+def _delete_phone_keys(mapper, connection, target):
+    entity_type, _ = PHONE_FIELDS[type(target)]
+    table = PhoneKey.__table__
+    connection.execute(table.delete().where(table.c.entity_type == entity_type,
+                                            table.c.entity_id == target.id))
+
+def _update_phone_keys(mapper, connection, target):
+    _, fields = PHONE_FIELDS[type(target)]
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in fields):
+        _delete_phone_keys(mapper, connection, target)
+        _insert_phone_keys(mapper, connection, target)
+
+for _model in PHONE_FIELDS:
+    event.listen(_model, 'after_insert', _insert_phone_keys)
+    event.listen(_model, 'after_update', _update_phone_keys)
+    event.listen(_model, 'after_delete', _delete_phone_keys)
+
+def increment_counters(connection, table, key_columns, value_columns, deltas):
+    """
+    Add {key tuple: value delta tuple} to counter rows keyed by a unique key_columns
+    constraint, creating missing rows, with one atomic upsert per key
+    """
+    for key, amounts in deltas.items():
+        if not any(amounts):
+            continue
+        values = dict(zip(key_columns, key), **dict(zip(value_columns, amounts)))
+        if connection.dialect.name == 'mysql':
+            statement = mysql.insert(table).values(**values)
+            statement = statement.on_duplicate_key_update(
+                **{column: table.c[column] + statement.inserted[column] for column in value_columns}
+            )
+        elif connection.dialect.name == 'sqlite':
+            statement = sqlite.insert(table).values(**values)
+            statement = statement.on_conflict_do_update(
+                index_elements=list(key_columns),
+                set_={column: table.c[column] + statement.excluded[column] for column in value_columns}
+            )
+        else:
+            result = connection.execute(
+                table.update()
+                .where(*[table.c[column] == value for column, value in zip(key_columns, key)])
+                .values(**{column: table.c[column] + amount for column, amount in zip(value_columns, amounts)})
+            )
+            if result.rowcount:
+                continue
+            statement = table.insert().values(**values)
+        connection.execute(statement)
 
+def previous_values(target, fields):
+    """Values the fields had before the pending flush; unchanged fields keep their current value"""
+    state = inspect(target)
+    values = {}
+    for field in fields:
+        history = state.attrs[field].history
+        # An attribute that changed from None has an empty history.deleted
+        values[field] = (history.deleted[0] if history.deleted else None) if history.has_changes() \
+            else getattr(target, field)
+    return values
+
+class PipelineCounter(db.Model):
+    """Lead count and quoted value per (consultant, status), kept current by Lead events"""
+    __tablename__ = 'pipeline_counters'
+    id = db.Column(db.Integer, primary_key=True)
+    consultant_id = db.Column(db.Integer, nullable=False)  # Lead.added_by, 0 when unset
+    status = db.Column(db.String(20), nullable=False)  # Lead.status, '' when unset
+    lead_count = db.Column(db.Integer, nullable=False, default=0)
+    quoted_total = db.Column(db.Float, nullable=False, default=0.0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('consultant_id', 'status', name='uq_pipeline_counter_key'),
+    )
+    
+    @staticmethod
+    def key_for(added_by, status):
+        return (added_by or 0, status or '')
+    
+    @classmethod
+    def apply(cls, connection, deltas):
+        """Add {(consultant_id, status): (count delta, amount delta)} to the counters atomically"""
+        increment_counters(connection, cls.__table__, ('consultant_id', 'status'), ('lead_count', 'quoted_total'),
+                           {key: (count, amount or 0.0) for key, (count, amount) in deltas.items()})
+    
+    @classmethod
+    def totals(cls, consultant_id=None):
+        """{status: {'count', 'total_value'}} for one consultant, or everyone when consultant_id is None"""
+        query = db.session.query(cls.status, func.sum(cls.lead_count), func.sum(cls.quoted_total))
+        if consultant_id is not None:
+            query = query.filter(cls.consultant_id == consultant_id)
+        
+        totals = {status: {'count': 0, 'total_value': 0.0} for status in PIPELINE_STATUSES}
+        for status, count, total_value in query.group_by(cls.status):
+            if status:
+                totals[status] = {'count': int(count or 0), 'total_value': float(total_value or 0)}
+        return totals
+    
+    @classmethod
+    def lead_total(cls, consultant_id=None):
+        """Number of leads, including those without a status"""
+        query = db.session.query(func.sum(cls.lead_count))
+        if consultant_id is not None:
+            query = query.filter(cls.consultant_id == consultant_id)
+        return int(query.scalar() or 0)
+    
+    @staticmethod
+    def add_delta(deltas, key, count, amount):
+        current = deltas.get(key, (0, 0.0))
+        deltas[key] = (current[0] + count, current[1] + (amount or 0.0))
+    
+    @classmethod
+    def deltas_for_leads(cls, connection, lead_ids, new_status=None):
+        """
+        Counter deltas for a bulk change to the given leads: each lead leaves its
+        current (consultant, status) and, with new_status, joins (consultant, new_status)
+        """
+        lead = Lead.__table__
+        rows = connection.execute(
+            db.select(lead.c.added_by, lead.c.status, func.count(lead.c.id), func.sum(lead.c.quoted_amount))
+            .where(lead.c.id.in_(lead_ids))
+            .group_by(lead.c.added_by, lead.c.status)
+        )
+        deltas = {}
+        for added_by, status, count, total in rows:
+            cls.add_delta(deltas, cls.key_for(added_by, status), -count, -float(total or 0))
+            if new_status:
+                cls.add_delta(deltas, cls.key_for(added_by, new_status), count, float(total or 0))
+        return deltas
+    
+    @classmethod
+    def reconcile(cls):
+        """Recompute the counters from the lead table and correct any drift; returns the corrections"""
+        # Lock the counters first so concurrent Lead events wait for the corrected values
+        current = {
+            (row.consultant_id, row.status): (row.lead_count, row.quoted_total)
+            for row in cls.query.with_for_update().all()
+        }
+        actual = {}
+        for added_by, status, count, total in db.session.query(
+                Lead.added_by, Lead.status, func.count(Lead.id), func.sum(Lead.quoted_amount)
+        ).group_by(Lead.added_by, Lead.status):
+            cls.add_delta(actual, cls.key_for(added_by, status), count, float(total or 0))
+        
+        corrections = {}
+        for key in current.keys() | actual.keys():
+            have_count, have_total = current.get(key, (0, 0.0))
+            want_count, want_total = actual.get(key, (0, 0.0))
+            if have_count != want_count or abs(have_total - want_total) > 0.005:
+                corrections[key] = (want_count - have_count, want_total - have_total)
+        
+        if corrections:
+            cls.apply(db.session.connection(), corrections)
+            ChangeVersion.bump(db.session.connection(), LEADS_VERSION)
+        cls.query.filter(cls.lead_count == 0).delete(synchronize_session=False)
+        db.session.commit()
+        return corrections
+    
+    def __repr__(self):
+        return f'<PipelineCounter {self.consultant_id}:{self.status} {self.lead_count}>'
+
+def _count_inserted_lead(mapper, connection, target):
+    key = PipelineCounter.key_for(target.added_by, target.status)
+    PipelineCounter.apply(connection, {key: (1, target.quoted_amount or 0.0)})
+
+def _count_deleted_lead(mapper, connection, target):
+    key = PipelineCounter.key_for(target.added_by, target.status)
+    PipelineCounter.apply(connection, {key: (-1, -(target.quoted_amount or 0.0))})
+
+def _count_updated_lead(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[field].history.has_changes() for field in ('added_by', 'status', 'quoted_amount')):
+        return
+    old = previous_values(target, ('added_by', 'status', 'quoted_amount'))
+    
+    deltas = {}
+    PipelineCounter.add_delta(deltas, PipelineCounter.key_for(old['added_by'], old['status']),
+                              -1, -(old['quoted_amount'] or 0.0))
+    PipelineCounter.add_delta(deltas, PipelineCounter.key_for(target.added_by, target.status),
+                              1, target.quoted_amount)
+    PipelineCounter.apply(connection, deltas)
+
+event.listen(Lead, 'after_insert', _count_inserted_lead)
+event.listen(Lead, 'after_update', _count_updated_lead)
+event.listen(Lead, 'after_delete', _count_deleted_lead)
+
+def _lead_changed(mapper, connection, target):
+    ChangeVersion.bump(connection, LEADS_VERSION)
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Lead, _event, _lead_changed)
+
+class LeadDailyRollup(db.Model):
+    """Leads created per (day, source, status, consultant), kept current by Lead events"""
+    __tablename__ = 'lead_daily_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # UTC date of Lead.created_at
+    lead_source = db.Column(db.String(50), nullable=False)  # '' when unset
+    status = db.Column(db.String(20), nullable=False)  # '' when unset
+    consultant_id = db.Column(db.Integer, nullable=False)  # Lead.added_by, 0 when unset
+    lead_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'lead_source', 'status', 'consultant_id', name='uq_lead_daily_rollup_key'),
+    )
+    
+    KEY_FIELDS = ('created_at', 'lead_source', 'status', 'added_by')
+    
+    @staticmethod
+    def key_for(created_at, lead_source, status, added_by):
+        if created_at is None:
+            return None
+        day = created_at.date() if isinstance(created_at, datetime) else created_at
+        return (day, lead_source or '', status or '', added_by or 0)
+    
+    @classmethod
+    def apply(cls, connection, deltas):
+        """Add {(day, source, status, consultant_id): count delta} to the rollup atomically"""
+        increment_counters(connection, cls.__table__, ('day', 'lead_source', 'status', 'consultant_id'),
+                           ('lead_count',), {key: (count,) for key, count in deltas.items() if key})
+    
+    @classmethod
+    def deltas_for_leads(cls, connection, lead_ids, new_status=None):
+        """Rollup deltas for a bulk status change (or, without new_status, deletion) of the given leads"""
+        lead = Lead.__table__
+        rows = connection.execute(
+            db.select(lead.c.created_at, lead.c.lead_source, lead.c.status, lead.c.added_by)
+            .where(lead.c.id.in_(lead_ids))
+        )
+        deltas = {}
+        for created_at, lead_source, status, added_by in rows:
+            old_key = cls.key_for(created_at, lead_source, status, added_by)
+            deltas[old_key] = deltas.get(old_key, 0) - 1
+            if new_status:
+                new_key = cls.key_for(created_at, lead_source, new_status, added_by)
+                deltas[new_key] = deltas.get(new_key, 0) + 1
+        return deltas
+    
+    def __repr__(self):
+        return f'<LeadDailyRollup {self.day} {self.lead_source}:{self.status}:{self.consultant_id} {self.lead_count}>'
+
+def _roll_up_inserted_lead(mapper, connection, target):
+    LeadDailyRollup.apply(connection, {
+        LeadDailyRollup.key_for(*(getattr(target, field) for field in LeadDailyRollup.KEY_FIELDS)): 1
+    })
+
+def _roll_up_deleted_lead(mapper, connection, target):
+    LeadDailyRollup.apply(connection, {
+        LeadDailyRollup.key_for(*(getattr(target, field) for field in LeadDailyRollup.KEY_FIELDS)): -1
+    })
+
+def _roll_up_updated_lead(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[field].history.has_changes() for field in LeadDailyRollup.KEY_FIELDS):
+        return
+    old = previous_values(target, LeadDailyRollup.KEY_FIELDS)
+    old_key = LeadDailyRollup.key_for(*(old[field] for field in LeadDailyRollup.KEY_FIELDS))
+    new_key = LeadDailyRollup.key_for(*(getattr(target, field) for field in LeadDailyRollup.KEY_FIELDS))
+    if old_key != new_key:
+        LeadDailyRollup.apply(connection, {old_key: -1, new_key: 1})
+
+event.listen(Lead, 'after_insert', _roll_up_inserted_lead)
+event.listen(Lead, 'after_update', _roll_up_updated_lead)
+event.listen(Lead, 'after_delete', _roll_up_deleted_lead)
+
+class LeadStatusChange(db.Model):
+    """A status a lead moved into, kept for funnel and time-to-convert analytics"""
+    __tablename__ = 'lead_status_change'
+    id = db.Column(db.Integer, primary_key=True)
+    lead_id = db.Column(db.Integer, nullable=False)  # No foreign key: written by the bulk paths without a flush
+    from_status = db.Column(db.String(20))  # None for the status a lead was created with
+    to_status = db.Column(db.String(20), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_lead_status_change_lead_id', 'lead_id', 'changed_at'),
+    )
+    
+    @classmethod
+    def record(cls, connection, rows):
+        """Insert [{'lead_id', 'from_status', 'to_status', 'changed_at'}] with one executemany"""
+        rows = [row for row in rows if row['to_status'] and row['to_status'] != row['from_status']]
+        if rows:
+            connection.execute(cls.__table__.insert(), rows)
+    
+    @classmethod
+    def rows_for_leads(cls, connection, lead_ids, new_status, changed_at):
+        """Status change rows for a bulk status change of the given leads"""
+        lead = Lead.__table__
+        return [{'lead_id': lead_id, 'from_status': status, 'to_status': new_status, 'changed_at': changed_at}
+                for lead_id, status in connection.execute(
+                    db.select(lead.c.id, lead.c.status).where(lead.c.id.in_(lead_ids)))]
+    
+    def __repr__(self):
+        return f'<LeadStatusChange {self.lead_id} {self.from_status}->{self.to_status}>'
+
+def _record_initial_status(mapper, connection, target):
+    LeadStatusChange.record(connection, [{'lead_id': target.id, 'from_status': None, 'to_status': target.status,
+                                          'changed_at': target.created_at or datetime.utcnow()}])
+
+def _record_status_change(mapper, connection, target):
+    if not inspect(target).attrs.status.history.has_changes():
+        return
+    LeadStatusChange.record(connection, [{'lead_id': target.id,
+                                          'from_status': previous_values(target, ('status',))['status'],
+                                          'to_status': target.status, 'changed_at': datetime.utcnow()}])
+
+def _forget_status_changes(mapper, connection, target):
+    table = LeadStatusChange.__table__
+    connection.execute(table.delete().where(table.c.lead_id == target.id))
+
+event.listen(Lead, 'after_insert', _record_initial_status)
+event.listen(Lead, 'after_update', _record_status_change)
+event.listen(Lead, 'after_delete', _forget_status_changes)
+
+class EnrollmentDailyRollup(db.Model):
+    """Enrollments and fees paid per (enrollment day, course), kept current by Student events"""
+    __tablename__ = 'enrollment_daily_rollup'
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # Student.enrollment_date
+    course_id = db.Column(db.Integer, nullable=False)  # Student.course_id, 0 when unset
+    enrollment_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)  # Sum of Student.fee_paid, as on the dashboard
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'course_id', name='uq_enrollment_daily_rollup_key'),
+    )
+    
+    @staticmethod
+    def key_for(enrollment_date, course_id):
+        if enrollment_date is None:
+            return None
+        return (enrollment_date, course_id or 0)
+    
+    @classmethod
+    def apply(cls, connection, deltas):
+        """Add {(day, course_id): (count delta, revenue delta)} to the rollup atomically"""
+        increment_counters(connection, cls.__table__, ('day', 'course_id'), ('enrollment_count', 'revenue'),
+                           {key: (count, revenue or 0.0) for key, (count, revenue) in deltas.items() if key})
+    
+    def __repr__(self):
+        return f'<EnrollmentDailyRollup {self.day} {self.course_id} {self.enrollment_count}>'
+
+def _roll_up_inserted_student(mapper, connection, target):
+    key = EnrollmentDailyRollup.key_for(target.enrollment_date, target.course_id)
+    EnrollmentDailyRollup.apply(connection, {key: (1, target.fee_paid)})
+
+def _roll_up_deleted_student(mapper, connection, target):
+    key = EnrollmentDailyRollup.key_for(target.enrollment_date, target.course_id)
+    EnrollmentDailyRollup.apply(connection, {key: (-1, -(target.fee_paid or 0.0))})
+
+def _roll_up_updated_student(mapper, connection, target):
+    state = inspect(target)
+    fields = ('enrollment_date', 'course_id', 'fee_paid')
+    if not any(state.attrs[field].history.has_changes() for field in fields):
+        return
+    old = previous_values(target, fields)
+    deltas = {}
+    for key, count, revenue in (
+            (EnrollmentDailyRollup.key_for(old['enrollment_date'], old['course_id']), -1, -(old['fee_paid'] or 0.0)),
+            (EnrollmentDailyRollup.key_for(target.enrollment_date, target.course_id), 1, target.fee_paid or 0.0)):
+        current = deltas.get(key, (0, 0.0))
+        deltas[key] = (current[0] + count, current[1] + revenue)
+    EnrollmentDailyRollup.apply(connection, deltas)
+
+event.listen(Student, 'after_insert', _roll_up_inserted_student)
+event.listen(Student, 'after_update', _roll_up_updated_student)
+event.listen(Student, 'after_delete', _roll_up_deleted_student)
+
+class LeadEvent(db.Model):
+    """Lead change written in the changing transaction, fanned out to /api/events subscribers"""
+    __tablename__ = 'lead_event'
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(30), nullable=False)  # lead_created, lead_updated, lead_deleted, pipeline_changed
+    lead_id = db.Column(db.Integer)  # No foreign key: deleted leads keep their events
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_lead_event_created_at', 'created_at'),
+    )
+    
+    @classmethod
+    def record(cls, connection, event_type, payload, lead_id=None):
+        connection.execute(cls.__table__.insert().values(
+            event_type=event_type, lead_id=lead_id, payload=json.dumps(payload), created_at=datetime.utcnow()
+        ))
+    
+    def __repr__(self):
+        return f'<LeadEvent {self.id} {self.event_type}>'
+
+# Lead columns pushed to the pipeline board; changes to anything else are not announced
+LEAD_EVENT_FIELDS = ('name', 'phone', 'whatsapp', 'email', 'course_interest_id', 'status', 'quoted_amount',
+                     'added_by', 'next_followup_date', 'followup_time', 'followup_type', 'followup_priority')
+# Columns deciding which pipeline column (and whose board) a lead is counted in
+LEAD_SCOPE_FIELDS = ('added_by', 'status', 'quoted_amount')
+
+def _lead_event_snapshot(target):
+    snapshot = {'id': target.id}
+    for field in LEAD_EVENT_FIELDS:
+        value = getattr(target, field)
+        snapshot[field] = value.isoformat() if hasattr(value, 'isoformat') else value  # dates and times
+    return snapshot
+
+def _record_inserted_lead(mapper, connection, target):
+    LeadEvent.record(connection, 'lead_created', {
+        'lead': _lead_event_snapshot(target),
+        'before': None,
+        'after': {field: getattr(target, field) for field in LEAD_SCOPE_FIELDS},
+    }, lead_id=target.id)
+
+def _record_updated_lead(mapper, connection, target):
+    state = inspect(target)
+    changed = [field for field in LEAD_EVENT_FIELDS if state.attrs[field].history.has_changes()]
+    if not changed:
+        return
+    LeadEvent.record(connection, 'lead_updated', {
+        'lead': _lead_event_snapshot(target),
+        'before': previous_values(target, LEAD_SCOPE_FIELDS),
+        'after': {field: getattr(target, field) for field in LEAD_SCOPE_FIELDS},
+        'changes': changed,
+    }, lead_id=target.id)
+
+def _record_deleted_lead(mapper, connection, target):
+    LeadEvent.record(connection, 'lead_deleted', {
+        'lead': {'id': target.id},
+        'before': {field: getattr(target, field) for field in LEAD_SCOPE_FIELDS},
+        'after': None,
+    }, lead_id=target.id)
+
+event.listen(Lead, 'after_insert', _record_inserted_lead)
+event.listen(Lead, 'after_update', _record_updated_lead)
+event.listen(Lead, 'after_delete', _record_deleted_lead)
+
+class LeadImport(db.Model):
+    """Bulk lead import job; progress is stored here so any worker can report it"""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500))  # Uploaded file, removed once the import finishes
+    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    progress = db.Column(db.Integer, default=0)  # Percent of the file read
+    processed_rows = db.Column(db.Integer, default=0)
+    imported_count = db.Column(db.Integer, default=0)
+    duplicate_count = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Text)  # JSON list of {"row": n, "errors": [...]}, capped
+    message = db.Column(db.Text)  # Reason the import failed
+    assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    created_by = db.relationship('User', foreign_keys=[created_by_id])
+    
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'progress': self.progress or 0,
+            'processed_rows': self.processed_rows or 0,
+            'imported_count': self.imported_count or 0,
+            'duplicate_count': self.duplicate_count or 0,
+            'error_count': self.error_count or 0,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<LeadImport {self.filename} {self.status}>'
@@ -0,0 +1,175 @@
+"""
+Keyset (cursor) pagination for Training Center CRM list views
+
+Pages seek on (sort column, id) instead of using OFFSET, and the total is
+only counted on request (capped, so it never scans the whole table).  Any
+page therefore costs one index range read, whether it is page 1 or page
+20,000.  Cursors are opaque URL-safe tokens.
+
+Rows whose sort value is NULL (e.g. leads from before created_at was
+recorded) sort below every other value, as MySQL and SQLite order NULLs, so
+they make up the last pages, newest id first.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, asc, desc, func, or_
+
+# Stop counting after this many rows and report the total as "N+"
+APPROXIMATE_COUNT_CAP = 10000
+
+
+def encode_cursor(sort_value, row_id, direction='next'):
+    """Encode a (sort value, id) position as an opaque cursor token"""
+    if isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps({'v': [sort_value, row_id], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token into ((sort value, id), direction); raises ValueError if invalid"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        sort_value, row_id = payload['v']
+        direction = payload.get('d', 'next')
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+    if direction not in ('next', 'prev') or not isinstance(row_id, int):
+        raise ValueError(f"Invalid cursor: {token}")
+    return (sort_value, row_id), direction
+
+
+def _parse_sort_value(sort_column, value):
+    """Convert a cursor's serialized sort value back to the column's Python type"""
+    if value is None:
+        return None
+    python_type = sort_column.property.columns[0].type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return value
+
+
+class KeysetPagination:
+    """One page of a keyset-paginated query, shaped like Flask-SQLAlchemy's Pagination"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None, total_is_estimate=False):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def total_display(self):
+        """Human readable total, e.g. "10,000+" when the count was capped"""
+        if self.total is None:
+            return None
+        return f"{self.total:,}+" if self.total_is_estimate else f"{self.total:,}"
+
+    def to_dict(self):
+        return {
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'per_page': self.per_page,
+            'total': self.total,
+            'total_is_estimate': self.total_is_estimate
+        }
+
+
+def approximate_count(query, cap=APPROXIMATE_COUNT_CAP):
+    """Count the rows of a query up to the cap; returns (count, is_estimate)"""
+    capped = query.order_by(None).limit(cap + 1).subquery()
+    count = query.session.query(func.count()).select_from(capped).scalar()
+    if count > cap:
+        return cap, True
+    return count, False
+
+
+def keyset_conditions(sort_column, id_column, sort_value, row_id, direction='next'):
+    """
+    Conditions selecting the rows after (sort_value, row_id) newest-first ('next'), or before it ('prev')
+
+    Each condition is one index range, and the list is in page order, so a page is read from the first
+    range and only continues into the next one if the first runs out.
+    """
+    nullable = sort_column.property.columns[0].nullable
+    if direction == 'prev':
+        if sort_value is None:
+            return [and_(sort_column.is_(None), id_column > row_id), sort_column.isnot(None)]
+        return [and_(sort_column >= sort_value,
+                     or_(sort_column > sort_value, and_(sort_column == sort_value, id_column > row_id)))]
+    if sort_value is None:
+        return [and_(sort_column.is_(None), id_column < row_id)]
+    # The redundant inclusive bound lets the planner turn the OR into an index range seek
+    conditions = [and_(sort_column <= sort_value,
+                       or_(sort_column < sort_value, and_(sort_column == sort_value, id_column < row_id)))]
+    if nullable:
+        conditions.append(sort_column.is_(None))
+    return conditions
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=20, with_total=False):
+    """
+    Paginate a query newest-first on (sort_column, id_column)
+
+    Args:
+        query: Unordered ORM query with all filters applied
+        sort_column: Model attribute to order by (descending)
+        id_column: Model primary key, used as the tie-breaker
+        cursor (str): Token from a previous page's next_cursor/prev_cursor
+        per_page (int): Page size
+        with_total (bool): Also return a capped row count
+
+    Returns:
+        KeysetPagination
+    """
+    position, direction = None, 'next'
+    if cursor:
+        try:
+            position, direction = decode_cursor(cursor)
+        except ValueError:
+            position, direction = None, 'next'
+
+    total, total_is_estimate = approximate_count(query) if with_total else (None, False)
+
+    conditions = [None]
+    if position:
+        conditions = keyset_conditions(sort_column, id_column, _parse_sort_value(sort_column, position[0]),
+                                       position[1], direction)
+
+    order = asc if direction == 'prev' else desc
+    query = query.order_by(None).order_by(order(sort_column), order(id_column))
+    rows = []
+    for condition in conditions:
+        segment = query if condition is None else query.filter(condition)
+        rows += segment.limit(per_page + 1 - len(rows)).all()
+        if len(rows) > per_page:
+            break
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = position is not None, has_more
+
+    sort_key, id_key = sort_column.key, id_column.key
+    next_cursor = encode_cursor(getattr(rows[-1], sort_key), getattr(rows[-1], id_key)) if rows and has_next else None
+    prev_cursor = encode_cursor(getattr(rows[0], sort_key), getattr(rows[0], id_key), 'prev') if rows and has_prev else None
+
+    return KeysetPagination(rows, per_page, next_cursor, prev_cursor, total, total_is_estimate)
@@ -0,0 +1,197 @@
+"""
+Payment provider HTTP client for Training Center CRM
+
+Every call to Vault, Tabby or Tamara goes through provider_request(), which
+keeps one pooled requests.Session per provider, so TLS connections are
+reused from call to call.  It also:
+
+- caps the number of concurrent calls, and the call rate, per provider
+- retries connection errors, timeouts, 429s and 5xx responses with
+  exponential backoff and jitter, sending the same Idempotency-Key each time
+- stops calling a provider for PROVIDER_BREAKER_RESET_SECONDS after
+  PROVIDER_BREAKER_THRESHOLD failed calls in a row (circuit breaker), so an
+  outage fails fast instead of tying up workers; one trial call then decides
+  whether to close the circuit again
+"""
+import logging
+import random
+import threading
+import time
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # Provider calls report "Requests library not available"
+    requests = None
+
+PROVIDER_TIMEOUT = (3.05, 15)  # Seconds to connect, seconds to wait for the response
+PROVIDER_MAX_CONCURRENCY = 16  # Calls in flight per provider (and pooled connections kept)
+PROVIDER_RATE_LIMIT = 200  # Calls per second per provider, unless listed below
+PROVIDER_RATE_LIMITS = {}  # Provider name: calls per second, for providers with a tighter limit
+PROVIDER_MAX_ATTEMPTS = 3
+PROVIDER_BACKOFF_SECONDS = 0.5  # Doubled for each further attempt
+PROVIDER_MAX_RETRY_AFTER = 10  # Longest Retry-After honoured, in seconds
+PROVIDER_BREAKER_THRESHOLD = 5
+PROVIDER_BREAKER_RESET_SECONDS = 30
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ProviderUnavailable(requests.exceptions.ConnectionError if requests else Exception):
+    """The provider's circuit is open; raised without calling it"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed, open, then half-open for one trial call"""
+
+    def __init__(self, failure_threshold=PROVIDER_BREAKER_THRESHOLD, reset_after=PROVIDER_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def allow(self):
+        """Whether a call may go ahead now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial_running and time.monotonic() - self._opened_at >= self.reset_after:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._trial_running or time.monotonic() - self._opened_at >= self.reset_after:
+                return 'half-open'
+            return 'open'
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` calls per second, in bursts of up to `rate`"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        """Wait until a call may be made"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderClient:
+    """Pooled session, concurrency cap, retries and circuit breaker for one provider"""
+
+    def __init__(self, name):
+        self.name = name
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PROVIDER_MAX_CONCURRENCY, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.slots = threading.BoundedSemaphore(PROVIDER_MAX_CONCURRENCY)
+        self.rate_limiter = RateLimiter(PROVIDER_RATE_LIMITS.get(name, PROVIDER_RATE_LIMIT))
+        self.breaker = CircuitBreaker()
+
+    def _backoff(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), PROVIDER_MAX_RETRY_AFTER)
+        return PROVIDER_BACKOFF_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+    def request(self, method, url, idempotency_key=None, **kwargs):
+        """
+        Send one request, retrying transient failures
+
+        Args:
+            method (str): HTTP method
+            url (str): Full provider URL
+            idempotency_key (str): Sent as Idempotency-Key so a retried POST cannot create twice
+            **kwargs: Passed to requests (headers, json, timeout, ...)
+
+        Returns:
+            requests.Response: The first non-retryable response, or the last retryable one
+
+        Raises:
+            ProviderUnavailable: The circuit is open
+            requests.exceptions.RequestException: Every attempt failed to get a response
+        """
+        if not self.breaker.allow():
+            raise ProviderUnavailable(f"{self.name} is unavailable after repeated failures; not calling it for now")
+        headers = dict(kwargs.pop('headers', None) or {})
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        kwargs.setdefault('timeout', PROVIDER_TIMEOUT)
+
+        for attempt in range(1, PROVIDER_MAX_ATTEMPTS + 1):
+            response = error = None
+            try:
+                self.rate_limiter.acquire()
+                with self.slots:
+                    response = self.session.request(method, url, headers=headers, **kwargs)
+            except requests.exceptions.RequestException as e:
+                error = e
+            if response is not None and response.status_code not in RETRYABLE_STATUS_CODES:
+                # A 4xx is a problem with the request, not with the provider
+                self.breaker.record_success()
+                return response
+            if attempt < PROVIDER_MAX_ATTEMPTS:
+                reason = error or f"HTTP {response.status_code}"
+                logging.warning(f"{self.name} {method} attempt {attempt} failed ({reason}); retrying")
+                time.sleep(self._backoff(attempt, response))
+
+        self.breaker.record_failure()
+        if response is not None:
+            return response
+        raise error
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def provider_client(provider):
+    """The process-wide client for a provider name ('vault', 'tabby', 'tamara')"""
+    with _clients_lock:
+        client = _clients.get(provider)
+        if client is None:
+            client = _clients[provider] = ProviderClient(provider)
+        return client
+
+
+def provider_request(provider, method, url, idempotency_key=None, **kwargs):
+    """provider_client(provider).request(...); see ProviderClient.request"""
+    return provider_client(provider).request(method, url, idempotency_key=idempotency_key, **kwargs)
+
+
+def provider_health():
+    """Circuit state per provider that has been called in this process"""
+    with _clients_lock:
+        return {name: client.breaker.state() for name, client in _clients.items()}
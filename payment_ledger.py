@@ -0,0 +1,94 @@
+"""
+Payment ledger for the Training Center CRM payments page
+
+The page shows, for a date range:
+- a summary of link counts and amounts per (provider, status), read with
+  one grouped query
+- one keyset-paginated page of links per provider tab, filterable by
+  status
+
+The summary names every provider and status explicitly.  That turns the
+date range into one short seek per (provider, status) on the
+ix_payment_link_provider_status_created index, instead of a scan of the
+whole payment history.  The listings read ix_payment_link_provider_created
+(or the status index when filtered) newest first, so the page costs the
+same however many links exist outside the range.
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from app import db
+from models import PaymentLink
+from pagination import keyset_paginate
+
+LEDGER_PAGE_SIZE = 20
+LEDGER_DEFAULT_DAYS = 30
+LEDGER_PROVIDERS = ('vault', 'tabby', 'tamara')  # Tabs on the payments page
+PAYMENT_STATUSES = ('creating', 'pending', 'paid', 'failed', 'expired', 'cancelled')
+
+
+def ledger_range(date_from=None, date_to=None):
+    """
+    Parse the page's date filters (YYYY-MM-DD), defaulting to the last LEDGER_DEFAULT_DAYS days
+
+    Returns:
+        tuple: (first day, last day), both dates
+    """
+    day_to = date.today()
+    day_from = day_to - timedelta(days=LEDGER_DEFAULT_DAYS)
+    try:
+        if date_from:
+            day_from = date.fromisoformat(date_from)
+        if date_to:
+            day_to = date.fromisoformat(date_to)
+    except ValueError:
+        pass
+    return day_from, day_to
+
+
+def _in_range(query, day_from, day_to):
+    return query.filter(PaymentLink.created_at >= datetime.combine(day_from, time.min),
+                        PaymentLink.created_at < datetime.combine(day_to + timedelta(days=1), time.min))
+
+
+def ledger_summary_query(provider_ids, day_from, day_to):
+    """(provider_id, status, links, amount) per provider and status for links created in the range"""
+    query = db.session.query(PaymentLink.provider_id, PaymentLink.status,
+                             func.count(PaymentLink.id), func.sum(PaymentLink.amount)) \
+        .filter(PaymentLink.provider_id.in_(provider_ids), PaymentLink.status.in_(PAYMENT_STATUSES))
+    return _in_range(query, day_from, day_to).group_by(PaymentLink.provider_id, PaymentLink.status)
+
+
+def ledger_summary(provider_ids, day_from, day_to):
+    """
+    Link counts and amounts for links created in the range
+
+    Returns:
+        dict: {'providers': {provider_id: {status: {'count', 'amount'}}},
+               'totals': {status: {'count', 'amount'}}}
+    """
+    providers = {provider_id: {} for provider_id in provider_ids}
+    totals = {status: {'count': 0, 'amount': 0.0} for status in PAYMENT_STATUSES}
+    if provider_ids:
+        for provider_id, status, count, amount in ledger_summary_query(provider_ids, day_from, day_to):
+            providers[provider_id][status] = {'count': count, 'amount': float(amount or 0)}
+            totals[status]['count'] += count
+            totals[status]['amount'] += float(amount or 0)
+    return {'providers': providers, 'totals': totals}
+
+
+def ledger_links_query(provider_id, day_from, day_to, status=None):
+    """Unordered query for one provider's links in the range, with their lead and student"""
+    query = PaymentLink.query.options(joinedload(PaymentLink.lead), joinedload(PaymentLink.student)) \
+        .filter(PaymentLink.provider_id == provider_id)
+    if status:
+        query = query.filter(PaymentLink.status == status)
+    return _in_range(query, day_from, day_to)
+
+
+def ledger_page(provider_id, day_from, day_to, status=None, cursor=None, per_page=LEDGER_PAGE_SIZE):
+    """One newest-first page of a provider's links; see ledger_links_query"""
+    return keyset_paginate(ledger_links_query(provider_id, day_from, day_to, status),
+                           PaymentLink.created_at, PaymentLink.id, cursor=cursor, per_page=per_page)
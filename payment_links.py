@@ -0,0 +1,109 @@
+"""
+Asynchronous payment link creation for Training Center CRM
+
+Creating a link used to call the provider inside the web request, holding a
+worker for as long as the provider took.  Now the route saves the
+PaymentLink in the "creating" state and returns at once; a background job
+asks the provider (through payment_gateway's pooled, retrying client) and
+moves the link to "pending" with its payment URL, or to "failed" with the
+provider's error.  The payments page polls /api/payments/links/<id> for
+links that are still being created.
+
+The payment reference is sent as the idempotency key, so retrying a failed
+or stuck link cannot make the provider create a second one.  Once the
+link's payment id is stored, webhook events that arrived before it are
+applied.
+"""
+import logging
+from datetime import datetime, timedelta
+
+import background
+from app import db
+from models import Lead, PaymentLink
+from payment_webhooks import schedule_apply
+from utils import create_payment_link
+
+# A link still "creating" after this long lost its job (e.g. a worker restart) and may be retried
+CREATING_STUCK_AFTER = timedelta(minutes=10)
+
+
+def customer_info_for(payment_link):
+    """Customer details sent to the provider, from the link's lead"""
+    lead = db.session.get(Lead, payment_link.lead_id) if payment_link.lead_id else None
+    if not lead:
+        return None
+    return {"name": lead.name, "email": lead.email or "", "phone": lead.phone or ""}
+
+
+def start_link_creation(payment_link, callback_url=None):
+    """
+    Ask the provider for a committed link's payment URL in the background
+
+    Args:
+        payment_link (PaymentLink): Committed link in the "creating" state
+        callback_url (str): Where the provider reports payments, built in the request
+
+    Returns:
+        Future: Resolves to the link's new status
+    """
+    return background.submit(create_provider_link, payment_link.id, callback_url)
+
+
+def create_provider_link(link_id, callback_url=None):
+    """Background job: create the provider's link for a "creating" PaymentLink and store the outcome"""
+    payment_link = db.session.get(PaymentLink, link_id)
+    if payment_link is None or payment_link.status != 'creating':
+        return payment_link.status if payment_link else None
+
+    result = create_payment_link(
+        provider=payment_link.provider.name.lower(),
+        amount=payment_link.amount,
+        currency=payment_link.currency,
+        description=payment_link.description,
+        customer_info=customer_info_for(payment_link),
+        callback_url=callback_url,
+        idempotency_key=payment_link.payment_reference
+    )
+
+    if result.get('success'):
+        payment_link.payment_url = result.get('payment_link')
+        payment_link.external_payment_id = result.get('payment_id')
+        payment_link.provider_error = None
+        payment_link.status = 'pending'
+    else:
+        payment_link.provider_error = (result.get('error') or 'Payment link creation failed')[:500]
+        payment_link.status = 'failed'
+        logging.warning(f"Payment link {payment_link.payment_reference} failed: {payment_link.provider_error}")
+    db.session.commit()
+    if payment_link.status == 'pending':
+        # The provider may already have reported this payment
+        schedule_apply()
+    return payment_link.status
+
+
+def can_retry(payment_link):
+    """Failed links, and links whose creation job was lost, may be sent to the provider again"""
+    if payment_link.status == 'failed':
+        return not payment_link.external_payment_id
+    return payment_link.status == 'creating' and payment_link.created_at is not None \
+        and datetime.utcnow() - payment_link.created_at > CREATING_STUCK_AFTER
+
+
+def retry_link_creation(payment_link, callback_url=None):
+    """Put a retryable link back in the "creating" state and start a new creation job"""
+    payment_link.status = 'creating'
+    payment_link.provider_error = None
+    db.session.commit()
+    return start_link_creation(payment_link, callback_url)
+
+
+def link_status_payload(payment_link):
+    """JSON form of a link's creation state for /api/payments/links/<id>"""
+    return {
+        'id': payment_link.id,
+        'reference': payment_link.payment_reference,
+        'status': payment_link.status,
+        'payment_url': payment_link.payment_url if payment_link.status == 'pending' else None,
+        'error': payment_link.provider_error,
+        'can_retry': can_retry(payment_link),
+    }
@@ -0,0 +1,347 @@
+"""
+Local stand-in for the Vault, Tabby and Tamara payment APIs
+
+Serves the endpoints utils.py calls (create a link, read its status) with
+configurable latency and error rates, and sends the signed webhooks
+payment_webhooks.py accepts, so payment flows can be exercised and
+load-tested without provider accounts:
+
+    python payment_provider_stub.py --port 8099 --latency 0.5 --failure-rate 0.2
+    python payment_provider_stub.py --webhook-secret s3cret --settle-after 2 --paid-rate 0.9
+
+then start the CRM with the settings it prints (any API key is accepted).
+
+- Latency: every provider call waits --latency seconds plus up to --jitter more.
+- Errors: a share of calls is answered 503 (--failure-rate), 429 with a
+  Retry-After header (--throttle-rate), or dropped without a response
+  (--drop-rate).
+- Links are idempotent on the Idempotency-Key header, like the real providers.
+- Webhooks go to the callback URL sent when the link was created, signed
+  with --webhook-secret, whenever a link's status changes: --settle-after
+  seconds after creation (paid for --paid-rate of links, declined for the
+  rest), or on POST /stub/payments/<id>/<status>.  --webhook-copies > 1
+  delivers every event that many times, as providers do when they retry.
+
+start_stub() runs the same server in a thread for scripts such as
+benchmark_payment_links.py.
+"""
+import argparse
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+# Path prefix per provider; the paths after it mirror the real APIs
+CREATE_PATHS = {
+    '/vault/v1/payment-links': 'vault',
+    '/tabby/api/v2/checkout': 'tabby',
+    '/tamara/checkout': 'tamara',
+}
+STATUS_PATHS = {
+    'vault': re.compile(r'^/vault/v1/payment-links/([\w-]+)$'),
+    'tabby': re.compile(r'^/tabby/api/v2/checkout/([\w-]+)$'),
+    'tamara': re.compile(r'^/tamara/orders/([\w-]+)$'),
+}
+SET_STATUS_PATH = re.compile(r'^/stub/payments/([\w-]+)/(\w+)$')
+
+# (paid, declined) status names per provider, as their webhooks and status calls report them
+SETTLED_STATUSES = {
+    'vault': ('paid', 'failed'),
+    'tabby': ('CLOSED', 'REJECTED'),
+    'tamara': ('fully_captured', 'declined'),
+}
+# Header carrying the webhook signature, and the payload fields for (payment id, status), per provider
+WEBHOOK_SIGNATURE_HEADERS = {
+    'vault': 'X-Vault-Signature',
+    'tabby': 'X-Tabby-Signature',
+    'tamara': 'X-Tamara-Signature',
+}
+WEBHOOK_FIELDS = {
+    'vault': ('id', 'status'),
+    'tabby': ('id', 'status'),
+    'tamara': ('order_id', 'order_status'),
+}
+WEBHOOK_ATTEMPTS = 3
+WEBHOOK_WORKERS = 8
+
+
+def callback_url_of(provider, body):
+    """Where a link's webhooks go: the callback URL in its create request, without the query string"""
+    if provider == 'vault':
+        url = body.get('callback_url')
+    else:
+        url = (body.get('merchant_urls') or body.get('merchant_url') or {}).get('success')
+    return url.split('?')[0] if url else None
+
+
+class WebhookDispatcher:
+    """Runs delayed jobs (settling links, delivering webhooks) on a few worker threads"""
+
+    def __init__(self, workers=WEBHOOK_WORKERS):
+        self._queue = []  # (due, sequence, func, args)
+        self._sequence = itertools.count()
+        self._ready = threading.Condition()
+        for _ in range(workers):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def schedule(self, delay, func, *args):
+        with self._ready:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._sequence), func, args))
+            self._ready.notify()
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._ready.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                _, _, func, args = heapq.heappop(self._queue)
+            func(*args)
+
+
+class StubProviderState:
+    """Links created so far and the simulation settings, shared by the handler threads"""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, jitter=0.0, throttle_rate=0.0, drop_rate=0.0,
+                 retry_after=1, webhook_secret=None, settle_after=None, paid_rate=1.0, webhook_copies=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.drop_rate = drop_rate
+        self.retry_after = retry_after
+        self.webhook_secret = webhook_secret
+        self.settle_after = settle_after
+        self.paid_rate = paid_rate
+        self.webhook_copies = webhook_copies
+        self.lock = threading.Lock()
+        self.payments = {}  # payment id: {'provider', 'status', 'body', 'callback_url'}
+        self.idempotency = {}  # (provider, key): payment id
+        self.requests = 0
+        self.stats = Counter()  # created, 503, 429, dropped, webhooks_delivered, webhooks_failed
+        self.dispatcher = WebhookDispatcher() if webhook_secret else None
+
+    def create(self, provider, key, body):
+        with self.lock:
+            payment_id = self.idempotency.get((provider, key)) if key else None
+            if payment_id is not None:
+                return payment_id
+            payment_id = uuid.uuid4().hex[:16]
+            self.payments[payment_id] = {'provider': provider, 'status': 'pending', 'body': body,
+                                         'callback_url': callback_url_of(provider, body)}
+            if key:
+                self.idempotency[(provider, key)] = payment_id
+            self.stats['created'] += 1
+        if self.dispatcher and self.settle_after is not None:
+            self.dispatcher.schedule(self.settle_after, self.settle, payment_id)
+        return payment_id
+
+    def settle(self, payment_id):
+        """Pay or decline a link that is still pending, as its customer would"""
+        with self.lock:
+            payment = self.payments[payment_id]
+            if payment['status'] != 'pending':
+                return
+        paid, declined = SETTLED_STATUSES[payment['provider']]
+        self.set_status(payment_id, paid if random.random() < self.paid_rate else declined)
+
+    def set_status(self, payment_id, status):
+        """Change a link's status and send its webhook; returns False for an unknown link"""
+        with self.lock:
+            payment = self.payments.get(payment_id)
+            if payment is None:
+                return False
+            payment['status'] = status
+        if self.dispatcher and payment['callback_url']:
+            id_field, status_field = WEBHOOK_FIELDS[payment['provider']]
+            event = {'event_id': uuid.uuid4().hex, id_field: payment_id, status_field: status}
+            for _ in range(self.webhook_copies):
+                self.dispatcher.schedule(0, self.deliver, payment['provider'], payment['callback_url'], event)
+        return True
+
+    def deliver(self, provider, url, event):
+        """POST one signed webhook, retrying failed deliveries with backoff"""
+        body = json.dumps(event).encode()
+        signature = hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+        headers = {'Content-Type': 'application/json', WEBHOOK_SIGNATURE_HEADERS[provider]: signature}
+        for attempt in range(1, WEBHOOK_ATTEMPTS + 1):
+            try:
+                with urlopen(Request(url, data=body, headers=headers, method='POST'), timeout=10):
+                    pass
+                with self.lock:
+                    self.stats['webhooks_delivered'] += 1
+                return
+            except (URLError, OSError):
+                if attempt < WEBHOOK_ATTEMPTS:
+                    time.sleep(0.5 * 2 ** (attempt - 1))
+        with self.lock:
+            self.stats['webhooks_failed'] += 1
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so pooled client sessions reuse connections
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+    def _simulate(self):
+        """Latency and random errors; returns True when the error was already answered"""
+        state = self.server.state
+        with state.lock:
+            state.requests += 1
+        delay = state.latency + random.uniform(0, state.jitter)
+        if delay:
+            time.sleep(delay)
+        roll = random.random()
+        if roll < state.drop_rate:
+            with state.lock:
+                state.stats['dropped'] += 1
+            self.close_connection = True
+            return True
+        roll -= state.drop_rate
+        if roll < state.throttle_rate:
+            with state.lock:
+                state.stats['429'] += 1
+            self._reply(429, {'error': 'Too many requests'}, {'Retry-After': str(state.retry_after)})
+            return True
+        roll -= state.throttle_rate
+        if roll < state.failure_rate:
+            with state.lock:
+                state.stats['503'] += 1
+            self._reply(503, {'error': 'Service unavailable'})
+            return True
+        return False
+
+    def do_POST(self):
+        state = self.server.state
+        match = SET_STATUS_PATH.match(self.path)
+        if match:
+            found = state.set_status(match.group(1), match.group(2))
+            return self._reply(200 if found else 404, {'id': match.group(1), 'status': match.group(2)})
+
+        provider = CREATE_PATHS.get(self.path)
+        if provider is None:
+            return self._reply(404, {'error': 'Not found'})
+        body = self._read_json()
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self._reply(401, {'error': 'Unauthorized'})
+        if self._simulate():
+            return
+
+        payment_id = state.create(provider, self.headers.get('Idempotency-Key'), body)
+        url = f"http://{self.headers.get('Host')}/pay/{payment_id}"
+        if provider == 'vault':
+            return self._reply(201, {'id': payment_id, 'url': url, 'expires_at': None})
+        if provider == 'tabby':
+            return self._reply(201, {'id': payment_id, 'web_url': url, 'expires_at': None})
+        return self._reply(201, {'order_id': payment_id, 'checkout_url': url})
+
+    def do_GET(self):
+        state = self.server.state
+        for provider, pattern in STATUS_PATHS.items():
+            match = pattern.match(self.path)
+            if match:
+                if self._simulate():
+                    return
+                with state.lock:
+                    payment = state.payments.get(match.group(1))
+                if payment is None or payment['provider'] != provider:
+                    return self._reply(404, {'error': 'Not found'})
+                return self._reply(200, {'id': match.group(1), 'status': payment['status']})
+        self._reply(404, {'error': 'Not found'})
+
+
+def stub_config(base_url, webhook_secret=None):
+    """CRM settings that point the provider calls (and accept the webhooks of) a stub running at base_url"""
+    config = {
+        'VAULT_API_KEY': 'stub', 'TABBY_API_KEY': 'stub', 'TAMARA_API_TOKEN': 'stub',
+        'VAULT_API_URL': f"{base_url}/vault/v1/payment-links",
+        'TABBY_API_URL': f"{base_url}/tabby/api/v2/checkout",
+        'TAMARA_API_URL': f"{base_url}/tamara/checkout",
+        'TAMARA_ORDERS_URL': f"{base_url}/tamara/orders",
+    }
+    if webhook_secret:
+        for provider in WEBHOOK_SIGNATURE_HEADERS:
+            config[f'{provider.upper()}_WEBHOOK_SECRET'] = webhook_secret
+    return config
+
+
+def make_server(port=0, latency=0.0, failure_rate=0.0, host='127.0.0.1', **simulation):
+    """A stub server; simulation takes the other StubProviderState settings (jitter, throttle_rate, ...)"""
+    server = ThreadingHTTPServer((host, port), StubProviderHandler)
+    server.daemon_threads = True
+    server.state = StubProviderState(latency, failure_rate, **simulation)
+    return server
+
+
+def start_stub(port=0, latency=0.0, failure_rate=0.0, **simulation):
+    """Run a stub in a daemon thread; returns (server, base URL).  Stop it with server.shutdown()"""
+    server = make_server(port, latency, failure_rate, **simulation)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def add_simulation_arguments(parser):
+    """The latency, error and webhook options, shared with benchmark_payment_links.py"""
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every provider call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many more seconds, at random')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of provider calls answered with 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Share of provider calls answered with 429 and Retry-After')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with a 429')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='Share of provider calls whose connection is closed without a response')
+    parser.add_argument('--webhook-secret', help='Send webhooks signed with this secret')
+    parser.add_argument('--settle-after', type=float,
+                        help='Seconds after creation each link is paid or declined (needs --webhook-secret)')
+    parser.add_argument('--paid-rate', type=float, default=1.0, help='Share of settled links that are paid')
+    parser.add_argument('--webhook-copies', type=int, default=1, help='Deliveries of each webhook event')
+
+
+def simulation_settings(args):
+    """make_server() keyword arguments from add_simulation_arguments() options"""
+    return {
+        'latency': args.latency, 'failure_rate': args.failure_rate, 'jitter': args.jitter,
+        'throttle_rate': args.throttle_rate, 'drop_rate': args.drop_rate, 'retry_after': args.retry_after,
+        'webhook_secret': args.webhook_secret, 'settle_after': args.settle_after,
+        'paid_rate': args.paid_rate, 'webhook_copies': args.webhook_copies,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    add_simulation_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args.port, **simulation_settings(args))
+    print(f"✓ Stub payment provider listening on http://127.0.0.1:{args.port}")
+    for setting, value in stub_config(f"http://127.0.0.1:{args.port}", args.webhook_secret).items():
+        print(f"  export {setting}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"✓ Stopped: {dict(server.state.stats)}")
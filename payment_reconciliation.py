@@ -0,0 +1,172 @@
+"""
+Payment status reconciliation for Training Center CRM
+
+Providers report payments to the callback URL, but callbacks get lost, so
+reconcile_payments() also asks them.  Each pass:
+
+1. marks pending links past their expires_at as expired, with one UPDATE
+2. walks the pending links in id order, RECONCILE_BATCH_SIZE at a time
+3. asks the providers for each batch concurrently, on RECONCILE_WORKERS
+   threads.  The calls go through payment_gateway, so each provider keeps
+   its own connection pool, concurrency cap, rate limit and circuit breaker.
+4. writes each batch's changes with one UPDATE per new status, except that
+   links that became paid are settled through mark_links_paid(), which
+   credits the student's fee_paid in the same transaction
+
+Only links that are still pending are updated, so a callback or a second
+reconciler running at the same time is never overwritten, and a payment is
+credited once whichever of the webhook and the reconciler sees it first.
+A pass makes about min(rate limit, PROVIDER_MAX_CONCURRENCY / provider
+latency) calls per second per provider, so at ~100 ms per call tens of
+thousands of pending links are checked within a minute;
+reconcile_payments.py runs passes back to back.
+"""
+import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from models import PaymentLink, PaymentProvider, Student
+from utils import verify_payment_status
+
+RECONCILE_BATCH_SIZE = 500
+RECONCILE_WORKERS = 32
+RECONCILE_INTERVAL_SECONDS = 30
+
+# Provider statuses (lowercased) that settle a link; anything else leaves it pending.  An approved or
+# authorized payment (Tabby AUTHORIZED, Tamara approved/authorised) is not captured yet and can still be
+# voided, so it stays pending until capture (Tabby CLOSED, Tamara fully_captured) credits the student.
+PROVIDER_STATUSES = {
+    'paid': 'paid', 'completed': 'paid', 'captured': 'paid', 'fully_captured': 'paid', 'closed': 'paid',
+    'failed': 'failed', 'rejected': 'failed', 'declined': 'failed',
+    'expired': 'expired',
+    'cancelled': 'cancelled', 'canceled': 'cancelled',
+}
+
+
+def pending_links_query(after_id=0, limit=RECONCILE_BATCH_SIZE):
+    """(id, external_payment_id, provider name) of the next pending links after after_id"""
+    return db.session.query(PaymentLink.id, PaymentLink.external_payment_id, PaymentProvider.name) \
+        .join(PaymentProvider, PaymentLink.provider_id == PaymentProvider.id) \
+        .filter(PaymentLink.status == 'pending', PaymentLink.id > after_id,
+                PaymentLink.external_payment_id.isnot(None)) \
+        .order_by(PaymentLink.id).limit(limit)
+
+
+def expire_links(now=None):
+    """Mark pending links past their expiry as expired; returns how many were"""
+    # expires_at is written in server local time (see create_payment_link in routes.py)
+    now = now or datetime.now()
+    table = PaymentLink.__table__
+    result = db.session.execute(table.update().where(
+        table.c.status == 'pending', table.c.expires_at < now
+    ).values(status='expired'))
+    db.session.commit()
+    return result.rowcount
+
+
+def mark_links_paid(links, paid_at):
+    """
+    Settle payment links as paid and credit each amount to its student's fee_paid
+
+    Links that are already paid are left alone, so a payment is credited once
+    however many webhooks and reconciliation passes report it.  Students are
+    loaded and changed through the ORM so the enrollment rollups follow; the
+    caller commits, so the status change and the credit share a transaction.
+
+    Args:
+        links (list): PaymentLink rows, locked by the caller
+        paid_at (datetime): Recorded on the links
+
+    Returns:
+        list: The links that became paid
+    """
+    newly_paid = [link for link in links if link.status != 'paid']
+    student_ids = {link.student_id for link in newly_paid if link.student_id}
+    students = {student.id: student for student in Student.query.filter(
+        Student.id.in_(student_ids)
+    ).with_for_update()} if student_ids else {}
+    for link in newly_paid:
+        link.status = 'paid'
+        link.paid_at = paid_at
+        student = students.get(link.student_id)
+        if student:
+            student.fee_paid = (student.fee_paid or 0) + (link.amount or 0)
+    return newly_paid
+
+
+def apply_status_changes(changes, paid_at=None):
+    """
+    Write reconciled statuses with one UPDATE per status; paid links go through mark_links_paid()
+
+    Args:
+        changes (dict): New status: [link ids]
+        paid_at (datetime): Recorded on links that became paid
+
+    Returns:
+        int: Links updated (links that stopped being pending meanwhile are skipped)
+    """
+    table = PaymentLink.__table__
+    updated = 0
+    for status, link_ids in changes.items():
+        if status == 'paid':
+            links = PaymentLink.query.filter(PaymentLink.id.in_(link_ids), PaymentLink.status == 'pending') \
+                .with_for_update().all()
+            updated += len(mark_links_paid(links, paid_at or datetime.utcnow()))
+            continue
+        values = {'status': status}
+        updated += db.session.execute(table.update().where(
+            table.c.id.in_(link_ids), table.c.status == 'pending'
+        ).values(**values)).rowcount
+    db.session.commit()
+    return updated
+
+
+def _provider_status(app, row):
+    """Settled status for one link, 'pending' if unchanged, or None if the provider could not say"""
+    with app.app_context():
+        result = verify_payment_status(row.name, row.external_payment_id)
+    if not result.get('success'):
+        return None
+    return PROVIDER_STATUSES.get(str(result.get('status', '')).lower(), 'pending')
+
+
+def reconcile_payments(batch_size=RECONCILE_BATCH_SIZE, workers=RECONCILE_WORKERS):
+    """
+    One reconciliation pass over every pending payment link
+
+    Returns:
+        Counter: expired, checked, errors, and links moved to each status
+    """
+    stats = Counter()
+    stats['expired'] = expire_links()
+    app = current_app._get_current_object()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crm-reconcile') as pool:
+        after_id = 0
+        while True:
+            batch = pending_links_query(after_id, batch_size).all()
+            # Release the connection while the providers are asked
+            db.session.commit()
+            if not batch:
+                break
+            after_id = batch[-1].id
+
+            changes = defaultdict(list)
+            for row, status in zip(batch, pool.map(lambda row: _provider_status(app, row), batch)):
+                stats['checked'] += 1
+                if status is None:
+                    stats['errors'] += 1
+                elif status != 'pending':
+                    changes[status].append(row.id)
+            if changes:
+                apply_status_changes(changes)
+                for status, link_ids in changes.items():
+                    stats[status] += len(link_ids)
+
+    if stats['errors']:
+        logging.warning(f"Payment reconciliation could not check {stats['errors']} links")
+    return stats
@@ -0,0 +1,214 @@
+"""
+Payment provider webhooks for Training Center CRM
+
+A webhook costs the request one signature check and one INSERT:
+record_event() verifies the HMAC signature, stores the raw body as a
+PaymentEvent under the provider's event id (or a hash of the body when it
+sends none), and the endpoint answers 200 at once.  A redelivered event hits
+the unique (provider, event_key) constraint and is acknowledged without
+being stored twice.
+
+Events are applied to their PaymentLink (status, paid_at, webhook_data) and
+to the student's fee_paid later, WEBHOOK_BATCH_SIZE at a time, by a
+background job that recorded events wake up.  A burst of events
+shares one job, so a provider's retry storm costs a few batched passes
+instead of a database transaction per request.  reconcile_payments.py
+also applies anything left behind, for example by a worker restart.
+
+A provider can report a payment before the link's creation job has stored
+its payment id.  Such an event is left unprocessed and tried again on later
+passes (and when a link is created) for WEBHOOK_MATCH_WINDOW, and only then
+closed out as an unknown payment.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+import background
+from app import db
+from models import PaymentEvent, PaymentLink
+from payment_reconciliation import PROVIDER_STATUSES, mark_links_paid
+
+WEBHOOK_PROVIDERS = ('vault', 'tabby', 'tamara')
+WEBHOOK_SIGNATURE_HEADERS = {
+    'vault': 'X-Vault-Signature',
+    'tabby': 'X-Tabby-Signature',
+    'tamara': 'X-Tamara-Signature',
+}
+# Payload fields holding (provider payment id, payment status), per provider
+WEBHOOK_FIELDS = {
+    'vault': ('id', 'status'),
+    'tabby': ('id', 'status'),
+    'tamara': ('order_id', 'order_status'),
+}
+WEBHOOK_BATCH_SIZE = 200
+WEBHOOK_BATCH_DELAY = 0.2  # Seconds a woken job waits so a burst of events lands in one batch
+WEBHOOK_MATCH_WINDOW = timedelta(hours=1)  # How long an event waits for its link's payment id to be stored
+
+
+class WebhookError(Exception):
+    """Webhook refused; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def webhook_signature(secret, body):
+    """Hex HMAC-SHA256 of the raw body, as the providers sign it"""
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def record_event(provider, body, headers):
+    """
+    Verify and store one webhook
+
+    Args:
+        provider (str): 'vault', 'tabby' or 'tamara'
+        body (bytes): Raw request body
+        headers: Request headers
+
+    Returns:
+        bool: True if the event is new, False if it was already received
+
+    Raises:
+        WebhookError: Unknown provider, missing secret, bad signature or body
+    """
+    if provider not in WEBHOOK_PROVIDERS:
+        raise WebhookError('Unknown payment provider', 404)
+    secret = current_app.config.get(f'{provider.upper()}_WEBHOOK_SECRET')
+    if not secret:
+        logging.error(f"{provider} webhook received but {provider.upper()}_WEBHOOK_SECRET is not configured")
+        raise WebhookError('Webhook not configured', 401)
+    signature = headers.get(WEBHOOK_SIGNATURE_HEADERS[provider], '')
+    if not hmac.compare_digest(signature.lower(), webhook_signature(secret, body)):
+        raise WebhookError('Invalid signature', 401)
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise WebhookError('Body must be JSON')
+    if not isinstance(payload, dict):
+        raise WebhookError('Body must be a JSON object')
+
+    event_key = str(payload.get('event_id') or headers.get('Idempotency-Key') or hashlib.sha256(body).hexdigest())
+    try:
+        db.session.execute(PaymentEvent.__table__.insert().values(
+            provider=provider, event_key=event_key[:200], payload=body.decode('utf-8', 'replace'),
+            received_at=datetime.utcnow()
+        ))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    schedule_apply()
+    return True
+
+
+_apply_lock = threading.Lock()
+_apply_scheduled = False
+
+
+def schedule_apply():
+    """Start a background job applying pending events, unless one is already waiting to start"""
+    global _apply_scheduled
+    with _apply_lock:
+        if _apply_scheduled:
+            return
+        _apply_scheduled = True
+    background.submit(_apply_soon)
+
+
+def _apply_soon():
+    global _apply_scheduled
+    time.sleep(WEBHOOK_BATCH_DELAY)
+    # Clear the flag before reading, so an event recorded from now on schedules another job
+    with _apply_lock:
+        _apply_scheduled = False
+    return apply_payment_events()
+
+
+def _event_fields(event):
+    """(provider payment id, settled CRM status or None) of an event"""
+    try:
+        payload = json.loads(event.payload)
+    except ValueError:
+        return None, None
+    id_field, status_field = WEBHOOK_FIELDS[event.provider]
+    payment_id = payload.get(id_field) or payload.get('payment_id')
+    status = PROVIDER_STATUSES.get(str(payload.get(status_field) or payload.get('status') or '').lower())
+    return (str(payment_id) if payment_id else None), status
+
+
+def _apply_event(event, payment_id, payment_link, status, now):
+    """Apply one event to its link; returns the event's outcome, or None to try it again later"""
+    if payment_link is None:
+        if payment_id and event.received_at and now - event.received_at < WEBHOOK_MATCH_WINDOW:
+            # The link's creation job may not have stored this payment id yet
+            return None
+        return 'unknown payment'
+    payment_link.webhook_data = event.payload
+    if status is None:
+        return 'no status change'
+    if payment_link.status == 'paid':
+        return 'already paid'
+    if status != 'paid' and payment_link.status not in ('creating', 'pending'):
+        return f'already {payment_link.status}'
+
+    if status == 'paid':
+        mark_links_paid([payment_link], event.received_at or now)
+    else:
+        payment_link.status = status
+    return status
+
+
+def unprocessed_events_query(after_id=0, limit=WEBHOOK_BATCH_SIZE):
+    """The next unprocessed events after after_id, oldest first"""
+    return PaymentEvent.query.filter(PaymentEvent.processed_at.is_(None), PaymentEvent.id > after_id) \
+        .order_by(PaymentEvent.id).limit(limit)
+
+
+def apply_payment_events(batch_size=WEBHOOK_BATCH_SIZE):
+    """
+    Apply every unprocessed event, oldest first, one batch per transaction
+
+    Returns:
+        int: Events processed (events still waiting for their link are not counted)
+    """
+    processed = 0
+    after_id = 0
+    while True:
+        # Skip rows another worker is applying right now (MySQL; SQLite serializes writers anyway)
+        events = unprocessed_events_query(after_id, batch_size).with_for_update(skip_locked=True).all()
+        if not events:
+            db.session.commit()
+            return processed
+        after_id = events[-1].id
+
+        fields = {event.id: _event_fields(event) for event in events}
+        payment_ids = {payment_id for payment_id, _ in fields.values() if payment_id}
+        links = {link.external_payment_id: link for link in PaymentLink.query.filter(
+            PaymentLink.external_payment_id.in_(payment_ids)
+        ).with_for_update()} if payment_ids else {}
+
+        now = datetime.utcnow()
+        try:
+            for event in events:
+                payment_id, status = fields[event.id]
+                outcome = _apply_event(event, payment_id, links.get(payment_id), status, now)
+                if outcome is None:
+                    continue
+                event.outcome = outcome
+                event.processed_at = now
+                processed += 1
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logging.exception("Applying payment events failed")
+            raise
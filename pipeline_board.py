@@ -0,0 +1,57 @@
+"""
+Kanban board columns for the Training Center CRM pipeline
+
+Each status column is read one page at a time, newest leads first, with
+keyset pagination on (created_at, id): the first PIPELINE_PAGE_SIZE cards
+are rendered with the page and the board fetches further pages from
+``/api/pipeline/leads`` as a column is scrolled.  Cards are built from a
+single column query with the course name joined in, so no Lead objects or
+lazy relationship loads are involved.
+"""
+from models import Course, Lead
+from pagination import keyset_paginate
+
+PIPELINE_PAGE_SIZE = 25
+MAX_PIPELINE_PAGE_SIZE = 100
+
+
+def _card_columns(query):
+    return query.outerjoin(Course, Lead.course_interest_id == Course.id).with_entities(
+        Lead.id.label('id'), Lead.name.label('name'), Lead.phone.label('phone'),
+        Lead.whatsapp.label('whatsapp'), Lead.email.label('email'), Lead.status.label('status'),
+        Lead.quoted_amount.label('quoted_amount'), Course.name.label('course_name'),
+        Lead.next_followup_date.label('next_followup_date'), Lead.created_at.label('created_at')
+    )
+
+
+def card_payload(row):
+    """The fields a pipeline card shows; lead events carry the same keys"""
+    return {
+        'id': row.id,
+        'name': row.name,
+        'phone': row.phone,
+        'whatsapp': row.whatsapp,
+        'email': row.email,
+        'status': row.status,
+        'quoted_amount': row.quoted_amount or 0.0,
+        'course_name': row.course_name,
+        'next_followup_date': row.next_followup_date.isoformat() if row.next_followup_date else None,
+    }
+
+
+def pipeline_column(scoped_query, status, cursor=None, per_page=PIPELINE_PAGE_SIZE):
+    """
+    One page of a status column
+
+    Args:
+        scoped_query: Lead query restricted to the leads on the user's board
+        status (str): Pipeline status
+        cursor (str): next_cursor of the previous page
+        per_page (int): Page size, capped at MAX_PIPELINE_PAGE_SIZE
+
+    Returns:
+        KeysetPagination: items are rows with the card_payload() fields
+    """
+    per_page = max(1, min(per_page or PIPELINE_PAGE_SIZE, MAX_PIPELINE_PAGE_SIZE))
+    return keyset_paginate(_card_columns(scoped_query.filter(Lead.status == status)),
+                           Lead.created_at, Lead.id, cursor=cursor, per_page=per_page)
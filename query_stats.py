@@ -0,0 +1,53 @@
+"""
+Per-request SQL statement counting for Training Center CRM
+
+Every statement sent to the database while a request is being handled is
+counted by a ``before_cursor_execute`` listener.  Requests that issue more
+than SQL_QUERY_WARN_THRESHOLD statements are logged with their endpoint,
+which is where N+1 lazy loads show up, and with SQL_QUERY_STATS enabled
+(the default in debug mode) every response carries its count in an
+``X-SQL-Queries`` header.  check_query_budgets.py uses that header to hold
+each page to a fixed statement budget.
+
+Streamed response bodies (exports, /api/events) run after the response
+headers are sent and are not counted.
+"""
+import logging
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_WARN_THRESHOLD = 30
+QUERY_COUNT_HEADER = 'X-SQL-Queries'
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+
+
+def query_count():
+    """Number of SQL statements the current request has issued so far"""
+    return g.get('sql_statements', 0) if has_request_context() else 0
+
+
+def init_app(app):
+    app.config.setdefault('SQL_QUERY_STATS', app.debug)
+    app.config.setdefault('SQL_QUERY_WARN_THRESHOLD', DEFAULT_WARN_THRESHOLD)
+    if not event.contains(Engine, 'before_cursor_execute', _count_statement):
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+
+    @app.before_request
+    def reset_query_count():
+        g.sql_statements = 0
+
+    @app.after_request
+    def report_query_count(response):
+        count = query_count()
+        threshold = app.config['SQL_QUERY_WARN_THRESHOLD']
+        if threshold and count > threshold:
+            logging.warning(f"{request.method} {request.path} ({request.endpoint}) issued {count} SQL statements")
+        if app.config['SQL_QUERY_STATS']:
+            response.headers[QUERY_COUNT_HEADER] = str(count)
+        return response
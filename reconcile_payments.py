@@ -0,0 +1,50 @@
+"""
+Reconcile pending payment links with the payment providers
+
+Applies webhook events that are still waiting, asks the providers for the
+status of every pending link, records payments, failures and cancellations,
+and expires links past their expiry date.  Run it continuously next to the
+web workers (one instance is enough; a second one is harmless), or once
+from cron:
+
+    python reconcile_payments.py
+    python reconcile_payments.py --once
+"""
+import argparse
+import time
+
+from app import app
+from payment_reconciliation import RECONCILE_INTERVAL_SECONDS, reconcile_payments
+from payment_webhooks import apply_payment_events
+
+
+def run_reconciliation(once=False, interval=RECONCILE_INTERVAL_SECONDS):
+    while True:
+        started = time.monotonic()
+        with app.app_context():
+            events = apply_payment_events()
+            stats = reconcile_payments()
+        elapsed = time.monotonic() - started
+        settled = ', '.join(f"{stats[status]} {status}" for status in ('paid', 'failed', 'cancelled'))
+        if events:
+            print(f"✓ Applied {events} waiting webhook events")
+        print(f"✓ Checked {stats['checked']} pending links in {elapsed:.1f}s: {settled}, "
+              f"{stats['expired']} expired")
+        if stats['errors']:
+            print(f"✗ {stats['errors']} links could not be checked")
+        if once:
+            return stats
+        # The next pass starts `interval` seconds after this one started, or right away if it ran long
+        time.sleep(max(0.0, interval - elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--once', action='store_true', help='Run a single pass and exit')
+    parser.add_argument('--interval', type=float, default=RECONCILE_INTERVAL_SECONDS,
+                        help='Seconds between the starts of passes')
+    args = parser.parse_args()
+    try:
+        run_reconciliation(args.once, args.interval)
+    except KeyboardInterrupt:
+        print("✓ Stopped")
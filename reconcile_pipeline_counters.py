@@ -0,0 +1,25 @@
+"""
+Reconcile the pipeline counters with the lead table
+
+The counters are maintained by Lead events and by the bulk import/bulk
+action code; anything that changes leads behind their back (manual SQL,
+restores) makes them drift.  Run this from cron, e.g. nightly:
+
+    python reconcile_pipeline_counters.py
+"""
+from app import app
+from models import PipelineCounter
+
+
+def reconcile_pipeline_counters():
+    with app.app_context():
+        corrections = PipelineCounter.reconcile()
+        for (consultant_id, status), (count, amount) in sorted(corrections.items()):
+            print(f"✗ consultant {consultant_id} / {status or '(no status)'}: "
+                  f"count {count:+d}, quoted {amount:+,.2f}")
+        print(f"✓ Pipeline counters reconciled ({len(corrections)} corrected)")
+        return corrections
+
+
+if __name__ == "__main__":
+    reconcile_pipeline_counters()
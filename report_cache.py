@@ -0,0 +1,117 @@
+"""
+Report result cache for Training Center CRM
+
+Report figures are cached per worker process, keyed by (report, date range,
+role scope).  An entry is served as is for REPORT_FRESH_SECONDS; after that,
+for up to REPORT_STALE_SECONDS more, the old result is still served while one
+background job recomputes it.  Concurrent requests that miss on the same key
+share a single computation instead of each running it (single flight).
+
+Hit, stale hit, miss, coalesced-wait, refresh and error counters are kept per
+process and reported by stats().
+"""
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+import background
+
+REPORT_FRESH_SECONDS = 60
+REPORT_STALE_SECONDS = 600
+MAX_REPORT_ENTRIES = 500  # Least recently used results are dropped beyond this
+
+
+class ReportCache:
+    """
+    Per-process cache of report results with single-flight computation
+    and stale-while-revalidate
+    """
+
+    def __init__(self, fresh_for=REPORT_FRESH_SECONDS, stale_for=REPORT_STALE_SECONDS,
+                 max_entries=MAX_REPORT_ENTRIES):
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key: (value, monotonic time computed)
+        self._inflight = {}  # key: Future of the computation running for it
+        self._counters = Counter()
+
+    def get(self, key, compute):
+        """
+        Cached result for key, computing it with compute() when missing or expired
+
+        Args:
+            key (tuple): (report name, date from, date to, scope)
+            compute: Zero-argument callable returning the result; it may run in a
+                background job, so it must not use the request or current_user
+
+        Returns:
+            The cached or freshly computed result
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, computed_at = entry
+                age = now - computed_at
+                if age < self.fresh_for + self.stale_for:
+                    self._entries.move_to_end(key)
+                    if age < self.fresh_for:
+                        self._counters['hits'] += 1
+                    else:
+                        self._counters['stale_hits'] += 1
+                        if key not in self._inflight:
+                            self._inflight[key] = Future()
+                            self._counters['refreshes'] += 1
+                            background.submit(self._compute, key, compute, self._inflight[key])
+                    return value
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+                self._counters['misses'] += 1
+            else:
+                self._counters['coalesced'] += 1
+
+        if leader:
+            self._compute(key, compute, flight)
+        return flight.result()
+
+    def _compute(self, key, compute, flight):
+        try:
+            value = compute()
+        except Exception as e:
+            logging.exception(f"Report {key[0]} failed")
+            with self._lock:
+                self._counters['errors'] += 1
+                self._inflight.pop(key, None)
+            flight.set_exception(e)
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        flight.set_result(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters since the worker started, plus the number of cached results"""
+        with self._lock:
+            counters = {name: self._counters[name]
+                        for name in ('hits', 'stale_hits', 'misses', 'coalesced', 'refreshes', 'errors')}
+            counters['entries'] = len(self._entries)
+        lookups = counters['hits'] + counters['stale_hits'] + counters['misses'] + counters['coalesced']
+        counters['hit_ratio'] = round((counters['hits'] + counters['stale_hits']) / lookups, 3) if lookups else None
+        return counters
+
+
+report_cache = ReportCache()
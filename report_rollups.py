@@ -0,0 +1,145 @@
+"""
+Daily rollups behind the Training Center CRM reports page
+
+lead_daily_rollup counts leads per (created day, source, status, consultant)
+and enrollment_daily_rollup counts enrollments and fees paid per
+(enrollment day, course).  Both are kept current by the Lead and Student
+events in models.py (and by the bulk import and bulk action code), so a
+report over any date range reads at most one row per day and key instead of
+every lead and student in the range, with the same SQL on MySQL and SQLite.
+Lead figures take the dashboard's role scope; enrollments and revenue are
+centre-wide.
+
+rebuild_report_rollups() recomputes them from the source tables, for a
+backfill after the migration or after anything changed leads or students
+behind the events (manual SQL, restores); see backfill_report_rollups.py.
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import desc, extract, func
+
+from app import db
+from models import Course, EnrollmentDailyRollup, Lead, LeadDailyRollup, Student
+
+MONTHLY_TREND_MONTHS = 12
+
+
+def _as_date(value):
+    # func.date() returns a 'YYYY-MM-DD' string on SQLite
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _lead_scope(query, consultant_id):
+    # Same scope as the dashboard: everyone's leads, or the ones the consultant added
+    return query if consultant_id is None else query.filter(LeadDailyRollup.consultant_id == consultant_id)
+
+
+def lead_total(day_from, day_to, consultant_id=None):
+    """Leads created between the two days, inclusive"""
+    query = db.session.query(func.sum(LeadDailyRollup.lead_count)).filter(LeadDailyRollup.day.between(day_from, day_to))
+    return int(_lead_scope(query, consultant_id).scalar() or 0)
+
+
+def conversion_by_source(day_from, day_to, consultant_id=None):
+    """[(lead source, leads, converted leads)] for leads created between the two days"""
+    query = db.session.query(
+        LeadDailyRollup.lead_source,
+        func.sum(LeadDailyRollup.lead_count),
+        func.sum(db.case((LeadDailyRollup.status == 'Converted', LeadDailyRollup.lead_count), else_=0))
+    ).filter(
+        LeadDailyRollup.day.between(day_from, day_to)
+    )
+    rows = _lead_scope(query, consultant_id).group_by(LeadDailyRollup.lead_source) \
+        .having(func.sum(LeadDailyRollup.lead_count) > 0)
+    return [(source or None, int(total), int(converted or 0)) for source, total, converted in rows]
+
+
+def course_popularity(day_from, day_to):
+    """[(course name, enrollments)] for students enrolled between the two days, most popular first"""
+    enrollments = func.sum(EnrollmentDailyRollup.enrollment_count)
+    rows = db.session.query(Course.name, enrollments).join(
+        Course, EnrollmentDailyRollup.course_id == Course.id
+    ).filter(
+        EnrollmentDailyRollup.day.between(day_from, day_to)
+    ).group_by(Course.name).having(enrollments > 0).order_by(desc(enrollments))
+    return [(name, int(count)) for name, count in rows]
+
+
+def revenue(day_from, day_to):
+    """Fees paid by students enrolled between the two days"""
+    return float(db.session.query(func.sum(EnrollmentDailyRollup.revenue))
+                 .filter(EnrollmentDailyRollup.day.between(day_from, day_to)).scalar() or 0)
+
+
+def monthly_trends(consultant_id=None, months=MONTHLY_TREND_MONTHS):
+    """[('YYYY-MM', leads)] for the latest months with leads, newest first"""
+    year, month = extract('year', LeadDailyRollup.day), extract('month', LeadDailyRollup.day)
+    query = db.session.query(year, month, func.sum(LeadDailyRollup.lead_count))
+    rows = _lead_scope(query, consultant_id) \
+        .group_by(year, month).having(func.sum(LeadDailyRollup.lead_count) > 0) \
+        .order_by(desc(year), desc(month)).limit(months)
+    return [(f"{int(y):04d}-{int(m):02d}", int(count)) for y, m, count in rows]
+
+
+def rebuild_report_rollups(day_from=None, day_to=None):
+    """
+    Recompute the rollup rows for a range of days from the lead and student tables
+
+    Args:
+        day_from (date): First day to rebuild, or None for the earliest
+        day_to (date): Last day to rebuild, or None for the latest
+
+    Returns:
+        tuple: (lead rollup rows, enrollment rollup rows) written
+    """
+    lead_rollup, enrollment_rollup = LeadDailyRollup.__table__, EnrollmentDailyRollup.__table__
+    try:
+        # Delete first: on MySQL this locks the range, so Lead and Student events wait for the rebuilt rows
+        for table in (lead_rollup, enrollment_rollup):
+            statement = table.delete()
+            if day_from:
+                statement = statement.where(table.c.day >= day_from)
+            if day_to:
+                statement = statement.where(table.c.day <= day_to)
+            db.session.execute(statement)
+
+        day = func.date(Lead.created_at)
+        leads = db.session.query(day, Lead.lead_source, Lead.status, Lead.added_by, func.count(Lead.id)) \
+            .filter(Lead.created_at.isnot(None))
+        if day_from:
+            leads = leads.filter(Lead.created_at >= datetime.combine(day_from, time.min))
+        if day_to:
+            leads = leads.filter(Lead.created_at < datetime.combine(day_to + timedelta(days=1), time.min))
+        lead_counts = {}
+        for created, lead_source, status, added_by, count in leads.group_by(
+                day, Lead.lead_source, Lead.status, Lead.added_by):
+            key = LeadDailyRollup.key_for(_as_date(created), lead_source, status, added_by)
+            lead_counts[key] = lead_counts.get(key, 0) + count
+
+        students = db.session.query(Student.enrollment_date, Student.course_id, func.count(Student.id),
+                                    func.sum(Student.fee_paid)).filter(Student.enrollment_date.isnot(None))
+        if day_from:
+            students = students.filter(Student.enrollment_date >= day_from)
+        if day_to:
+            students = students.filter(Student.enrollment_date <= day_to)
+        enrollments = {}
+        for enrolled, course_id, count, fees in students.group_by(Student.enrollment_date, Student.course_id):
+            key = EnrollmentDailyRollup.key_for(enrolled, course_id)
+            current = enrollments.get(key, (0, 0.0))
+            enrollments[key] = (current[0] + count, current[1] + float(fees or 0))
+
+        if lead_counts:
+            db.session.execute(lead_rollup.insert(), [
+                {'day': key[0], 'lead_source': key[1], 'status': key[2], 'consultant_id': key[3], 'lead_count': count}
+                for key, count in lead_counts.items()
+            ])
+        if enrollments:
+            db.session.execute(enrollment_rollup.insert(), [
+                {'day': key[0], 'course_id': key[1], 'enrollment_count': count, 'revenue': fees}
+                for key, (count, fees) in enrollments.items()
+            ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(lead_counts), len(enrollments)
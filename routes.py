@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, make_response
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from sqlalchemy import func, desc, asc
+from sqlalchemy.orm import joinedload
 from datetime import datetime, date, timedelta
 import json
 
@@ -9,7 +10,24 @@ from app import db
 from models import *
 from forms import *
 import logging
-from utils import create_payment_link, verify_payment_status
+from utils import verify_payment_status, normalize_phone
+from search import lead_search_filter, ranked_lead_search
+from pagination import KeysetPagination, keyset_paginate
+from lead_import import form_choices, start_import
+from export import export_response
+from events import event_stream_response
+from pipeline_board import PIPELINE_PAGE_SIZE, card_payload, pipeline_column
+from lead_activity import ACTIVITY_PAGE_SIZE, activity_payload, lead_activity
+import report_rollups
+from report_cache import report_cache
+from analytics import ANALYTICS_REPORTS, FUNNEL_STAGES, AnalyticsError, parse_filters, run_report
+from payment_links import can_retry, link_status_payload, retry_link_creation, start_link_creation
+from payment_webhooks import WebhookError, record_event
+from payment_ledger import (LEDGER_PAGE_SIZE, LEDGER_PROVIDERS, PAYMENT_STATUSES, ledger_page, ledger_range,
+                            ledger_summary)
+from bulk_actions import ADMIN_ACTIONS, BulkActionError, apply_bulk_action, parse_lead_ids
+from bulk_messaging import MessagingError, start_campaign
+from lookup import LOOKUP_LIMIT, LOOKUP_TYPES, lookup_filters, resolve_lookup, search_lookup
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -20,34 +38,31 @@ main = Blueprint('main', __name__)
 @login_required
 def dashboard():
     lead_form = LeadForm()
-    lead_form.course_interest_id.choices = [(0, 'Select Course')] + [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    lead_form.course_interest_id.choices = [(0, 'Select Course')] + Course.active_choices()
     
     meeting_form = MeetingForm()
-    meeting_form.lead_id.choices = [(0, 'Select Lead')] + [(l.id, l.name) for l in Lead.query.filter(Lead.status != 'Converted').all()]
-    meeting_form.student_id.choices = [(0, 'Select Student')] + [(s.id, s.name) for s in Student.query.all()]
     
     # Dashboard statistics - ROLE-BASED ACCESS
     if current_user.is_admin() or current_user.can_view_all_leads:
-        total_leads = Lead.query.count()
-        recent_leads = Lead.query.order_by(desc(Lead.created_at)).limit(5).all()
-        today_followups = Lead.query.filter(Lead.next_followup_date == date.today()).order_by(Lead.followup_time).all()
-        pipeline_data = {
-            'New': Lead.query.filter_by(status='New').count(),
-            'Contacted': Lead.query.filter_by(status='Contacted').count(),
-            'Interested': Lead.query.filter_by(status='Interested').count(),
-            'Quoted': Lead.query.filter_by(status='Quoted').count(),
-            'Converted': Lead.query.filter_by(status='Converted').count(),
-            'Lost': Lead.query.filter_by(status='Lost').count()
-        }
+        total_leads = PipelineCounter.lead_total()
+        recent_leads = Lead.query.options(joinedload(Lead.course_interest)) \
+            .order_by(desc(Lead.created_at)).limit(5).all()
+        today_followups = Lead.query.options(joinedload(Lead.course_interest)) \
+            .filter(Lead.next_followup_date == date.today()).order_by(Lead.followup_time).all()
+        totals = PipelineCounter.totals()
+        pipeline_data = {status: totals[status]['count'] for status in PIPELINE_STATUSES}
     else:
         # USER SPECIFIC DATA for consultants
-        total_leads = Lead.query.filter_by(added_by=current_user.id).count()
-        recent_leads = Lead.query.filter_by(added_by=current_user.id).order_by(desc(Lead.created_at)).limit(5).all()
-        today_followups = Lead.query.filter_by(added_by=current_user.id).filter(Lead.next_followup_date == date.today()).order_by(Lead.followup_time).all()
+        total_leads = PipelineCounter.lead_total(current_user.id)
+        recent_leads = Lead.query.options(joinedload(Lead.course_interest)) \
+            .filter_by(added_by=current_user.id).order_by(desc(Lead.created_at)).limit(5).all()
+        today_followups = Lead.query.options(joinedload(Lead.course_interest)) \
+            .filter_by(added_by=current_user.id).filter(Lead.next_followup_date == date.today()) \
+            .order_by(Lead.followup_time).all()
         pipeline_data = Lead.get_user_pipeline_data(current_user.id)
         
     total_students = Student.query.count()  # Students can be common
-    total_courses = Course.query.filter_by(is_active=True).count()  # Courses are common
+    total_courses = len(Course.active_choices())  # Courses are common
     
     # Monthly revenue
     monthly_revenue = db.session.query(
@@ -95,6 +110,79 @@ def get_lead(id):
         }
     })
 
+@main.route('/api/leads/search')
+@login_required
+def search_leads_api():
+    term = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    if not term:
+        return jsonify({'success': True, 'results': []})
+    
+    # ROLE-BASED ACCESS CONTROL - same scope as the leads list
+    if current_user.is_admin() or current_user.can_view_all_leads:
+        query = Lead.query
+    else:
+        query = Lead.query.filter_by(assigned_to=current_user.id)
+    
+    results = ranked_lead_search(query, term).limit(limit).all()
+    
+    return jsonify({
+        'success': True,
+        'results': [{
+            'id': lead.id,
+            'name': lead.name,
+            'phone': lead.phone,
+            'whatsapp': lead.whatsapp,
+            'email': lead.email,
+            'status': lead.status,
+            'url': url_for('main.lead_detail', lead_id=lead.id)
+        } for lead in results]
+    })
+
+@main.route('/api/phones/check', methods=['POST'])
+@login_required
+def check_phones_api():
+    """Check many phone numbers against leads, students and corporate contacts in one round trip"""
+    data = request.get_json(silent=True) or {}
+    phones = data.get('phones') or []
+    entity_type = data.get('entity_type')
+    
+    if not isinstance(phones, list) or len(phones) > 5000:
+        return jsonify({'success': False, 'message': 'Send a list of at most 5000 phone numbers'}), 400
+    if any(isinstance(phone, bool) or not isinstance(phone, (str, int, float)) for phone in phones if phone is not None):
+        return jsonify({'success': False, 'message': 'Phone numbers must be strings or numbers'}), 400
+    if entity_type not in (None, 'lead', 'student', 'corporate_training'):
+        return jsonify({'success': False, 'message': 'Invalid entity type'}), 400
+    
+    normalized = {phone: normalize_phone(str(phone)) for phone in phones if phone}
+    matches = PhoneKey.lookup(normalized.values(), entity_type=entity_type)
+    
+    return jsonify({
+        'success': True,
+        'results': [{
+            'phone': phone,
+            'normalized': key,
+            'matches': [{'type': match_type, 'id': match_id} for match_type, match_id in matches.get(key, [])]
+        } for phone, key in normalized.items()]
+    })
+
+@main.route('/api/lookup/<lookup_type>')
+@login_required
+def lookup(lookup_type):
+    """Typeahead search for leads, students, courses and consultants (?q=prefix, or ?id= for one item)"""
+    if lookup_type not in LOOKUP_TYPES:
+        return jsonify({'success': False, 'message': 'Unknown lookup type'}), 404
+    
+    filters = lookup_filters(lookup_type, request.args)
+    item_id = request.args.get('id', type=int)
+    if item_id is not None:
+        item = resolve_lookup(lookup_type, item_id, **filters)
+        results = [item] if item else []
+    else:
+        results = search_lookup(lookup_type, request.args.get('q', ''),
+                                limit=request.args.get('limit', LOOKUP_LIMIT, type=int), **filters)
+    return jsonify({'success': True, 'results': results})
+
 @main.route('/leads/<int:lead_id>')
 @login_required
 def lead_detail(lead_id):
@@ -105,56 +193,12 @@ def lead_detail(lead_id):
         flash('You can only view leads assigned to you!', 'error')
         return redirect(url_for('main.leads'))
     
-    # Get all interactions for this lead
-    interactions = LeadInteraction.query.filter_by(lead_id=lead_id).order_by(desc(LeadInteraction.interaction_date)).all()
-    
-    # Get all meetings for this lead
-    meetings = Meeting.query.filter_by(lead_id=lead_id).order_by(desc(Meeting.meeting_date)).all()
+    # Latest activity; the Activity tab pages back through /api/leads/<id>/activity
+    activity = lead_activity(lead_id)
     
     # Get all quotes for this lead
-    quotes = LeadQuote.query.filter_by(lead_id=lead_id).order_by(desc(LeadQuote.created_at)).all()
-    
-    # Combine all activities and sort by date
-    activities = []
-    
-    # Add interactions
-    for interaction in interactions:
-        activities.append({
-            'type': 'interaction' if interaction.interaction_type != 'Quote Update' else 'quote-update' if interaction.interaction_type != 'Follow-up Update' else 'follow-up-update',
-            'subtype': interaction.interaction_type,
-            'date': interaction.interaction_date,
-            'content': interaction.content,
-            'created_by': interaction.created_by.username if interaction.created_by else 'System',
-            'is_important': interaction.is_important,
-            'data': interaction
-        })
-    
-    # Add meetings
-    for meeting in meetings:
-        activities.append({
-            'type': 'meeting',
-            'subtype': meeting.status,
-            'date': meeting.meeting_date,
-            'content': f"{meeting.title} - {meeting.meeting_type}",
-            'created_by': meeting.created_by.username if meeting.created_by else 'System',
-            'is_important': False,
-            'data': meeting
-        })
-    
-    # Add quotes
-    for quote in quotes:
-        activities.append({
-            'type': 'quote',
-            'subtype': quote.status,
-            'date': quote.created_at,
-            'content': f"Quote for {quote.course.name} - {quote.currency} {quote.quoted_amount}",
-            'created_by': quote.created_by.username if quote.created_by else 'System',
-            'is_important': True,
-            'data': quote
-        })
-    
-    # Sort activities by date (newest first)
-    activities.sort(key=lambda x: x['date'], reverse=True)
+    quotes = LeadQuote.query.options(joinedload(LeadQuote.course), joinedload(LeadQuote.created_by)) \
+        .filter_by(lead_id=lead_id).order_by(desc(LeadQuote.created_at)).all()
     
     # Create forms
     activity_form = ActivityForm()
@@ -165,13 +209,34 @@ def lead_detail(lead_id):
     
     return render_template('lead_detail_modern.html', 
                          lead=lead, 
-                         activities=activities,
+                         activities=activity.items,
+                         activity_next_cursor=activity.next_cursor,
                          quotes=quotes,
-                         meetings=meetings,
                          courses=courses,
                          activity_form=activity_form,
                          followup_form=followup_form)
 
+@main.route('/api/leads/<int:lead_id>/activity')
+@login_required
+def lead_activity_api(lead_id):
+    lead = Lead.query.get_or_404(lead_id)
+    
+    # ROLE-BASED ACCESS CONTROL
+    if not (current_user.is_admin() or lead.assigned_to == current_user.id):
+        return jsonify({
+            'success': False,
+            'message': 'You can only view leads assigned to you!'
+        }), 403
+    
+    page = lead_activity(lead_id,
+                         cursor=request.args.get('cursor'),
+                         per_page=request.args.get('limit', ACTIVITY_PAGE_SIZE, type=int))
+    return jsonify({
+        'success': True,
+        'activities': [activity_payload(item) for item in page.items],
+        'next_cursor': page.next_cursor
+    })
+
 @main.route('/leads/quote/<int:id>/update_amount', methods=['POST'])
 @login_required
 def update_quote_amount(id):
@@ -250,53 +315,38 @@ def logout():
     logout_user()
     return redirect(url_for('main.login'))
 
+def filter_leads_query(search='', status_filter='', course_filter=''):
+    """Lead list query for the current user with the list view filters applied"""
+    # ROLE-BASED ACCESS CONTROL FOR LEADS
+    if current_user.is_admin() or current_user.can_view_all_leads:
+        query = Lead.query
+    else:
+        query = Lead.query.filter_by(assigned_to=current_user.id)
+    
+    if status_filter:
+        query = query.filter_by(status=status_filter)
+    if search:
+        query = query.filter(lead_search_filter(search))
+    if course_filter:
+        query = query.filter_by(course_interest_id=course_filter)
+    return query
+
 @main.route('/leads')
 @login_required
 def leads():
     lead_form = LeadForm()
     
     meeting_form = MeetingForm()
-    meeting_form.lead_id.choices = [(0, 'Select Lead')] + [(l.id, l.name) for l in Lead.query.filter(Lead.status != 'Converted').all()]
-    meeting_form.student_id.choices = [(0, 'Select Student')] + [(s.id, s.name) for s in Student.query.all()]
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     search = request.args.get('search', '')
     status_filter = request.args.get('status', '')
     course_filter = request.args.get('course', '')
     
-    # ROLE-BASED ACCESS CONTROL FOR LEADS
-    if current_user.is_admin() or current_user.can_view_all_leads:
-        query = Lead.query
-        if status_filter:
-            query = query.filter_by(status=status_filter)
-        if search:
-            query = query.filter(
-                db.or_(
-                    Lead.name.ilike(f'%{search}%'),
-                    Lead.phone.ilike(f'%{search}%'),
-                    Lead.email.ilike(f'%{search}%')
-                )
-            )
-        if course_filter:
-            query = query.filter_by(course_interest_id=course_filter)
-    else:
-        query = Lead.query.filter_by(assigned_to=current_user.id)
-        if status_filter:
-            query = query.filter_by(status=status_filter)
-        if search:
-            query = query.filter(
-                db.or_(
-                    Lead.name.ilike(f'%{search}%'),
-                    Lead.phone.ilike(f'%{search}%'),
-                    Lead.email.ilike(f'%{search}%')
-                )
-            )
-        if course_filter:
-            query = query.filter_by(course_interest_id=course_filter)
-    
-    leads_pagination = query.order_by(desc(Lead.created_at)).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    query = filter_leads_query(search, status_filter, course_filter).options(joinedload(Lead.course_interest))
+    # The capped count is only run when asked for (?total=1, the "Count" link)
+    leads_pagination = keyset_paginate(query, Lead.created_at, Lead.id,
+                                       cursor=cursor, per_page=20, with_total=request.args.get('total') == '1')
     
     courses = Course.query.filter_by(is_active=True).all()
     statuses = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted', 'Lost']
@@ -313,6 +363,34 @@ def leads():
                          meeting_form=meeting_form,
                          lead=None)
 
+@main.route('/api/leads')
+@login_required
+def leads_api():
+    query = filter_leads_query(request.args.get('search', ''),
+                               request.args.get('status', ''),
+                               request.args.get('course', ''))
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+    leads_pagination = keyset_paginate(query, Lead.created_at, Lead.id,
+                                       cursor=request.args.get('cursor'), per_page=per_page,
+                                       with_total=request.args.get('total') == '1')
+    
+    return jsonify({
+        'success': True,
+        'leads': [{
+            'id': lead.id,
+            'name': lead.name,
+            'phone': lead.phone,
+            'email': lead.email,
+            'status': lead.status,
+            'lead_source': lead.lead_source,
+            'course_interest_id': lead.course_interest_id,
+            'assigned_to': lead.assigned_to,
+            'next_followup_date': lead.next_followup_date.isoformat() if lead.next_followup_date else None,
+            'created_at': lead.created_at.isoformat() if lead.created_at else None
+        } for lead in leads_pagination.items],
+        'pagination': leads_pagination.to_dict()
+    })
+
 @main.route('/leads/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_lead(id):
@@ -338,7 +416,7 @@ def edit_lead(id):
         return redirect(url_for('main.leads'))
     
     form = LeadForm(obj=lead)
-    form.course_interest_id.choices = [(0, 'Select Course')] + [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_interest_id.choices = [(0, 'Select Course')] + Course.active_choices()
     
     if form.validate_on_submit():
         # DUPLICATE DETECTION - Check phone/WhatsApp across all users but exclude current lead
@@ -390,8 +468,6 @@ def edit_lead(id):
     
     # For GET requests, render the edit page as a fallback
     meeting_form = MeetingForm()
-    meeting_form.lead_id.choices = [(0, 'Select Lead')] + [(l.id, l.name) for l in Lead.query.filter(Lead.status != 'Converted').all()]
-    meeting_form.student_id.choices = [(0, 'Select Student')] + [(s.id, s.name) for s in Student.query.all()]
     
     return render_template('edit_lead.html', lead_form=form, lead=lead)
 
@@ -400,7 +476,7 @@ def edit_lead(id):
 def add_lead():
     form = LeadForm()
     # Set choices for course_interest_id
-    form.course_interest_id.choices = [(0, 'Select Course')] + [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_interest_id.choices = [(0, 'Select Course')] + Course.active_choices()
     
     if form.validate_on_submit():
         # DUPLICATE DETECTION - Check phone/WhatsApp across all users
@@ -475,22 +551,12 @@ def bulk_assign_leads():
     form = BulkAssignForm()
     if form.validate_on_submit():
         try:
-            lead_ids = form.selected_leads.data.split(',') if form.selected_leads.data else []
-            if not lead_ids:
-                flash('No leads selected for assignment.', 'warning')
-                return redirect(url_for('main.leads'))
-            
-            # Update selected leads
-            updated_count = 0
-            for lead_id in lead_ids:
-                if lead_id.strip():
-                    lead = Lead.query.get(int(lead_id.strip()))
-                    if lead:
-                        lead.assigned_to = form.assigned_to.data
-                        updated_count += 1
-            
-            db.session.commit()
+            lead_ids = parse_lead_ids(form.selected_leads.data)
+            updated_count = apply_bulk_action(Lead.query, 'assign', lead_ids,
+                                              {'assigned_to': form.assigned_to.data}, current_user.id)
             flash(f'Successfully assigned {updated_count} leads to the selected consultant.', 'success')
+        except BulkActionError as e:
+            flash(str(e), 'warning')
         except Exception as e:
             db.session.rollback()
             logging.error(f"Error in bulk assignment: {str(e)}")
@@ -500,6 +566,90 @@ def bulk_assign_leads():
     
     return redirect(url_for('main.leads'))
 
+@main.route('/api/leads/bulk', methods=['POST'])
+@login_required
+def bulk_leads_api():
+    """Assign, change status, set follow-up or delete many leads in one request"""
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    
+    if action in ADMIN_ACTIONS and not current_user.is_admin():
+        return jsonify({'success': False, 'message': 'Only admins can perform this bulk action.'}), 403
+    
+    try:
+        lead_ids = parse_lead_ids(data.get('lead_ids'))
+        changed = apply_bulk_action(filter_leads_query(), action, lead_ids, data, current_user.id)
+    except BulkActionError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error in bulk lead action {action}: {str(e)}")
+        return jsonify({'success': False, 'message': 'An error occurred while updating the leads. Please try again.'}), 500
+    
+    return jsonify({
+        'success': True,
+        'action': action,
+        'updated': changed,
+        'skipped': len(lead_ids) - changed,
+        'message': f'{changed} lead{"s" if changed != 1 else ""} updated.'
+    })
+
+@main.route('/leads/import', methods=['GET', 'POST'])
+@login_required
+def import_leads():
+    form = LeadImportForm()
+    if not current_user.is_admin():
+        # Consultants import leads assigned to themselves
+        form.assigned_to.choices = [(0, 'Myself')]
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    
+    if form.validate_on_submit():
+        assigned_to = form.assigned_to.data if current_user.is_admin() and form.assigned_to.data else current_user.id
+        try:
+            job = start_import(form.file.data, current_user.id, assigned_to, form_choices(LeadForm(formdata=None)))
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error starting lead import: {str(e)}")
+            if is_ajax:
+                return jsonify({'success': False, 'errors': ['Could not start the import. Please try again.']}), 500
+            flash('Could not start the import. Please try again.', 'error')
+            return redirect(url_for('main.import_leads'))
+        
+        if is_ajax:
+            return jsonify({
+                'success': True,
+                'message': 'Import started.',
+                'import': job.to_dict(),
+                'status_url': url_for('main.lead_import_status', import_id=job.id)
+            })
+        flash('Import started. You can follow its progress below.', 'success')
+        return redirect(url_for('main.import_leads', import_id=job.id))
+    
+    if request.method == 'POST':
+        errors = [error for field_errors in form.errors.values() for error in field_errors]
+        if is_ajax:
+            return jsonify({'success': False, 'errors': errors or ['Invalid upload.']}), 400
+        for error in errors:
+            flash(error, 'error')
+    
+    imports = LeadImport.query
+    if not current_user.is_admin():
+        imports = imports.filter_by(created_by_id=current_user.id)
+    recent_imports = imports.order_by(desc(LeadImport.created_at)).limit(10).all()
+    
+    return render_template('lead_import.html',
+                         form=form,
+                         recent_imports=recent_imports,
+                         active_import_id=request.args.get('import_id', type=int))
+
+@main.route('/api/leads/import/<int:import_id>')
+@login_required
+def lead_import_status(import_id):
+    """Progress and per-row errors of a bulk lead import"""
+    job = LeadImport.query.get_or_404(import_id)
+    if not (current_user.is_admin() or job.created_by_id == current_user.id):
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    return jsonify({'success': True, 'import': job.to_dict()})
+
 @main.route('/leads/<int:id>/convert', methods=['POST'])
 @login_required
 def convert_lead(id):
@@ -547,53 +697,26 @@ def delete_lead(id):
 @login_required
 def pipeline():
     lead_form = LeadForm()
-    lead_form.course_interest_id.choices = [(0, 'Select Course')] + [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    lead_form.course_interest_id.choices = [(0, 'Select Course')] + Course.active_choices()
     
     meeting_form = MeetingForm()
     
     # ROLE-BASED ACCESS CONTROL FOR PIPELINE
     if current_user.is_admin() or current_user.can_view_all_leads:
         # Admin sees all leads
-        pipeline_query = db.session.query(
-            Lead.status,
-            func.count(Lead.id).label('count'),
-            func.sum(Lead.quoted_amount).label('total_value')
-        )
-        meeting_form.lead_id.choices = [(0, 'Select Lead')] + [(l.id, l.name) for l in Lead.query.filter(Lead.status != 'Converted').all()]
+        pipeline_dict = PipelineCounter.totals()
     else:
         # Consultants see only their own leads
-        pipeline_query = db.session.query(
-            Lead.status,
-            func.count(Lead.id).label('count'),
-            func.sum(Lead.quoted_amount).label('total_value')
-        ).filter(Lead.added_by == current_user.id)
-        meeting_form.lead_id.choices = [(0, 'Select Lead')] + [(l.id, l.name) for l in Lead.query.filter(Lead.status != 'Converted', Lead.added_by == current_user.id).all()]
-    
-    pipeline_data = pipeline_query.group_by(Lead.status).all()
-    meeting_form.student_id.choices = [(0, 'Select Student')] + [(s.id, s.name) for s in Student.query.all()]
-    
-    pipeline_dict = {}
-    for status, count, total_value in pipeline_data:
-        pipeline_dict[status] = {
-            'count': count,
-            'total_value': total_value or 0
-        }
+        pipeline_dict = PipelineCounter.totals(current_user.id)
     
-    statuses = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted', 'Lost']
-    for status in statuses:
-        if status not in pipeline_dict:
-            pipeline_dict[status] = {'count': 0, 'total_value': 0}
-    
-    leads_by_status = {}
-    for status in statuses:
-        if current_user.is_admin() or current_user.can_view_all_leads:
-            leads_by_status[status] = Lead.query.filter_by(status=status).all()
-        else:
-            leads_by_status[status] = Lead.query.filter_by(status=status, added_by=current_user.id).all()
+    statuses = PIPELINE_STATUSES
+    
+    # First page of every column; the board loads the rest from /api/pipeline/leads on scroll
+    columns = {status: pipeline_column(pipeline_scope_query(), status) for status in statuses}
     
     return render_template('pipeline.html',
                          pipeline_data=pipeline_dict,
-                         leads_by_status=leads_by_status,
+                         columns=columns,
                          statuses=statuses,
                          lead_form=lead_form,
                          meeting_form=meeting_form,
@@ -611,23 +734,18 @@ def meetings():
     # ROLE-BASED ACCESS CONTROL FOR MEETINGS
     if current_user.is_admin() or current_user.can_view_all_leads:
         # Admin sees all meetings
-        meetings = Meeting.query.filter(
+        meetings = Meeting.query.options(joinedload(Meeting.lead), joinedload(Meeting.student)).filter(
             Meeting.meeting_date >= start_of_month
         ).order_by(Meeting.meeting_date).all()
-        
-        # Admin can schedule meetings for any lead
-        meeting_form = MeetingForm()
-        meeting_form.lead_id.choices = [(0, 'Select Lead')] + [(l.id, l.name) for l in Lead.query.filter(Lead.status != 'Converted').all()]
     else:
         # Consultants see only their own meetings
-        meetings = Meeting.query.filter(
+        meetings = Meeting.query.options(joinedload(Meeting.lead), joinedload(Meeting.student)).filter(
             Meeting.meeting_date >= start_of_month,
             Meeting.created_by_id == current_user.id
         ).order_by(Meeting.meeting_date).all()
-        
-        # Consultants can only schedule meetings for their own leads
-        meeting_form = MeetingForm()
-        meeting_form.lead_id.choices = [(0, 'Select Lead')] + [(l.id, l.name) for l in Lead.query.filter(Lead.status != 'Converted', Lead.added_by == current_user.id).all()]
+    
+    # Lead choices are looked up as the user types, scoped to the leads they may see
+    meeting_form = MeetingForm()
     
     meetings_data = [
         {
@@ -643,7 +761,6 @@ def meetings():
     ]
     
     current_date = today.strftime('%B %Y')
-    meeting_form.student_id.choices = [(0, 'Select Student')] + [(s.id, s.name) for s in Student.query.all()]
     
     return render_template('meetings.html',
                          meetings=meetings,
@@ -658,8 +775,6 @@ def meetings():
 @login_required
 def add_meeting():
     form = MeetingForm()
-    form.lead_id.choices = [(0, 'Select Lead')] + [(l.id, l.name) for l in Lead.query.filter(Lead.status != 'Converted').all()]
-    form.student_id.choices = [(0, 'Select Student')] + [(s.id, s.name) for s in Student.query.all()]
     
     if form.validate_on_submit():
         meeting = Meeting(
@@ -784,17 +899,13 @@ def add_course():
     
     return render_template('add_course.html', form=form, title='Add New Course')
 
-@main.route('/students')
-@login_required
-def students():
-    page = request.args.get('page', 1, type=int)
-    search = request.args.get('search', '')
-    course_filter = request.args.get('course', '')
-    status_filter = request.args.get('status', '')
+def filter_students_query(search='', course_filter='', status_filter=''):
+    """Student list query with the list view filters applied"""
     query = Student.query
     if search:
         query = query.filter(
-            (Student.name.contains(search)) |
+            (Student.first_name.contains(search)) |
+            (Student.last_name.contains(search)) |
             (Student.phone.contains(search)) |
             (Student.email.contains(search))
         )
@@ -802,13 +913,22 @@ def students():
         query = query.filter(Student.course_id == course_filter)
     if status_filter:
         query = query.filter(Student.status == status_filter)
-    students_pagination = query.order_by(desc(Student.enrollment_date)).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    return query
+
+@main.route('/students')
+@login_required
+def students():
+    cursor = request.args.get('cursor')
+    search = request.args.get('search', '')
+    course_filter = request.args.get('course', '')
+    status_filter = request.args.get('status', '')
+    query = filter_students_query(search, course_filter, status_filter).options(joinedload(Student.course))
+    students_pagination = keyset_paginate(query, Student.enrollment_date, Student.id,
+                                          cursor=cursor, per_page=20, with_total=request.args.get('total') == '1')
     courses = Course.query.filter_by(is_active=True).all()
     statuses = ['Active', 'Completed', 'Dropped', 'Suspended']
     form = StudentForm()
-    form.course_id.choices = [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_id.choices = Course.active_choices()
     return render_template('students.html',
                          students=students_pagination.items,
                          pagination=students_pagination,
@@ -819,19 +939,80 @@ def students():
                          status_filter=status_filter,
                          form=form)
 
+@main.route('/api/students')
+@login_required
+def students_api():
+    query = filter_students_query(request.args.get('search', ''),
+                                  request.args.get('course', ''),
+                                  request.args.get('status', ''))
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+    students_pagination = keyset_paginate(query, Student.enrollment_date, Student.id,
+                                          cursor=request.args.get('cursor'), per_page=per_page,
+                                          with_total=request.args.get('total') == '1')
+    
+    return jsonify({
+        'success': True,
+        'students': [{
+            'id': student.id,
+            'name': student.name,
+            'phone': student.phone,
+            'email': student.email,
+            'course_id': student.course_id,
+            'status': student.status,
+            'fee_paid': student.fee_paid,
+            'total_fee': student.total_fee,
+            'enrollment_date': student.enrollment_date.isoformat() if student.enrollment_date else None
+        } for student in students_pagination.items],
+        'pagination': students_pagination.to_dict()
+    })
+
+def export_query(export_type):
+    """Scoped, filtered query for an export, matching what the user sees in the list views"""
+    can_view_all = current_user.is_admin() or current_user.can_view_all_leads
+    if export_type == 'leads':
+        return filter_leads_query(request.args.get('search', ''),
+                                  request.args.get('status', ''),
+                                  request.args.get('course', ''))
+    if export_type == 'students':
+        return filter_students_query(request.args.get('search', ''),
+                                     request.args.get('course', ''),
+                                     request.args.get('status', ''))
+    
+    model = {'meetings': Meeting, 'payments': PaymentLink, 'corporate': CorporateTraining}.get(export_type)
+    if model is None:
+        return None
+    query = model.query
+    if not can_view_all:
+        query = query.filter(model.created_by_id == current_user.id)
+    if request.args.get('status'):
+        query = query.filter(model.status == request.args.get('status'))
+    return query
+
+@main.route('/api/export/<export_type>')
+@login_required
+def export_data(export_type):
+    """Stream leads, students, meetings, payments or corporate deals as CSV, JSONL or XLSX"""
+    query = export_query(export_type)
+    if query is None:
+        return jsonify({'success': False, 'message': f'Unknown export type: {export_type}'}), 404
+    try:
+        return export_response(export_type, request.args.get('format', 'csv').lower(), query)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
 @main.route('/student-management')
 @login_required
 def student_management():
     students = Student.query.order_by(desc(Student.enrollment_date)).all()
     form = StudentForm()
-    form.course_id.choices = [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_id.choices = Course.active_choices()
     return render_template('student_form.html', students=students, form=form)
 
 @main.route('/students/add', methods=['POST'])
 @login_required
 def add_student():
     form = StudentForm()
-    form.course_id.choices = [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_id.choices = Course.active_choices()
     
     if form.validate_on_submit():
         student = Student(
@@ -867,7 +1048,7 @@ def view_student(id):
 def edit_student(id):
     student = Student.query.get_or_404(id)
     form = StudentForm(obj=student)
-    form.course_id.choices = [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_id.choices = Course.active_choices()
     
     if form.validate_on_submit():
         form.populate_obj(student)
@@ -887,7 +1068,7 @@ def student_payments(id):
 @login_required
 def corporate():
     form = CorporateTrainingForm()
-    form.course_names.choices = [(str(c.id), c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_names.choices = [(str(course_id), name) for course_id, name in Course.active_choices()]
     corporate_trainings = CorporateTraining.query.order_by(desc(CorporateTraining.created_at)).all()
 
     corporate_trainings_data = []
@@ -925,7 +1106,7 @@ def corporate():
 @login_required
 def add_corporate():
     form = CorporateTrainingForm()
-    form.course_names.choices = [(str(c.id), c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_names.choices = [(str(course_id), name) for course_id, name in Course.active_choices()]
     
     if form.validate_on_submit():
         corporate = CorporateTraining(
@@ -959,9 +1140,15 @@ def add_corporate():
 def messages():
     templates = MessageTemplate.query.order_by(MessageTemplate.name).all()
     template_form = MessageTemplateForm()
-    leads = Lead.query.all()
+    leads = filter_leads_query().with_entities(Lead.id, Lead.name, Lead.phone).order_by(Lead.name).all()
     courses = Course.query.filter_by(is_active=True).all()
-    return render_template('messages.html', templates=templates, template_form=template_form, leads=leads, courses=courses)
+    campaigns = MessageCampaign.query
+    if not current_user.is_admin():
+        campaigns = campaigns.filter_by(created_by_id=current_user.id)
+    recent_campaigns = campaigns.order_by(desc(MessageCampaign.created_at)).limit(10).all()
+    statuses = [value for value, _ in Setting.get_choices('lead_status')] or PIPELINE_STATUSES
+    return render_template('messages.html', templates=templates, template_form=template_form, leads=leads,
+                           courses=courses, recent_campaigns=recent_campaigns, statuses=statuses)
 
 @main.route('/messages/add', methods=['POST'])
 @login_required
@@ -1005,17 +1192,34 @@ def delete_template(id):
 @main.route('/messages/send', methods=['POST'])
 @login_required
 def send_message():
-    template_id = request.form.get('template_id')
-    lead_ids = request.form.getlist('lead_ids')
-    course_id = request.form.get('course_id')
-    
-    template = MessageTemplate.query.get_or_404(template_id)
-    template.usage_count += 1
-    db.session.commit()
+    """Start sending a template to the selected leads, or to every lead in a status, in the background"""
+    template = MessageTemplate.query.get_or_404(request.form.get('template_id', type=int))
+    try:
+        lead_ids = parse_lead_ids(request.form.getlist('lead_ids')) if request.form.getlist('lead_ids') else None
+        campaign = start_campaign(template, current_user, lead_ids=lead_ids,
+                                  lead_status=request.form.get('lead_status') or None,
+                                  course_id=request.form.get('course_id', type=int))
+    except (BulkActionError, MessagingError) as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('main.messages'))
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error starting message send: {str(e)}")
+        flash('Could not start sending. Please try again.', 'error')
+        return redirect(url_for('main.messages'))
     
-    flash(f'Message sent to {len(lead_ids)} recipients!', 'success')
+    flash(f'Sending "{template.name}" to {campaign.audience}. You can follow its progress below.', 'success')
     return redirect(url_for('main.messages'))
 
+@main.route('/api/messages/campaigns/<int:campaign_id>')
+@login_required
+def message_campaign_status(campaign_id):
+    """Progress of a bulk message send"""
+    campaign = MessageCampaign.query.get_or_404(campaign_id)
+    if not (current_user.is_admin() or campaign.created_by_id == current_user.id):
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    return jsonify({'success': True, 'campaign': campaign.to_dict()})
+
 @main.route('/api/templates/<int:id>', methods=['GET'])
 @login_required
 def get_template(id):
@@ -1039,50 +1243,72 @@ def reports():
     default_date_from = (date.today() - timedelta(days=30)).strftime('%Y-%m-%d')
     date_from = request.args.get('date_from', default_date_from)
     date_to = request.args.get('date_to', date.today().strftime('%Y-%m-%d'))
+    try:
+        day_from, day_to = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    except ValueError:
+        date_from, date_to = default_date_from, date.today().strftime('%Y-%m-%d')
+        day_from, day_to = date.fromisoformat(date_from), date.today()
 
-    monthly_leads = Lead.query.filter(
-        Lead.created_at.between(date_from, date_to)
-    ).all()
-
-    conversion_by_source = db.session.query(
-        Lead.lead_source,
-        func.count(Lead.id).label('total'),
-        func.sum(db.cast(Lead.status == 'Converted', db.Integer)).label('converted')
-    ).filter(
-        Lead.created_at.between(date_from, date_to)
-    ).group_by(Lead.lead_source).all()
-
-    course_popularity = db.session.query(
-        Course.name,
-        func.count(Student.id).label('enrollments')
-    ).join(Student).filter(
-        Student.enrollment_date.between(date_from, date_to)
-    ).group_by(Course.name).all()
-
-    monthly_trends = db.session.query(
-        func.date_format(Lead.created_at, '%Y-%m').label('month'),
-        func.count(Lead.id).label('count')
-    ).group_by(func.date_format(Lead.created_at, '%Y-%m')).order_by(func.date_format(Lead.created_at, '%Y-%m').desc()).limit(12).all()
-
+    # ROLE-BASED ACCESS CONTROL FOR REPORTS: lead figures cover the consultant's own leads
+    consultant_id = None if current_user.is_admin() or current_user.can_view_all_leads else current_user.id
+    
+    # Served from the daily rollups through the shared per-worker report cache
+    def report(name, compute, scoped=True, dated=True):
+        key = (name, day_from if dated else None, day_to if dated else None, consultant_id if scoped else None)
+        return report_cache.get(key, compute)
+    
     return render_template('reports.html',
-                         monthly_leads=monthly_leads,
-                         conversion_by_source=conversion_by_source,
-                         course_popularity=course_popularity,
-                         monthly_trends=monthly_trends,
+                         lead_total=report('lead_total', lambda: report_rollups.lead_total(
+                             day_from, day_to, consultant_id)),
+                         conversion_by_source=report('conversion_by_source', lambda: report_rollups.conversion_by_source(
+                             day_from, day_to, consultant_id)),
+                         course_popularity=report('course_popularity', lambda: report_rollups.course_popularity(
+                             day_from, day_to), scoped=False),
+                         revenue=report('revenue', lambda: report_rollups.revenue(day_from, day_to), scoped=False),
+                         monthly_trends=report('monthly_trends', lambda: report_rollups.monthly_trends(
+                             consultant_id), dated=False),
                          date_from=date_from,
                          date_to=date_to)
 
+@main.route('/api/reports/cache')
+@login_required
+def report_cache_stats():
+    if not current_user.is_admin():
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    return jsonify({'success': True, 'cache': report_cache.stats()})
+
+@main.route('/api/analytics/<report>')
+@login_required
+def analytics_report(report):
+    """Funnel, time-to-convert and cohort figures from the in-memory analytics snapshot"""
+    if report not in ANALYTICS_REPORTS:
+        return jsonify({'success': False, 'message': 'Unknown analytics report'}), 404
+    try:
+        group_by, filters = parse_filters(request.args)
+        # Same scope as the reports page: consultants only see their own leads
+        if not (current_user.is_admin() or current_user.can_view_all_leads):
+            filters['consultant_id'] = current_user.id
+        groups, snapshot = run_report(report, group_by, **filters)
+    except AnalyticsError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'report': report, 'group_by': group_by, 'stages': FUNNEL_STAGES,
+                    'groups': groups, 'snapshot': snapshot})
+
 @main.route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
     """Comprehensive settings management"""
     
-    # Get all settings categories
-    lead_sources = Setting.get_by_key('lead_source')
-    lead_statuses = Setting.get_by_key('lead_status') 
-    followup_types = Setting.get_by_key('followup_type')
-    priority_levels = Setting.get_by_key('priority_level')
-    meeting_types = Setting.get_by_key('meeting_type')
+    # Get all settings categories in one query
+    categories = {key: [] for key in ('lead_source', 'lead_status', 'followup_type', 'priority_level', 'meeting_type')}
+    for setting in Setting.query.filter(Setting.key.in_(categories.keys()), Setting.is_active == True) \
+            .order_by(Setting.sort_order):
+        categories[setting.key].append(setting)
+    lead_sources = categories['lead_source']
+    lead_statuses = categories['lead_status']
+    followup_types = categories['followup_type']
+    priority_levels = categories['priority_level']
+    meeting_types = categories['meeting_type']
     
     # Get system settings
     system_settings = {}
@@ -1132,8 +1358,9 @@ def settings():
                 'sms_notifications': str(system_form.sms_notifications.data).lower()
             }
             
+            existing = {s.key: s for s in Setting.query.filter(Setting.key.in_(system_updates.keys())).order_by(Setting.id.desc())}
             for key, value in system_updates.items():
-                setting = Setting.query.filter_by(key=key).first()
+                setting = existing.get(key)
                 if setting:
                     setting.value = value
                     setting.updated_at = datetime.utcnow()
@@ -1222,34 +1449,63 @@ def update_lead_status(id):
 @main.route('/api/pipeline/data')
 @login_required
 def pipeline_api_data():
-    pipeline_data = db.session.query(
-        Lead.status,
-        func.count(Lead.id).label('count'),
-        func.sum(Lead.quoted_amount).label('total_value')
-    ).group_by(Lead.status).all()
-    
-    result = {}
-    for status, count, total_value in pipeline_data:
-        result[status] = {
-            'count': count,
-            'total_value': float(total_value or 0)
-        }
+    # Pollers revalidate with If-None-Match: while no lead has changed the answer
+    # costs one primary key lookup and an empty 304
+    view_all = current_user.is_admin() or current_user.can_view_all_leads
+    scope = 'all' if view_all else current_user.id
+    etag = f"pipeline-{scope}-{ChangeVersion.current(LEADS_VERSION)}"
+    
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(PipelineCounter.totals() if view_all else PipelineCounter.totals(current_user.id))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def pipeline_scope_query():
+    """Leads on the current user's pipeline board"""
+    if current_user.is_admin() or current_user.can_view_all_leads:
+        return Lead.query
+    return Lead.query.filter(Lead.added_by == current_user.id)
+
+@main.route('/api/pipeline/leads')
+@login_required
+def pipeline_column_api():
+    status = request.args.get('status')
+    if status not in PIPELINE_STATUSES:
+        return jsonify({'success': False, 'message': 'Invalid status'}), 400
     
-    return jsonify(result)
+    page = pipeline_column(pipeline_scope_query(), status,
+                           cursor=request.args.get('cursor'),
+                           per_page=request.args.get('limit', PIPELINE_PAGE_SIZE, type=int))
+    return jsonify({
+        'success': True,
+        'leads': [card_payload(row) for row in page.items],
+        'next_cursor': page.next_cursor
+    })
+
+@main.route('/api/events')
+@login_required
+def lead_events():
+    # Push channel for the pipeline board: lead changes in the user's pipeline scope
+    view_all = current_user.is_admin() or current_user.can_view_all_leads
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    return event_stream_response(current_user.id, view_all, last_event_id)
 
 @main.route('/corporate-leads')
 @login_required
 def corporate_leads():
     leads = CorporateTraining.query.order_by(desc(CorporateTraining.created_at)).all()
     form = CorporateTrainingForm()
-    form.course_names.choices = [(str(c.id), c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_names.choices = [(str(course_id), name) for course_id, name in Course.active_choices()]
     return render_template('corporate_leads.html', corporate_leads=leads, form=form)
 
 @main.route('/corporate-leads/add', methods=['POST'])
 @login_required
 def add_corporate_lead():
     form = CorporateTrainingForm()
-    form.course_names.choices = [(str(c.id), c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_names.choices = [(str(course_id), name) for course_id, name in Course.active_choices()]
     
     if form.validate_on_submit():
         lead = CorporateTraining(
@@ -1295,10 +1551,11 @@ def view_corporate_lead(id):
 def lead_detail(id):
     lead = Lead.query.get_or_404(id)
     interactions = LeadInteraction.query.filter_by(lead_id=id).order_by(desc(LeadInteraction.interaction_date)).all()
-    quotes = LeadQuote.query.filter_by(lead_id=id).order_by(desc(LeadQuote.created_at)).all()
+    quotes = LeadQuote.query.options(joinedload(LeadQuote.course)) \
+        .filter_by(lead_id=id).order_by(desc(LeadQuote.created_at)).all()
     
     quote_form = LeadQuoteForm()
-    quote_form.course_id.choices = [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    quote_form.course_id.choices = Course.active_choices()
     
     interaction_form = LeadInteractionForm()
     followup_form = LeadFollowupForm()
@@ -1497,7 +1754,7 @@ def update_lead_followup(id):
 def edit_corporate_lead(id):
     lead = CorporateTraining.query.get_or_404(id)
     form = CorporateTrainingForm(obj=lead)
-    form.course_names.choices = [(str(c.id), c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_names.choices = [(str(course_id), name) for course_id, name in Course.active_choices()]
     
     if lead.course_names:
         try:
@@ -1620,7 +1877,7 @@ def trainer_schedule(id):
 def add_class_schedule():
     form = ClassScheduleForm()
     form.trainer_id.choices = [(t.id, t.name) for t in Trainer.query.filter_by(is_active=True).all()]
-    form.course_id.choices = [(c.id, c.name) for c in Course.query.filter_by(is_active=True).all()]
+    form.course_id.choices = Course.active_choices()
     form.student_ids.choices = [(s.id, s.name) for s in Student.query.filter_by(status="Active").all()]
     
     if form.validate_on_submit():
@@ -1805,41 +2062,47 @@ def monthly_schedule():
 @main.route("/payments")
 @login_required
 def payments():
-    vault_provider = PaymentProvider.query.filter_by(name="Vault").first()
-    tabby_provider = PaymentProvider.query.filter_by(name="Tabby").first()
-    tamara_provider = PaymentProvider.query.filter_by(name="Tamara").first()
-    
-    vault_links = PaymentLink.query.filter_by(provider_id=vault_provider.id).order_by(desc(PaymentLink.created_at)).all() if vault_provider else []
-    tabby_links = PaymentLink.query.filter_by(provider_id=tabby_provider.id).order_by(desc(PaymentLink.created_at)).all() if tabby_provider else []
-    tamara_links = PaymentLink.query.filter_by(provider_id=tamara_provider.id).order_by(desc(PaymentLink.created_at)).all() if tamara_provider else []
-    
-    total_pending = PaymentLink.query.filter_by(status="pending").count()
-    total_paid = PaymentLink.query.filter_by(status="paid").count()
-    total_failed = PaymentLink.query.filter_by(status="failed").count()
+    providers = {provider.name.lower(): provider for provider in PaymentProvider.query.all()}
+    day_from, day_to = ledger_range(request.args.get('date_from'), request.args.get('date_to'))
+    status_filter = request.args.get('status', '')
+    if status_filter not in PAYMENT_STATUSES:
+        status_filter = ''
+    # The cursor pages through the tab it was issued for; the other tabs show their newest links
+    tab = request.args.get('tab', 'vault')
+    cursor = request.args.get('cursor')
+    
+    # One grouped query for the date range instead of a count per status
+    summary = ledger_summary([provider.id for provider in providers.values()], day_from, day_to)
+    pages = {name: ledger_page(providers[name].id, day_from, day_to, status_filter or None,
+                               cursor=cursor if name == tab else None)
+             for name in LEDGER_PROVIDERS if name in providers}
+    empty_page = KeysetPagination([], LEDGER_PAGE_SIZE)
     
     payment_link_form = PaymentLinkForm()
-    payment_link_form.lead_id.choices = [(0, "Select Lead")] + [(l.id, l.name) for l in Lead.query.all()]
-    payment_link_form.student_id.choices = [(0, "Select Student")] + [(s.id, s.name) for s in Student.query.all()]
-    payment_link_form.provider_id.choices = [(p.id, p.name) for p in PaymentProvider.query.filter_by(is_active=True).all()]
+    payment_link_form.provider_id.choices = [(p.id, p.name) for p in providers.values() if p.is_active]
     
     return render_template("payments.html",
-                         vault_provider=vault_provider,
-                         tabby_provider=tabby_provider,
-                         tamara_provider=tamara_provider,
-                         vault_links=vault_links,
-                         tabby_links=tabby_links,
-                         tamara_links=tamara_links,
-                         total_pending=total_pending,
-                         total_paid=total_paid,
-                         total_failed=total_failed,
+                         vault_provider=providers.get('vault'),
+                         tabby_provider=providers.get('tabby'),
+                         tamara_provider=providers.get('tamara'),
+                         vault_page=pages.get('vault', empty_page),
+                         tabby_page=pages.get('tabby', empty_page),
+                         tamara_page=pages.get('tamara', empty_page),
+                         summary=summary,
+                         total_pending=summary['totals']['pending']['count'],
+                         total_paid=summary['totals']['paid']['count'],
+                         total_failed=summary['totals']['failed']['count'],
+                         statuses=PAYMENT_STATUSES,
+                         status_filter=status_filter,
+                         date_from=day_from.isoformat(),
+                         date_to=day_to.isoformat(),
+                         tab=tab,
                          payment_link_form=payment_link_form)
 
 @main.route("/payments/create_link", methods=["POST"])
 @login_required
 def create_payment_link():
     form = PaymentLinkForm()
-    form.lead_id.choices = [(0, "Select Lead")] + [(l.id, l.name) for l in Lead.query.all()]
-    form.student_id.choices = [(0, "Select Student")] + [(s.id, s.name) for s in Student.query.all()]
     form.provider_id.choices = [(p.id, p.name) for p in PaymentProvider.query.filter_by(is_active=True).all()]
     
     if form.validate_on_submit():
@@ -1850,6 +2113,7 @@ def create_payment_link():
             from datetime import timedelta
             expires_at = datetime.now() + timedelta(days=form.expires_in_days.data)
             
+            # Saved as "creating"; the provider is asked in the background (see payment_links.py)
             payment_link = PaymentLink(
                 lead_id=form.lead_id.data if form.lead_id.data > 0 else None,
                 student_id=form.student_id.data if form.student_id.data > 0 else None,
@@ -1858,42 +2122,16 @@ def create_payment_link():
                 currency=form.currency.data,
                 description=form.description.data,
                 payment_reference=payment_reference,
+                status="creating",
                 expires_at=expires_at,
                 created_by_id=current_user.id
             )
             
-            provider = PaymentProvider.query.get(form.provider_id.data)
-            
-            customer_info = None
-            if form.lead_id.data and form.lead_id.data > 0:
-                lead = Lead.query.get(form.lead_id.data)
-                if lead:
-                    customer_info = {
-                        "name": lead.name,
-                        "email": lead.email or "",
-                        "phone": lead.phone or ""
-                    }
-            
-            callback_url = url_for('main.payment_callback', _external=True)
-            api_result = create_payment_link(
-                provider=provider.name.lower(),
-                amount=form.amount.data,
-                currency=form.currency.data,
-                description=form.description.data,
-                customer_info=customer_info,
-                callback_url=callback_url
-            )
-            
-            if api_result.get('success'):
-                payment_link.payment_url = api_result.get('payment_link')
-                payment_link.external_payment_id = api_result.get('payment_id')
-            else:
-                payment_link.payment_url = f"#{provider.name.lower()}_payment_pending"
-            
             db.session.add(payment_link)
             db.session.commit()
+            start_link_creation(payment_link, payment_callback_url(payment_link))
             
-            flash(f"Payment link created successfully! Reference: {payment_reference}", "success")
+            flash(f"Payment link {payment_reference} is being created with the provider.", "success")
             
         except Exception as e:
             db.session.rollback()
@@ -1905,6 +2143,44 @@ def create_payment_link():
     
     return redirect(url_for("main.payments"))
 
+def payment_callback_url(payment_link):
+    """Absolute URL the link's provider reports payments (and returns customers) to"""
+    return url_for('main.payment_callback', provider=payment_link.provider.name.lower(), _external=True)
+
+@main.route("/payments/callback/<provider>", methods=["GET", "POST"])
+def payment_callback(provider):
+    """Provider webhooks (POST) and customers returning from checkout (GET ?status=)"""
+    if request.method == "GET":
+        if request.args.get("status") == "success":
+            message = "Thank you! Your payment has been received and will be confirmed shortly."
+        else:
+            message = "Your payment was not completed. Please contact us if you need a new payment link."
+        return make_response(message, 200, {"Content-Type": "text/plain; charset=utf-8"})
+    
+    # Store the raw event and answer at once; payment_webhooks applies it in the background
+    try:
+        created = record_event(provider, request.get_data(), request.headers)
+    except WebhookError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status_code
+    return jsonify({'success': True, 'duplicate': not created})
+
+@main.route("/api/payments/links/<int:link_id>")
+@login_required
+def payment_link_status(link_id):
+    """Creation state of a payment link, polled by the payments page while it is being created"""
+    payment_link = PaymentLink.query.get_or_404(link_id)
+    return jsonify({'success': True, 'link': link_status_payload(payment_link)})
+
+@main.route("/api/payments/links/<int:link_id>/retry", methods=["POST"])
+@login_required
+def retry_payment_link(link_id):
+    payment_link = PaymentLink.query.get_or_404(link_id)
+    if not can_retry(payment_link):
+        return jsonify({'success': False, 'message': 'Only failed or stuck payment links can be retried'}), 400
+    retry_link_creation(payment_link, payment_callback_url(payment_link))
+    return jsonify({'success': True, 'message': f"Retrying payment link {payment_link.payment_reference}",
+                    'link': link_status_payload(payment_link)})
+
 @main.route("/payments/providers")
 @login_required
 def payment_providers():
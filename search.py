@@ -0,0 +1,159 @@
+"""
+Lead search index for Training Center CRM
+
+SQLite uses an FTS5 trigram table kept in sync with ``lead`` by triggers,
+MySQL uses an ngram FULLTEXT index on the lead table itself.  Both cover
+name, email and the digits-only ``search_phone`` column, so substring and
+partial phone number searches are served by the index instead of a
+leading-wildcard ILIKE scan.
+
+Run this module directly to (re)create and rebuild the index, e.g. after a
+SQLite batch migration has recreated the lead table and dropped its triggers:
+
+    python search.py
+"""
+import re
+
+from sqlalchemy import DDL, column, desc, event, select, table, text
+
+from app import db
+from models import Lead
+
+# Terms shorter than this cannot be served by the trigram/ngram index
+MIN_TERM_LENGTH = 3
+
+lead_fts = table('lead_fts', column('rowid'), column('rank'))
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS lead_fts USING fts5("
+    "name, email, search_phone, content='lead', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS lead_fts_ai AFTER INSERT ON lead BEGIN "
+    "INSERT INTO lead_fts(rowid, name, email, search_phone) "
+    "VALUES (new.id, new.name, new.email, new.search_phone); END",
+    "CREATE TRIGGER IF NOT EXISTS lead_fts_ad AFTER DELETE ON lead BEGIN "
+    "INSERT INTO lead_fts(lead_fts, rowid, name, email, search_phone) "
+    "VALUES ('delete', old.id, old.name, old.email, old.search_phone); END",
+    "CREATE TRIGGER IF NOT EXISTS lead_fts_au AFTER UPDATE OF name, email, search_phone ON lead BEGIN "
+    "INSERT INTO lead_fts(lead_fts, rowid, name, email, search_phone) "
+    "VALUES ('delete', old.id, old.name, old.email, old.search_phone); "
+    "INSERT INTO lead_fts(rowid, name, email, search_phone) "
+    "VALUES (new.id, new.name, new.email, new.search_phone); END",
+]
+
+MYSQL_DDL = [
+    "ALTER TABLE lead ADD FULLTEXT INDEX ft_lead_search (name, email, search_phone) WITH PARSER ngram",
+]
+
+MYSQL_MATCH = "MATCH (lead.name, lead.email, lead.search_phone) AGAINST (:search_query IN BOOLEAN MODE)"
+
+# Create the index alongside the lead table when the schema is built with create_all()
+for _statement in SQLITE_DDL:
+    event.listen(Lead.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in MYSQL_DDL:
+    event.listen(Lead.__table__, 'after_create', DDL(_statement).execute_if(dialect='mysql'))
+
+
+def _dialect_name():
+    return db.session.get_bind().dialect.name
+
+
+def _tokens(term):
+    """Split a search term into index-searchable tokens"""
+    term = (term or '').strip()
+    if re.fullmatch(r'[\d\s+()\-]+', term):
+        # Phone-like input: "+971 50-123" matches the digits-only column as "97150123"
+        digits = re.sub(r'\D', '', term)
+        return [digits] if len(digits) >= MIN_TERM_LENGTH else [], True
+    tokens = [t.replace('"', '') for t in term.split()]
+    return [t for t in tokens if len(t) >= MIN_TERM_LENGTH], False
+
+
+def build_match_expression(term, dialect_name):
+    """Build the FTS5 MATCH / MySQL boolean-mode query string for a term"""
+    tokens, phone_only = _tokens(term)
+    if not tokens:
+        return None
+    if dialect_name == 'sqlite':
+        expression = ' '.join(f'"{t}"' for t in tokens)
+        return f'search_phone : {expression}' if phone_only else expression
+    return ' '.join(f'+"{t}"' for t in tokens)
+
+
+def _ilike_filter(term):
+    return db.or_(
+        Lead.name.ilike(f'%{term}%'),
+        Lead.phone.ilike(f'%{term}%'),
+        Lead.email.ilike(f'%{term}%')
+    )
+
+
+def lead_search_filter(term, dialect_name=None):
+    """Return a filter clause restricting a Lead query to rows matching the term"""
+    dialect_name = dialect_name or _dialect_name()
+    expression = build_match_expression(term, dialect_name)
+    if expression is None or dialect_name not in ('sqlite', 'mysql'):
+        # Too short for the index (or no index on this database): fall back to a scan
+        return _ilike_filter(term)
+
+    if dialect_name == 'sqlite':
+        matches = select(lead_fts.c.rowid).where(
+            text("lead_fts MATCH :search_query").bindparams(search_query=expression)
+        )
+        return Lead.id.in_(matches)
+    return text(MYSQL_MATCH).bindparams(search_query=expression)
+
+
+def ranked_lead_search(query, term, dialect_name=None):
+    """Restrict a Lead query to rows matching the term, best matches first"""
+    dialect_name = dialect_name or _dialect_name()
+    expression = build_match_expression(term, dialect_name)
+    if expression is None or dialect_name not in ('sqlite', 'mysql'):
+        return query.filter(_ilike_filter(term)).order_by(desc(Lead.created_at))
+
+    if dialect_name == 'sqlite':
+        return query.join(lead_fts, lead_fts.c.rowid == Lead.id).filter(
+            text("lead_fts MATCH :search_query").bindparams(search_query=expression)
+        ).order_by(lead_fts.c.rank)
+
+    match = text(MYSQL_MATCH).bindparams(search_query=expression)
+    return query.filter(match).order_by(desc(match))
+
+
+def install_search_index(connection):
+    """Create the search index on an existing database and rebuild its contents"""
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        for statement in SQLITE_DDL:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql("INSERT INTO lead_fts(lead_fts) VALUES ('rebuild')")
+    elif dialect_name == 'mysql':
+        existing = connection.exec_driver_sql(
+            "SHOW INDEX FROM lead WHERE Key_name = 'ft_lead_search'"
+        ).first()
+        if not existing:
+            for statement in MYSQL_DDL:
+                connection.exec_driver_sql(statement)
+
+
+def rebuild_search_index():
+    """Backfill search_phone and rebuild the index for every lead"""
+    from app import app
+
+    with app.app_context():
+        last_id = 0
+        while True:
+            batch = Lead.query.filter(Lead.id > last_id).order_by(Lead.id).limit(1000).all()
+            if not batch:
+                break
+            for lead in batch:
+                lead.refresh_search_phone()
+            last_id = batch[-1].id
+            db.session.commit()
+
+        with db.engine.begin() as connection:
+            install_search_index(connection)
+        print("✓ Lead search index rebuilt")
+
+
+if __name__ == "__main__":
+    rebuild_search_index()
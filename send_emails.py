@@ -0,0 +1,49 @@
+"""
+Send the emails waiting in the outbox
+
+Web workers send queued email in the background as soon as it is queued;
+this sends the retries that fall due and anything a worker restart left
+behind, and finishes bulk message sends whose job stopped.  Run it continuously next to the web workers (a second instance is
+harmless), or once from cron:
+
+    python send_emails.py
+    python send_emails.py --once
+"""
+import argparse
+import time
+
+from app import app
+from bulk_messaging import resume_campaigns
+from email_outbox import EMAIL_SEND_INTERVAL_SECONDS, send_outbox_emails
+
+
+def run_sender(once=False, interval=EMAIL_SEND_INTERVAL_SECONDS):
+    while True:
+        started = time.monotonic()
+        with app.app_context():
+            campaigns = resume_campaigns()
+            stats = send_outbox_emails()
+        elapsed = time.monotonic() - started
+        if campaigns:
+            print(f"✓ Finished {campaigns} interrupted message sends")
+        if stats['sent'] or stats['retried'] or stats['released'] or once:
+            print(f"✓ Sent {stats['sent']} emails in {elapsed:.1f}s, {stats['retried']} to retry"
+                  + (f", {stats['released']} released from a stopped sender" if stats['released'] else ""))
+        if stats['failed']:
+            print(f"✗ {stats['failed']} emails could not be delivered")
+        if once:
+            return stats
+        # The next pass starts `interval` seconds after this one started, or right away if it ran long
+        time.sleep(max(0.0, interval - elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--once', action='store_true', help='Run a single pass and exit')
+    parser.add_argument('--interval', type=float, default=EMAIL_SEND_INTERVAL_SECONDS,
+                        help='Seconds between the starts of passes')
+    args = parser.parse_args()
+    try:
+        run_sender(args.once, args.interval)
+    except KeyboardInterrupt:
+        print("✓ Stopped")
@@ -0,0 +1,131 @@
+"""
+Local SMTP sink for trying out the email outbox
+
+Accepts every message and keeps it in memory instead of delivering it, with
+optional latency and transient failures, and counts connections, so the
+outbox's batching and connection reuse can be checked without a real mail
+server:
+
+    python smtp_sink.py --port 8025 --latency 0.1 --failure-rate 0.1
+
+then start the CRM (and send_emails.py) with the settings it prints.
+Recipients whose address starts with "bounce" are refused for good (550);
+--failure-rate refuses that share of recipients for now (451).
+start_sink() runs the same server in a thread for scripts.
+"""
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+
+class SinkState:
+    """Messages received so far and the simulation settings, shared by the connection threads"""
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.messages = []  # (sender, [recipients], raw message bytes)
+        self.connections = 0
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough of SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP and QUIT"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        state = self.server.state
+        with state.lock:
+            state.connections += 1
+        sender, recipients = None, []
+        self.reply('220 smtp_sink ready')
+        for raw in self.rfile:
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            command = line[:4].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 smtp_sink')
+            elif command == 'MAIL':
+                sender, recipients = line.partition(':')[2].strip(), []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                address = line.partition(':')[2].strip().strip('<>')
+                if address.lower().startswith('bounce'):
+                    self.reply('550 No such user')
+                elif random.random() < state.failure_rate:
+                    self.reply('451 Try again later')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                if not recipients:
+                    self.reply('503 No valid recipients')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data in self.rfile:
+                    if data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                if state.latency:
+                    time.sleep(state.latency)
+                with state.lock:
+                    state.messages.append((sender, recipients, b''.join(lines)))
+                sender, recipients = None, []
+                self.reply('250 OK queued')
+            elif command == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif command == 'NOOP':
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+def sink_config(port, host='127.0.0.1'):
+    """CRM mail settings that send to a sink listening on host:port"""
+    return {
+        'MAIL_SERVER': host, 'MAIL_PORT': port, 'MAIL_USE_TLS': False, 'MAIL_USE_SSL': False,
+        'MAIL_USERNAME': None, 'MAIL_PASSWORD': None, 'MAIL_DEFAULT_SENDER': 'crm@example.com',
+        'MAIL_SUPPRESS_SEND': False,
+    }
+
+
+def make_sink(port=0, latency=0.0, failure_rate=0.0, host='127.0.0.1'):
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer((host, port), SMTPSinkHandler)
+    server.daemon_threads = True
+    server.state = SinkState(latency, failure_rate)
+    return server
+
+
+def start_sink(port=0, latency=0.0, failure_rate=0.0):
+    """Run a sink in a daemon thread; returns (server, port).  Stop it with server.shutdown()"""
+    server = make_sink(port, latency, failure_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every message')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of recipients refused with 451')
+    args = parser.parse_args()
+
+    server = make_sink(args.port, args.latency, args.failure_rate)
+    print(f"✓ SMTP sink listening on 127.0.0.1:{args.port}")
+    for setting, value in sink_config(args.port).items():
+        if setting in ('MAIL_SERVER', 'MAIL_PORT', 'MAIL_USE_TLS', 'MAIL_DEFAULT_SENDER'):
+            print(f"  export {setting}={str(value).lower() if isinstance(value, bool) else value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        state = server.state
+        print(f"✓ Stopped: {len(state.messages)} messages over {state.connections} connections")
@@ -16,9 +16,8 @@ function initializePipelineChart() {
     const ctx = document.getElementById('pipelineChart');
     if (!ctx) return;
 
-    fetch('/api/pipeline/data')
-        .then(response => response.json())
-        .then(data => {
+    fetchIfModified('/api/pipeline/data')
+        .then(({data}) => {
             const statuses = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted'];
             const counts = statuses.map(status => data[status]?.count || 0);
             const values = statuses.map(status => data[status]?.total_value || 0);
@@ -306,9 +305,11 @@ function initializeCourseChart() {
 // Real-time chart updates
 function updateCharts() {
     if (pipelineChart) {
-        fetch('/api/pipeline/data')
-            .then(response => response.json())
-            .then(data => {
+        fetchIfModified('/api/pipeline/data')
+            .then(({data, changed}) => {
+                if (!changed) {
+                    return;
+                }
                 const statuses = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted'];
                 const counts = statuses.map(status => data[status]?.count || 0);
                 
@@ -13,6 +13,7 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeModals();
     initializeCharts();
     initializeFileUploads();
+    initializeLookups();
 });
 
 // Sidebar functionality
@@ -369,6 +370,31 @@ function showNotification(message, type = 'info') {
     }, 5000);
 }
 
+// Conditional polling: remember each URL's ETag and last payload so an
+// unchanged resource comes back as an empty 304
+const conditionalResponses = new Map();
+
+function fetchIfModified(url) {
+    const cached = conditionalResponses.get(url);
+    const headers = cached ? {'If-None-Match': cached.etag} : {};
+    // no-store keeps the browser cache from answering the 304 on our behalf
+    return fetch(url, {headers: headers, cache: 'no-store'}).then(response => {
+        if (response.status === 304 && cached) {
+            return {data: cached.data, changed: false};
+        }
+        if (!response.ok) {
+            throw new Error(`Request failed with status ${response.status}`);
+        }
+        return response.json().then(data => {
+            const etag = response.headers.get('ETag');
+            if (etag) {
+                conditionalResponses.set(url, {etag: etag, data: data});
+            }
+            return {data: data, changed: true};
+        });
+    });
+}
+
 function getCSRFToken() {
     const token = document.querySelector('meta[name="csrf-token"]');
     return token ? token.getAttribute('content') : '';
@@ -471,26 +497,117 @@ function renderCalendar(year, month) {
 
 // Export functionality
 function exportData(format, type) {
-    showLoading();
-    
-    fetch(`/api/export/${type}?format=${format}`)
-        .then(response => response.blob())
-        .then(blob => {
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.style.display = 'none';
-            a.href = url;
-            a.download = `${type}_export.${format}`;
-            document.body.appendChild(a);
-            a.click();
-            window.URL.revokeObjectURL(url);
-            hideLoading();
-            showNotification(`${type} data exported successfully!`, 'success');
-        })
-        .catch(error => {
-            hideLoading();
-            showNotification('Error exporting data: ' + error.message, 'error');
+    // Let the browser download the stream directly instead of buffering it into a blob
+    const params = new URLSearchParams(window.location.search);
+    params.delete('cursor');
+    params.set('format', format);
+    
+    const a = document.createElement('a');
+    a.style.display = 'none';
+    a.href = `/api/export/${type}?${params.toString()}`;
+    a.download = '';
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
+    showNotification(`${type} export started`, 'success');
+}
+
+// Typeahead lookups
+// Selects rendered with data-lookup-url only contain the current value; matching
+// options are fetched from /api/lookup/<type> as the user types in the search box
+function initializeLookups() {
+    document.querySelectorAll('select[data-lookup-url]').forEach(initializeLookup);
+}
+
+function initializeLookup(select) {
+    if (select.dataset.lookupReady) {
+        return;
+    }
+    select.dataset.lookupReady = '1';
+    
+    const container = document.createElement('div');
+    container.className = 'position-relative mt-1';
+    const input = document.createElement('input');
+    input.type = 'search';
+    input.className = 'form-control form-control-sm';
+    input.placeholder = 'Type to search...';
+    input.autocomplete = 'off';
+    const menu = document.createElement('div');
+    menu.className = 'dropdown-menu w-100';
+    container.append(input, menu);
+    (select.closest('.form-floating') || select).after(container);
+    
+    let timer = null;
+    let request = 0;
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            const current = ++request;
+            fetchLookup(select, {q: input.value}).then(results => {
+                if (current === request) {
+                    renderLookupResults(select, input, menu, results);
+                }
+            });
+        }, 250);
+    });
+    input.addEventListener('focus', () => input.dispatchEvent(new Event('input')));
+    input.addEventListener('blur', () => setTimeout(() => menu.classList.remove('show'), 200));
+}
+
+function fetchLookup(select, params) {
+    const url = new URL(select.dataset.lookupUrl, window.location.origin);
+    Object.entries(params).forEach(([key, value]) => url.searchParams.set(key, value));
+    return fetch(url)
+        .then(response => response.json())
+        .then(data => data.success ? data.results : [])
+        .catch(() => []);
+}
+
+function renderLookupResults(select, input, menu, results) {
+    menu.innerHTML = '';
+    if (!results.length) {
+        const empty = document.createElement('span');
+        empty.className = 'dropdown-item-text text-muted';
+        empty.textContent = 'No matches';
+        menu.appendChild(empty);
+    }
+    results.forEach(item => {
+        const option = document.createElement('button');
+        option.type = 'button';
+        option.className = 'dropdown-item';
+        option.textContent = item.text;
+        option.addEventListener('mousedown', e => {
+            e.preventDefault();
+            setLookupOption(select, item);
+            input.value = '';
+            menu.classList.remove('show');
         });
+        menu.appendChild(option);
+    });
+    menu.classList.add('show');
+}
+
+function setLookupOption(select, item) {
+    let option = Array.from(select.options).find(o => o.value === String(item.id));
+    if (!option) {
+        option = new Option(item.text, item.id);
+        select.add(option);
+    }
+    select.value = String(item.id);
+    select.dispatchEvent(new Event('change'));
+}
+
+// Select a value by id, fetching its label when it is not one of the rendered options
+function setLookupValue(select, id) {
+    if (Array.from(select.options).some(o => o.value === String(id))) {
+        select.value = String(id);
+        return Promise.resolve();
+    }
+    return fetchLookup(select, {id: id}).then(results => {
+        if (results.length) {
+            setLookupOption(select, results[0]);
+        }
+    });
 }
 
 // Form validation
@@ -63,12 +63,9 @@ class PipelineManager {
     
     async fetchPipelineData() {
         try {
-            const response = await fetch('/api/pipeline/data');
-            if (response.ok) {
-                const data = await response.json();
-                this.leads = data.leads || [];
-                this.updateLocalStorage();
-            }
+            const {data} = await fetchIfModified('/api/pipeline/data');
+            this.leads = data.leads || [];
+            this.updateLocalStorage();
         } catch (error) {
             console.error('Error fetching pipeline data:', error);
             this.showNotification('Error loading pipeline data', 'error');
@@ -947,9 +944,11 @@ class PipelineManager {
     
     // Auto-refresh functionality
     setupAutoRefresh() {
-        // Refresh pipeline data every 30 seconds
+        // Changes are pushed over /api/events; poll every 30 seconds only while that stream is down
         setInterval(() => {
-            this.refreshPipelineData();
+            if (!window.pipelineEvents || !window.pipelineEvents.connected) {
+                this.refreshPipelineData();
+            }
         }, 30000);
         
         // Set up visibility change listener to refresh when tab becomes visible
@@ -962,22 +961,23 @@ class PipelineManager {
     
     async refreshPipelineData() {
         try {
-            const response = await fetch('/api/pipeline/data');
-            if (response.ok) {
-                const data = await response.json();
-                
-                // Check if data has changed
-                const currentData = JSON.stringify(this.leads);
-                const newData = JSON.stringify(data.leads || []);
+            // A 304 means no lead has changed since the last poll
+            const {data, changed} = await fetchIfModified('/api/pipeline/data');
+            if (!changed) {
+                return;
+            }
+            
+            // Check if data has changed
+            const currentData = JSON.stringify(this.leads);
+            const newData = JSON.stringify(data.leads || []);
+            
+            if (currentData !== newData) {
+                this.leads = data.leads || [];
+                this.renderPipeline();
+                this.updateLocalStorage();
                 
-                if (currentData !== newData) {
-                    this.leads = data.leads || [];
-                    this.renderPipeline();
-                    this.updateLocalStorage();
-                    
-                    // Notify user of updates
-                    this.showNotification('Pipeline updated', 'info');
-                }
+                // Notify user of updates
+                this.showNotification('Pipeline updated', 'info');
             }
         } catch (error) {
             console.error('Error refreshing pipeline data:', error);
@@ -1038,8 +1038,370 @@ class PipelineManager {
     }
 }
 
+// Kanban board rendered by pipeline.html: each column shows its first page of cards
+// and fetches the next page from /api/pipeline/leads when scrolled to the bottom
+class PipelineBoard {
+    constructor() {
+        this.loading = new Set();
+        this.observer = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    this.loadMore(entry.target.parentElement);
+                }
+            });
+        }, {rootMargin: '200px'});
+        document.querySelectorAll('.pipeline-column[data-status] .pipeline-leads').forEach(container => {
+            this.watchColumn(container);
+        });
+    }
+    
+    watchColumn(container) {
+        if (!container.dataset.nextCursor) return;
+        let sentinel = container.querySelector('.pipeline-sentinel');
+        if (!sentinel) {
+            sentinel = document.createElement('div');
+            sentinel.className = 'pipeline-sentinel';
+        }
+        container.appendChild(sentinel);
+        this.observer.observe(sentinel);
+    }
+    
+    async loadMore(container) {
+        const status = container.closest('.pipeline-column').dataset.status;
+        const cursor = container.dataset.nextCursor;
+        if (!cursor || this.loading.has(status)) return;
+        
+        this.loading.add(status);
+        try {
+            const params = new URLSearchParams({status: status, cursor: cursor});
+            const response = await fetch(`/api/pipeline/leads?${params}`);
+            const data = await response.json();
+            if (!data.success) {
+                throw new Error(data.message);
+            }
+            const sentinel = container.querySelector('.pipeline-sentinel');
+            data.leads.forEach(lead => {
+                // Skip cards a live event already placed
+                if (!document.querySelector(`.pipeline-leads [data-lead-id="${lead.id}"]`)) {
+                    container.insertBefore(this.createCard(lead), sentinel);
+                }
+            });
+            container.dataset.nextCursor = data.next_cursor || '';
+            if (!data.next_cursor && sentinel) {
+                this.observer.unobserve(sentinel);
+                sentinel.remove();
+            }
+        } catch (error) {
+            console.error('Error loading pipeline leads:', error);
+            showNotification('Error loading more leads', 'error');
+        } finally {
+            this.loading.delete(status);
+        }
+    }
+    
+    columnContainer(status) {
+        return document.querySelector(`.pipeline-column[data-status="${status}"] .pipeline-leads`);
+    }
+    
+    findCard(leadId) {
+        return document.querySelector(`.pipeline-leads [data-lead-id="${leadId}"]`);
+    }
+    
+    removeCard(leadId) {
+        const card = this.findCard(leadId);
+        if (!card) return;
+        const container = card.parentElement;
+        card.remove();
+        if (!container.querySelector('.lead-card') && !container.dataset.nextCursor) {
+            this.showEmptyState(container);
+        }
+    }
+    
+    placeCard(lead, card = null) {
+        // Newest first, like the server-rendered columns
+        const container = this.columnContainer(lead.status);
+        if (!container) return;
+        this.clearEmptyState(container);
+        if (!card) {
+            card = this.createCard(lead);
+            card.classList.add('fade-in');
+        }
+        container.insertBefore(card, container.firstChild);
+    }
+    
+    clearEmptyState(container) {
+        const emptyState = container.querySelector('.pipeline-empty');
+        if (emptyState) {
+            emptyState.remove();
+        }
+    }
+    
+    showEmptyState(container) {
+        const status = container.closest('.pipeline-column').dataset.status;
+        const emptyState = document.createElement('div');
+        emptyState.className = 'text-center text-muted py-4 pipeline-empty';
+        emptyState.innerHTML = `
+            <i class="fas fa-inbox fa-2x mb-2"></i>
+            <p class="small mb-0">No leads in ${status.toLowerCase()} status</p>
+        `;
+        container.appendChild(emptyState);
+    }
+    
+    createCard(lead) {
+        // Same markup as the cards rendered by pipeline.html
+        const card = document.createElement('div');
+        card.className = 'lead-card';
+        card.dataset.leadId = lead.id;
+        card.draggable = true;
+        const followup = lead.next_followup_date
+            ? new Date(`${lead.next_followup_date}T00:00:00`).toLocaleDateString('en-US', {month: 'short', day: '2-digit'})
+            : null;
+        card.innerHTML = `
+            <div class="d-flex justify-content-between align-items-start mb-2">
+                <h6 class="mb-1">${this.escape(lead.name)}</h6>
+                <div class="dropdown">
+                    <button class="btn btn-sm btn-link" data-bs-toggle="dropdown">
+                        <i class="fas fa-ellipsis-v"></i>
+                    </button>
+                    <ul class="dropdown-menu">
+                        <li><a class="dropdown-item" href="#" onclick="viewLead(${lead.id})">
+                            <i class="fas fa-eye me-2"></i>View Details
+                        </a></li>
+                        <li><a class="dropdown-item" href="#" onclick="editLead(${lead.id})">
+                            <i class="fas fa-edit me-2"></i>Edit
+                        </a></li>
+                        <li><a class="dropdown-item" href="#" onclick="scheduleMeeting(${lead.id})">
+                            <i class="fas fa-calendar me-2"></i>Schedule Meeting
+                        </a></li>
+                        ${lead.status !== 'Converted' ? `
+                        <li><hr class="dropdown-divider"></li>
+                        <li><a class="dropdown-item text-danger" href="#" onclick="deleteLead(${lead.id})">
+                            <i class="fas fa-trash me-2"></i>Delete
+                        </a></li>
+                        ` : ''}
+                    </ul>
+                </div>
+            </div>
+            
+            <div class="small text-muted mb-2">
+                <i class="fas fa-phone me-1"></i>${this.escape(lead.phone)}
+            </div>
+            
+            ${lead.course_name ? `
+            <div class="small mb-2">
+                <span class="badge bg-info">${this.escape(lead.course_name)}</span>
+            </div>
+            ` : ''}
+            
+            ${lead.quoted_amount > 0 ? `
+            <div class="small text-success fw-bold mb-2">
+                <i class="fas fa-dollar-sign me-1"></i>AED ${this.formatAmount(lead.quoted_amount)}
+            </div>
+            ` : ''}
+            
+            ${followup ? `
+            <div class="small text-warning">
+                <i class="fas fa-clock me-1"></i>
+                Follow-up: ${followup}
+            </div>
+            ` : ''}
+            
+            <div class="mt-2 pt-2 border-top">
+                <div class="d-flex gap-1">
+                    <button class="btn btn-sm btn-outline-primary flex-fill" onclick="makeCall('${this.escape(lead.phone)}')" title="Call">
+                        <i class="fas fa-phone"></i>
+                    </button>
+                    ${lead.whatsapp ? `
+                    <button class="btn btn-sm btn-outline-success flex-fill" onclick="openWhatsApp('${this.escape(lead.whatsapp)}')" title="WhatsApp">
+                        <i class="fab fa-whatsapp"></i>
+                    </button>
+                    ` : ''}
+                    ${lead.email ? `
+                    <button class="btn btn-sm btn-outline-info flex-fill" onclick="sendEmail('${this.escape(lead.email)}')" title="Email">
+                        <i class="fas fa-envelope"></i>
+                    </button>
+                    ` : ''}
+                </div>
+            </div>
+        `;
+        if (typeof handleDragStart === 'function') {
+            card.addEventListener('dragstart', handleDragStart);
+            card.addEventListener('dragend', handleDragEnd);
+        }
+        return card;
+    }
+    
+    formatAmount(amount) {
+        return new Intl.NumberFormat('en-US', {maximumFractionDigits: 0}).format(amount || 0);
+    }
+    
+    escape(value) {
+        return String(value || '')
+            .replace(/&/g, "&amp;")
+            .replace(/</g, "&lt;")
+            .replace(/>/g, "&gt;")
+            .replace(/"/g, "&quot;")
+            .replace(/'/g, "&#039;");
+    }
+}
+
+// Live pipeline board: applies lead events from /api/events to the board,
+// moving or updating single cards and adjusting the stage totals instead of re-rendering it
+class PipelineEventStream {
+    constructor(board, url = '/api/events') {
+        this.board = board;
+        this.url = url;
+        this.stages = ['New', 'Contacted', 'Interested', 'Quoted', 'Converted', 'Lost'];
+        this.totals = null;
+        this.seenEvents = new Set();
+        this.connected = false;
+        this.pollTimer = null;
+        this.reconnectTimer = null;
+        this.source = null;
+        this.connect();
+    }
+    
+    connect() {
+        this.source = new EventSource(this.url);
+        this.source.onopen = () => {
+            this.connected = true;
+            this.stopPolling();
+            // Catch up on anything missed while disconnected; deltas are applied on top of these totals
+            this.syncTotals();
+        };
+        this.source.onerror = () => {
+            // EventSource reconnects by itself (with Last-Event-ID); poll the totals meanwhile
+            this.connected = false;
+            this.startPolling();
+            if (this.source.readyState === EventSource.CLOSED) {
+                // Refused, e.g. 503 when the server has no stream to spare: it does not retry by itself
+                this.source.close();
+                clearTimeout(this.reconnectTimer);
+                this.reconnectTimer = setTimeout(() => this.connect(), 60000 + Math.random() * 30000);
+            }
+        };
+        ['lead_created', 'lead_updated', 'lead_deleted'].forEach(type => {
+            this.source.addEventListener(type, event => this.handleLeadEvent(event));
+        });
+        this.source.addEventListener('pipeline_changed', event => this.handlePipelineChanged(event));
+        this.source.addEventListener('resync', () => this.syncTotals(true));
+    }
+    
+    startPolling() {
+        if (!this.pollTimer) {
+            this.pollTimer = setInterval(() => this.syncTotals(), 30000);
+        }
+    }
+    
+    stopPolling() {
+        clearInterval(this.pollTimer);
+        this.pollTimer = null;
+    }
+    
+    firstSeen(event) {
+        // A reconnect can replay an event that was already applied
+        if (this.seenEvents.has(event.lastEventId)) return false;
+        this.seenEvents.add(event.lastEventId);
+        if (this.seenEvents.size > 1000) {
+            this.seenEvents.delete(this.seenEvents.values().next().value);
+        }
+        return true;
+    }
+    
+    async syncTotals(notify = false) {
+        try {
+            const {data} = await fetchIfModified('/api/pipeline/data');
+            this.totals = JSON.parse(JSON.stringify(data));
+            this.renderTotals();
+            if (notify) {
+                showNotification('Pipeline changed while this page was in the background. Reload to see every lead.', 'info');
+            }
+        } catch (error) {
+            console.error('Error loading pipeline totals:', error);
+        }
+    }
+    
+    handleLeadEvent(event) {
+        if (!this.firstSeen(event)) return;
+        const {lead, before, after} = JSON.parse(event.data);
+        
+        if (this.totals) {
+            if (before) this.addToTotals(before.status, -1, -(before.quoted_amount || 0));
+            if (after) this.addToTotals(after.status, 1, after.quoted_amount || 0);
+            this.renderTotals();
+        }
+        
+        this.board.removeCard(lead.id);
+        if (after && this.stages.includes(lead.status)) {
+            this.board.placeCard(lead);
+        }
+    }
+    
+    handlePipelineChanged(event) {
+        if (!this.firstSeen(event)) return;
+        const change = JSON.parse(event.data);
+        
+        (change.lead_ids || []).forEach(leadId => {
+            const card = this.board.findCard(leadId);
+            if (!card) return;
+            if (change.action === 'delete') {
+                this.board.removeCard(leadId);
+            } else if (change.action === 'status' && change.status) {
+                this.board.removeCard(leadId);
+                this.board.placeCard({status: change.status}, card);
+            }
+        });
+        this.syncTotals();
+        
+        if (change.action === 'import') {
+            const leads = change.count ? `${change.count} leads were` : 'Leads were';
+            showNotification(`${leads} imported. Reload to see them on the board.`, 'info');
+        } else if (!change.lead_ids) {
+            // Users who see only their own leads are not told which leads changed
+            showNotification('Leads were changed in bulk. Reload to see the board up to date.', 'info');
+        }
+    }
+    
+    addToTotals(status, count, amount) {
+        if (!status) return;
+        const stage = this.totals[status] || (this.totals[status] = {count: 0, total_value: 0});
+        stage.count += count;
+        stage.total_value += amount;
+    }
+    
+    renderTotals() {
+        let totalLeads = 0;
+        let totalValue = 0;
+        this.stages.forEach(stage => {
+            const {count, total_value} = this.totals[stage] || {count: 0, total_value: 0};
+            totalLeads += count;
+            totalValue += total_value;
+            this.setText(`${stage.toLowerCase()}-count`, count);
+            this.setText(`${stage.toLowerCase()}-value`, `AED ${this.board.formatAmount(total_value)}`);
+        });
+        const converted = (this.totals['Converted'] || {count: 0}).count;
+        this.setText('total-leads', totalLeads);
+        this.setText('conversion-rate', `${totalLeads > 0 ? (converted / totalLeads * 100).toFixed(1) : 0}%`);
+        this.setText('pipeline-value', `AED ${this.board.formatAmount(totalValue)}`);
+        this.setText('avg-deal-size', `AED ${this.board.formatAmount(totalLeads > 0 ? totalValue / totalLeads : 0)}`);
+    }
+    
+    setText(id, text) {
+        const element = document.getElementById(id);
+        if (element) {
+            element.textContent = text;
+        }
+    }
+}
+
 // Initialize Pipeline Manager when DOM is ready
 document.addEventListener('DOMContentLoaded', function() {
+    if (document.querySelector('.pipeline-column[data-status]')) {
+        window.pipelineBoard = new PipelineBoard();
+        if (window.EventSource) {
+            window.pipelineEvents = new PipelineEventStream(window.pipelineBoard);
+        }
+    }
     if (document.querySelector('.pipeline-container')) {
         window.pipelineManager = new PipelineManager();
     }
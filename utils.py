@@ -13,6 +13,13 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+try:
+    import requests
+except ImportError:  # Payment provider calls report that requests is missing
+    requests = None
+
+from payment_gateway import provider_request
+
 logger = logging.getLogger(__name__)
 
 def generate_slug(text):
@@ -41,6 +48,33 @@ def format_phone(phone):
     
     return phone
 
+def normalize_phone(phone, country_code='+971'):
+    """Normalize a phone number to E.164, e.g. "050 123 4567" -> "+971501234567"
+
+    Numbers without an international prefix are treated as national numbers
+    in the given country code; a leading trunk "0" is dropped.
+    """
+    if not phone:
+        return None
+
+    raw = phone.strip()
+    digits = re.sub(r'\D', '', raw)
+    if not digits:
+        return None
+
+    country_digits = re.sub(r'\D', '', country_code or '') or '971'
+
+    if raw.startswith('+'):
+        pass  # Already international
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith('0'):
+        digits = country_digits + digits.lstrip('0')
+    elif not (digits.startswith(country_digits) and len(digits) > len(country_digits) + 7):
+        digits = country_digits + digits
+
+    return f"+{digits}"
+
 def calculate_conversion_rate(total_leads, converted_leads):
     """Calculate conversion rate percentage"""
     if total_leads == 0:
@@ -116,22 +150,14 @@ def get_next_business_day(start_date=None, days_ahead=1):
     return next_day
 
 def send_email(to_email, subject, body, html_body=None):
-    """Send email using configured SMTP settings"""
+    """Queue an email for the background sender (see email_outbox.py); returns whether it was queued"""
     try:
-        from app import mail
-        from flask_mail import Message
+        from email_outbox import queue_email
         
-        msg = Message(
-            subject=subject,
-            recipients=[to_email],
-            body=body,
-            html=html_body
-        )
-        
-        mail.send(msg)
+        queue_email(to_email, subject, body, html_body)
         return True
     except Exception as e:
-        current_app.logger.error(f"Failed to send email: {str(e)}")
+        current_app.logger.error(f"Failed to queue email: {str(e)}")
         return False
 
 def generate_invoice_number():
@@ -347,7 +373,8 @@ class ValidationUtils:
     
 # Payment Provider API Integration
 
-def create_vault_payment_link(amount, currency="AED", description="", customer_info=None, callback_url=None):
+def create_vault_payment_link(amount, currency="AED", description="", customer_info=None, callback_url=None,
+                              idempotency_key=None):
     """
     Create a payment link using Vault Pay API
     Documentation: https://docs.vaultpay.com/api/payment-links
@@ -356,7 +383,7 @@ def create_vault_payment_link(amount, currency="AED", description="", customer_i
         if not requests:
             return {"success": False, "error": "Requests library not available"}
         # Vault Pay API endpoint
-        api_url = "https://api.vaultpay.com/v1/payment-links"
+        api_url = current_app.config.get('VAULT_API_URL', "https://api.vaultpay.com/v1/payment-links")
         
         # API credentials (should be stored in environment variables)
         api_key = current_app.config.get('VAULT_API_KEY')
@@ -394,7 +421,8 @@ def create_vault_payment_link(amount, currency="AED", description="", customer_i
             payment_data["callback_url"] = callback_url
         
         # Make API request
-        response = requests.post(api_url, headers=headers, json=payment_data, timeout=30)
+        response = provider_request('vault', 'POST', api_url, idempotency_key=idempotency_key,
+                                    headers=headers, json=payment_data)
         
         if response.status_code == 200 or response.status_code == 201:
             result = response.json()
@@ -415,7 +443,8 @@ def create_vault_payment_link(amount, currency="AED", description="", customer_i
         logger.error(f"Vault payment link creation error: {str(e)}")
         return {"success": False, "error": "Payment link creation failed"}
 
-def create_tabby_payment_link(amount, currency="AED", description="", customer_info=None, callback_url=None):
+def create_tabby_payment_link(amount, currency="AED", description="", customer_info=None, callback_url=None,
+                              idempotency_key=None):
     """
     Create a payment link using Tabby API
     Documentation: https://docs.tabby.ai/docs/checkout-api
@@ -424,7 +453,7 @@ def create_tabby_payment_link(amount, currency="AED", description="", customer_i
         if not requests:
             return {"success": False, "error": "Requests library not available"}
         # Tabby API endpoint
-        api_url = "https://api.tabby.ai/api/v2/checkout"
+        api_url = current_app.config.get('TABBY_API_URL', "https://api.tabby.ai/api/v2/checkout")
         
         # API credentials
         api_key = current_app.config.get('TABBY_API_KEY')
@@ -487,7 +516,8 @@ def create_tabby_payment_link(amount, currency="AED", description="", customer_i
             }
         
         # Make API request
-        response = requests.post(api_url, headers=headers, json=checkout_data, timeout=30)
+        response = provider_request('tabby', 'POST', api_url, idempotency_key=idempotency_key,
+                                    headers=headers, json=checkout_data)
         
         if response.status_code == 200 or response.status_code == 201:
             result = response.json()
@@ -508,7 +538,8 @@ def create_tabby_payment_link(amount, currency="AED", description="", customer_i
         logger.error(f"Tabby payment link creation error: {str(e)}")
         return {"success": False, "error": "Payment link creation failed"}
 
-def create_tamara_payment_link(amount, currency="AED", description="", customer_info=None, callback_url=None):
+def create_tamara_payment_link(amount, currency="AED", description="", customer_info=None, callback_url=None,
+                               idempotency_key=None):
     """
     Create a payment link using Tamara API
     Documentation: https://docs.tamara.co/docs/api-checkout
@@ -517,7 +548,7 @@ def create_tamara_payment_link(amount, currency="AED", description="", customer_
         if not requests:
             return {"success": False, "error": "Requests library not available"}
         # Tamara API endpoint
-        api_url = "https://api.tamara.co/checkout"
+        api_url = current_app.config.get('TAMARA_API_URL', "https://api.tamara.co/checkout")
         
         # API credentials
         api_token = current_app.config.get('TAMARA_API_TOKEN')
@@ -612,7 +643,8 @@ def create_tamara_payment_link(amount, currency="AED", description="", customer_
             }
         
         # Make API request
-        response = requests.post(api_url, headers=headers, json=checkout_data, timeout=30)
+        response = provider_request('tamara', 'POST', api_url, idempotency_key=idempotency_key,
+                                    headers=headers, json=checkout_data)
         
         if response.status_code == 200 or response.status_code == 201:
             result = response.json()
@@ -633,7 +665,8 @@ def create_tamara_payment_link(amount, currency="AED", description="", customer_
         logger.error(f"Tamara payment link creation error: {str(e)}")
         return {"success": False, "error": "Payment link creation failed"}
 
-def create_payment_link(provider, amount, currency="AED", description="", customer_info=None, callback_url=None):
+def create_payment_link(provider, amount, currency="AED", description="", customer_info=None, callback_url=None,
+                        idempotency_key=None):
     """
     Create a payment link using the specified provider
     
@@ -644,16 +677,17 @@ def create_payment_link(provider, amount, currency="AED", description="", custom
         description (str): Payment description
         customer_info (dict): Customer information (name, email, phone)
         callback_url (str): Callback URL for payment notifications
+        idempotency_key (str): Same key for every attempt at the same link, e.g. its payment reference
     
     Returns:
         dict: Payment link creation result
     """
     if provider.lower() == 'vault':
-        return create_vault_payment_link(amount, currency, description, customer_info, callback_url)
+        return create_vault_payment_link(amount, currency, description, customer_info, callback_url, idempotency_key)
     elif provider.lower() == 'tabby':
-        return create_tabby_payment_link(amount, currency, description, customer_info, callback_url)
+        return create_tabby_payment_link(amount, currency, description, customer_info, callback_url, idempotency_key)
     elif provider.lower() == 'tamara':
-        return create_tamara_payment_link(amount, currency, description, customer_info, callback_url)
+        return create_tamara_payment_link(amount, currency, description, customer_info, callback_url, idempotency_key)
     else:
         return {"success": False, "error": f"Unsupported payment provider: {provider}"}
 
@@ -669,13 +703,16 @@ def verify_payment_status(provider, payment_id):
         dict: Payment status information
     """
     try:
+        if not requests:
+            return {"success": False, "error": "Requests library not available"}
         if provider.lower() == 'vault':
             api_key = current_app.config.get('VAULT_API_KEY')
             if not api_key:
                 return {"success": False, "error": "API key not configured"}
             
             headers = {"Authorization": f"Bearer {api_key}"}
-            response = requests.get(f"https://api.vaultpay.com/v1/payment-links/{payment_id}", headers=headers)
+            api_url = current_app.config.get('VAULT_API_URL', "https://api.vaultpay.com/v1/payment-links")
+            response = provider_request('vault', 'GET', f"{api_url}/{payment_id}", headers=headers)
             
         elif provider.lower() == 'tabby':
             api_key = current_app.config.get('TABBY_API_KEY')
@@ -683,7 +720,8 @@ def verify_payment_status(provider, payment_id):
                 return {"success": False, "error": "API key not configured"}
             
             headers = {"Authorization": f"Bearer {api_key}"}
-            response = requests.get(f"https://api.tabby.ai/api/v2/checkout/{payment_id}", headers=headers)
+            api_url = current_app.config.get('TABBY_API_URL', "https://api.tabby.ai/api/v2/checkout")
+            response = provider_request('tabby', 'GET', f"{api_url}/{payment_id}", headers=headers)
             
         elif provider.lower() == 'tamara':
             api_token = current_app.config.get('TAMARA_API_TOKEN')
@@ -691,7 +729,8 @@ def verify_payment_status(provider, payment_id):
                 return {"success": False, "error": "API token not configured"}
             
             headers = {"Authorization": f"Bearer {api_token}"}
-            response = requests.get(f"https://api.tamara.co/orders/{payment_id}", headers=headers)
+            api_url = current_app.config.get('TAMARA_ORDERS_URL', "https://api.tamara.co/orders")
+            response = provider_request('tamara', 'GET', f"{api_url}/{payment_id}", headers=headers)
         else:
             return {"success": False, "error": f"Unsupported payment provider: {provider}"}
         